@@ -2,8 +2,11 @@ import os
 import logging
 import pika
 import redis
+import redis.asyncio
 from dotenv import load_dotenv
 
+from bot.metrics import AsyncCountingConnection, CountingConnection
+
 
 load_dotenv()
 
@@ -25,13 +28,94 @@ REDIS_PORT = os.getenv("REDIS_PORT")
 REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 
 MANAGER_USER_ID = os.getenv("MANAGER_USER_ID")
+# Above this many orders per minute the manager gets periodic digests
+MANAGER_DIGEST_THRESHOLD = int(os.getenv("MANAGER_DIGEST_THRESHOLD", 10))
+MANAGER_DIGEST_INTERVAL = float(os.getenv("MANAGER_DIGEST_INTERVAL", 60))
+
+# "polling" for local development, "webhook" to run behind a load balancer
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+WEBHOOK_BASE_URL = os.getenv("WEBHOOK_BASE_URL")
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "/webhook")
+WEBHOOK_HOST = os.getenv("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", 8081))
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+WEBHOOK_MAX_CONCURRENCY = int(os.getenv("WEBHOOK_MAX_CONCURRENCY", 100))
+UPDATE_DEDUPE_TTL = int(os.getenv("UPDATE_DEDUPE_TTL", 3600))
+
+# FSM and session records expire in Redis, hot ones are cached in process
+FSM_STATE_TTL = int(os.getenv("FSM_STATE_TTL", 86400))
+FSM_DATA_TTL = int(os.getenv("FSM_DATA_TTL", 86400))
+SESSION_TTL = int(os.getenv("SESSION_TTL", 7 * 86400))
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", 10000))
+SESSION_CACHE_TTL = float(os.getenv("SESSION_CACHE_TTL", 5))
+CART_TTL = int(os.getenv("CART_TTL", 7 * 86400))
+# Items cached in process, invalidated by Redis client tracking; entries
+# expire after ITEM_CACHE_TTL seconds while invalidations are unavailable
+ITEM_CACHE_SIZE = int(os.getenv("ITEM_CACHE_SIZE", 10000))
+ITEM_CACHE_TTL = float(os.getenv("ITEM_CACHE_TTL", 5))
+# Units of limited items are held for a cart this long; expired holds are
+# released and sales written back to the backend every few seconds
+STOCK_HOLD_TTL = int(os.getenv("STOCK_HOLD_TTL", 900))
+STOCK_SWEEP_INTERVAL = float(os.getenv("STOCK_SWEEP_INTERVAL", 5))
+STOCK_FLUSH_INTERVAL = float(os.getenv("STOCK_FLUSH_INTERVAL", 5))
+# Item view and add-to-cart counters are flushed from memory to Redis and
+# rolled up from Redis to the backend; the popularity ranking of the catalog
+# is fetched from the backend (top POPULARITY_RANKING_SIZE items)
+STATS_FLUSH_INTERVAL = float(os.getenv("STATS_FLUSH_INTERVAL", 5))
+STATS_ROLLUP_INTERVAL = float(os.getenv("STATS_ROLLUP_INTERVAL", 60))
+POPULARITY_REFRESH_INTERVAL = float(os.getenv("POPULARITY_REFRESH_INTERVAL", 300))
+POPULARITY_RANKING_SIZE = int(os.getenv("POPULARITY_RANKING_SIZE", 1000))
+# "Also bought" lists are fetched from the backend into Redis, RECS_SHOWN of
+# them are shown on item details
+RECS_REFRESH_INTERVAL = float(os.getenv("RECS_REFRESH_INTERVAL", 60))
+RECS_SHOWN = int(os.getenv("RECS_SHOWN", 3))
+# Seconds between checks of the Redis catalog against the backend, 0 disables
+RECONCILE_INTERVAL = float(os.getenv("RECONCILE_INTERVAL", 300))
+
+# Broadcasts: active campaigns are polled from the backend, recipients are
+# sent in chunks by a pool of workers; the sending replica holds a lease of
+# BROADCAST_LEASE seconds, another one resumes the campaign when it expires
+BROADCAST_POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", 10))
+BROADCAST_CHUNK_SIZE = int(os.getenv("BROADCAST_CHUNK_SIZE", 100))
+BROADCAST_WORKERS = int(os.getenv("BROADCAST_WORKERS", 20))
+BROADCAST_LEASE = int(os.getenv("BROADCAST_LEASE", 60))
+BROADCAST_REPORT_INTERVAL = float(os.getenv("BROADCAST_REPORT_INTERVAL", 5))
+
+# Outbound messages, Telegram allows ~30 msg/s overall and ~1 msg/s per chat
+SEND_GLOBAL_RATE = float(os.getenv("SEND_GLOBAL_RATE", 30))
+SEND_CHAT_RATE = float(os.getenv("SEND_CHAT_RATE", 1))
+SEND_CHAT_BURST = float(os.getenv("SEND_CHAT_BURST", 3))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", 3))
+
+# Updates handled at once, seconds one update may take, queued updates per user
+UPDATE_MAX_CONCURRENCY = int(os.getenv("UPDATE_MAX_CONCURRENCY", 100))
+UPDATE_TIMEOUT = float(os.getenv("UPDATE_TIMEOUT", 30))
+UPDATE_MAX_PENDING_PER_USER = int(os.getenv("UPDATE_MAX_PENDING_PER_USER", 10))
+
+# Seconds Telegram may cache inline search answers on its side
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", 30))
+
+# Metrics endpoint, local only, 0 disables it
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", 9101))
+SLOW_UPDATE_MS = float(os.getenv("SLOW_UPDATE_MS", 500))
+
+# Sampling profiler behind the metrics endpoint (GET /debug/profile), and
+# logging of callbacks blocking the event loop longer than the threshold
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 100))
 
 
 class RabbitMQClient:
+    """
+    Blocking RabbitMQ connection, opened lazily by `ensure_connection` in the
+    thread that uses it (pika connections are not thread-safe).
+    """
+
     def __init__(self):
         self.connection = None
         self.channel = None
-        self.connect()
 
     def connect(self):
         try:
@@ -53,6 +137,8 @@ class RabbitMQClient:
         if not self.connection or self.connection.is_closed:
             logger.warning("RabbitMQ connection closed, reconnecting...")
             self.connect()
+            if self.connection is None:
+                raise ConnectionError("RabbitMQ is not available")
         if not self.channel or self.channel.is_closed:
             logger.warning("RabbitMQ channel closed, recreating...")
             self.channel = self.connection.channel()
@@ -62,10 +148,28 @@ class RabbitMQClient:
 
 
 def get_redis_client():
-    return redis.Redis(
-        host=REDIS_HOST, port=REDIS_PORT, password=REDIS_PASSWORD, decode_responses=True
+    # Counting connections feed the per-update Redis command metrics
+    pool = redis.ConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        decode_responses=True,
+        connection_class=CountingConnection,
+    )
+    return redis.Redis(connection_pool=pool)
+
+
+def get_async_redis_client():
+    pool = redis.asyncio.ConnectionPool(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        decode_responses=True,
+        connection_class=AsyncCountingConnection,
     )
+    return redis.asyncio.Redis(connection_pool=pool)
 
 
+# Neither client connects on import, connections are opened on first use
 rabbitmq_client = RabbitMQClient()
 redis_client = get_redis_client()
@@ -0,0 +1,93 @@
+import json
+from typing import Dict, List
+
+import redis
+
+from bot import config
+from bot.db.keys import cart_key
+
+
+class CartEngine:
+    """
+    User carts stored as Redis hashes: `cart:{user_id}` maps an item id to a
+    JSON entry with the item snapshot taken when it was first added
+    (id, name, price) and its quantity.
+
+    Every access slides the cart TTL, so abandoned carts expire on their own.
+    Reading a cart and checking it out take one round trip each, and checkout
+    reads and deletes the cart in one server-side script, so concurrent
+    checkouts of the same cart cannot both get the items.
+    """
+
+    # KEYS[1] - cart key; ARGV - item id, snapshot JSON, quantity, TTL
+    ADD_SCRIPT = """
+    local raw = redis.call('HGET', KEYS[1], ARGV[1])
+    local entry
+    if raw then
+        entry = cjson.decode(raw)
+        entry['qty'] = entry['qty'] + tonumber(ARGV[3])
+    else
+        entry = cjson.decode(ARGV[2])
+        entry['qty'] = tonumber(ARGV[3])
+    end
+    redis.call('HSET', KEYS[1], ARGV[1], cjson.encode(entry))
+    redis.call('EXPIRE', KEYS[1], ARGV[4])
+    return entry['qty']
+    """
+
+    # KEYS[1] - cart key
+    CHECKOUT_SCRIPT = """
+    local entries = redis.call('HVALS', KEYS[1])
+    redis.call('DEL', KEYS[1])
+    return entries
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: int = config.CART_TTL):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._add = redis_client.register_script(self.ADD_SCRIPT)
+        self._checkout = redis_client.register_script(self.CHECKOUT_SCRIPT)
+
+    def add(self, user_id: int, item: Dict, qty: int = 1) -> int:
+        """Adds `qty` of the item to the cart, returns the new quantity."""
+        snapshot = {"id": item["id"], "name": item["name"], "price": item["price"]}
+        return int(
+            self._add(
+                keys=[cart_key(user_id)],
+                args=[item["id"], json.dumps(snapshot), qty, self.ttl],
+            )
+        )
+
+    def get_items(self, user_id: int) -> List[Dict]:
+        key = cart_key(user_id)
+        pipeline = self.redis_client.pipeline(transaction=False)
+        pipeline.hvals(key)
+        pipeline.expire(key, self.ttl)
+        entries, _ = pipeline.execute()
+        return [json.loads(entry) for entry in entries]
+
+    def contains(self, user_id: int, item_id: int) -> bool:
+        return bool(self.redis_client.hexists(cart_key(user_id), str(item_id)))
+
+    def remove(self, user_id: int, item_id: int):
+        self.redis_client.hdel(cart_key(user_id), str(item_id))
+
+    def clear(self, user_id: int):
+        self.redis_client.delete(cart_key(user_id))
+
+    def checkout(self, user_id: int) -> List[Dict]:
+        """Atomically takes all entries out of the cart."""
+        entries = self._checkout(keys=[cart_key(user_id)])
+        return [json.loads(entry) for entry in entries]
+
+    def restore(self, user_id: int, entries: List[Dict]):
+        """Puts entries taken by `checkout` back, e.g. when the order failed."""
+        if not entries:
+            return
+        key = cart_key(user_id)
+        pipeline = self.redis_client.pipeline()
+        pipeline.hset(
+            key, mapping={str(entry["id"]): json.dumps(entry) for entry in entries}
+        )
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
@@ -0,0 +1,137 @@
+"""
+Per-bucket digests of the catalog in Redis, compared with the same digests
+computed by the backend in SQL to find and repair drift.
+
+Items are put in `item_id % buckets` buckets. A row hash is the first 32
+bits of the MD5 of `id, name, description, price in cents` joined by the
+unit separator, and a bucket digest is the number of items and the sum of
+their row hashes. The backend computes the digests with one aggregate query
+(`GET /items/digests`); the bot keeps them up to date in Redis on every item
+write, so comparing costs one read of `buckets` numbers on each side and
+only buckets that differ are fetched (`GET /items/?bucket=`).
+"""
+
+import hashlib
+from dataclasses import asdict, dataclass, field
+from typing import Dict, Iterable, List, Tuple
+
+import redis
+
+from bot.db.keys import CATALOG_DIGESTS_KEY, catalog_rows_key
+
+DIGEST_BUCKETS = 1024
+
+# (number of items, sum of row hashes)
+Digest = Tuple[int, int]
+
+
+def row_hash(item: Dict) -> int:
+    row = "\x1f".join(
+        (
+            str(item["id"]),
+            item["name"],
+            item.get("description") or "",
+            str(round(float(item["price"]) * 100)),
+        )
+    )
+    return int(hashlib.md5(row.encode()).hexdigest()[:8], 16)
+
+
+@dataclass
+class ReconcileReport:
+    # Catalog sequence compared at, buckets that differed, item ids repaired
+    seq: int | None = None
+    differing: List[int] = field(default_factory=list)
+    updated: List[int] = field(default_factory=list)
+    deleted: List[int] = field(default_factory=list)
+    # Why the run stopped early, None if it completed
+    skipped: str | None = None
+
+    def as_dict(self) -> Dict:
+        return asdict(self)
+
+
+class CatalogDigests:
+    """
+    Bucket digests (`catalog:digests`, fields `{bucket}:n` and `{bucket}:s`)
+    and the row hashes they are made of (`catalog:rows:{bucket}`), updated
+    by a script queued in the same pipeline as the item write.
+    """
+
+    # KEYS[1] - digests hash, KEYS[2] - rows hash of the bucket
+    # ARGV - item id, bucket, new row hash ('' when the item is deleted)
+    UPDATE_SCRIPT = """
+    local old = redis.call('HGET', KEYS[2], ARGV[1])
+    if old then
+        redis.call('HINCRBY', KEYS[1], ARGV[2] .. ':n', -1)
+        redis.call('HINCRBY', KEYS[1], ARGV[2] .. ':s', -tonumber(old))
+    end
+    if ARGV[3] == '' then
+        redis.call('HDEL', KEYS[2], ARGV[1])
+    else
+        redis.call('HSET', KEYS[2], ARGV[1], ARGV[3])
+        redis.call('HINCRBY', KEYS[1], ARGV[2] .. ':n', 1)
+        redis.call('HINCRBY', KEYS[1], ARGV[2] .. ':s', ARGV[3])
+    end
+    return 1
+    """
+
+    def __init__(self, redis_client: redis.Redis, buckets: int = DIGEST_BUCKETS):
+        self.redis_client = redis_client
+        self.buckets = buckets
+        self._update = redis_client.register_script(self.UPDATE_SCRIPT)
+
+    def bucket(self, item_id: int) -> int:
+        return item_id % self.buckets
+
+    def update(self, item_id: int, item: Dict | None, pipeline: redis.client.Pipeline):
+        """Queues the digest change of an item write, `item` is None on delete."""
+        bucket = self.bucket(item_id)
+        self._update(
+            keys=[CATALOG_DIGESTS_KEY, catalog_rows_key(bucket)],
+            args=[item_id, bucket, "" if item is None else row_hash(item)],
+            client=pipeline,
+        )
+
+    def rebuild(self, items: Iterable[Dict], pipeline: redis.client.Pipeline):
+        """Queues replacing all digests with the ones of `items`."""
+        rows: Dict[int, Dict[int, int]] = {}
+        for item in items:
+            rows.setdefault(self.bucket(item["id"]), {})[item["id"]] = row_hash(item)
+        pipeline.delete(
+            CATALOG_DIGESTS_KEY,
+            *(catalog_rows_key(bucket) for bucket in range(self.buckets)),
+        )
+        digests = {}
+        for bucket, hashes in rows.items():
+            pipeline.hset(catalog_rows_key(bucket), mapping=hashes)
+            digests[f"{bucket}:n"] = len(hashes)
+            digests[f"{bucket}:s"] = sum(hashes.values())
+        if digests:
+            pipeline.hset(CATALOG_DIGESTS_KEY, mapping=digests)
+
+    def exists(self) -> bool:
+        return bool(self.redis_client.exists(CATALOG_DIGESTS_KEY))
+
+    def digests(self) -> Dict[int, Digest]:
+        """Digests of the non-empty buckets."""
+        fields = self.redis_client.hgetall(CATALOG_DIGESTS_KEY)
+        digests = {}
+        for bucket in {int(name.split(":")[0]) for name in fields}:
+            count = int(fields.get(f"{bucket}:n", 0))
+            if count:
+                digests[bucket] = (count, int(fields.get(f"{bucket}:s", 0)))
+        return digests
+
+    def rows(self, bucket: int) -> Dict[int, int]:
+        """Row hashes of the items in a bucket, by item id."""
+        rows = self.redis_client.hgetall(catalog_rows_key(bucket))
+        return {int(item_id): int(value) for item_id, value in rows.items()}
+
+    @staticmethod
+    def differing(local: Dict[int, Digest], remote: Dict[int, Digest]) -> List[int]:
+        return sorted(
+            bucket
+            for bucket in local.keys() | remote.keys()
+            if local.get(bucket) != remote.get(bucket)
+        )
@@ -0,0 +1,173 @@
+import logging
+import threading
+from typing import Callable, Dict, Iterable
+
+import redis
+
+from bot import config
+from bot.db.cache import LRUCache
+from bot.db.keys import ITEM_PREFIX
+
+logger = logging.getLogger("bot")
+
+INVALIDATE_CHANNEL = "__redis__:invalidate"
+
+_MISSING = object()
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class ItemCache:
+    """
+    Process-local cache of catalog items (`item:{id}` records), kept coherent
+    by Redis server-assisted client-side caching.
+
+    A dedicated connection turns on `CLIENT TRACKING` in broadcast mode for
+    the `item:` prefix and subscribes to the invalidation channel, so Redis
+    pushes the name of every item key written by anyone (this replica, other
+    replicas, a catalog reload) and the entry is dropped. Entries are held
+    until invalidated or evicted by the LRU; while the tracking connection is
+    down they expire after `fallback_ttl` seconds instead.
+
+    A key invalidated while it is being loaded is not cached, so a load
+    racing with a write cannot leave a stale entry behind.
+    """
+
+    RECONNECT_DELAY = 5
+    READ_TIMEOUT = 1
+
+    def __init__(
+        self,
+        cache_size: int = config.ITEM_CACHE_SIZE,
+        fallback_ttl: float = config.ITEM_CACHE_TTL,
+    ):
+        self.fallback_ttl = fallback_ttl
+        self.tracking = False
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._cache = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        # item_id -> token of the load in flight, dropped on invalidation
+        self._loading: Dict[int, object] = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def get(self, item_id: int, load: Callable[[int], Dict | None]) -> Dict | None:
+        item = self._cache.get(item_id, _MISSING)
+        if item is not _MISSING:
+            self.hits += 1
+            return item
+        self.misses += 1
+        token = object()
+        with self._lock:
+            self._loading[item_id] = token
+        item = load(item_id)
+        with self._lock:
+            if self._loading.get(item_id) is token:
+                del self._loading[item_id]
+                ttl = None if self.tracking else self.fallback_ttl
+                self._cache.set(item_id, item, ttl=ttl)
+        return item
+
+    def invalidate(self, item_ids: Iterable[int] | None = None):
+        """Drops the given items, or everything when `item_ids` is None."""
+        with self._lock:
+            if item_ids is None:
+                self._cache.clear()
+                self._loading.clear()
+                self.invalidations += 1
+                return
+            for item_id in item_ids:
+                self._cache.pop(item_id)
+                self._loading.pop(item_id, None)
+                self.invalidations += 1
+
+    def _invalidate_keys(self, redis_keys: Iterable[str] | None):
+        if redis_keys is None:
+            # Sent on FLUSHALL/FLUSHDB and when tracking is reset
+            self.invalidate()
+            return
+        item_ids = []
+        for key in redis_keys:
+            try:
+                item_ids.append(int(key.removeprefix(ITEM_PREFIX)))
+            except ValueError:
+                continue
+        self.invalidate(item_ids)
+
+    # ---------- Invalidation listener ---------- #
+    def start(self, redis_client: redis.Redis):
+        """Starts listening for invalidations in a background thread."""
+        self._stopped.clear()
+        self._thread = threading.Thread(
+            target=self._listen, args=(redis_client,), daemon=True
+        )
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+
+    def _listen(self, redis_client: redis.Redis):
+        pool = redis_client.connection_pool
+        while not self._stopped.is_set():
+            # Not a pool connection: tracking lives and dies with it
+            connection = pool.connection_class(**pool.connection_kwargs)
+            try:
+                self._subscribe(connection)
+                logger.info("Item cache is tracking item keys in Redis")
+                while not self._stopped.is_set():
+                    if connection.can_read(timeout=self.READ_TIMEOUT):
+                        self._handle(connection.read_response())
+            except (redis.RedisError, OSError) as e:
+                logger.error(f"Item cache invalidation listener failed: {e}")
+            finally:
+                if self.tracking:
+                    self.tracking = False
+                    # Writes may be missed until tracking is back
+                    self.invalidate()
+                connection.disconnect()
+            self._stopped.wait(self.RECONNECT_DELAY)
+
+    def _subscribe(self, connection: redis.Connection):
+        connection.connect()
+        connection.send_command("CLIENT", "ID")
+        client_id = connection.read_response()
+        # Broadcast mode: invalidations for every key with the prefix, sent
+        # to this same connection once it is subscribed (RESP2 redirect)
+        connection.send_command(
+            "CLIENT",
+            "TRACKING",
+            "ON",
+            "REDIRECT",
+            client_id,
+            "BCAST",
+            "PREFIX",
+            ITEM_PREFIX,
+        )
+        connection.read_response()
+        connection.send_command("SUBSCRIBE", INVALIDATE_CHANNEL)
+        # Invalidations may already arrive ahead of the confirmation
+        while _text(connection.read_response()[0]) != "subscribe":
+            continue
+        # Entries cached before tracking started may already be stale
+        self.invalidate()
+        self.tracking = True
+
+    def _handle(self, message):
+        kind, channel, data = message[:3]
+        if _text(kind) != "message" or _text(channel) != INVALIDATE_CHANNEL:
+            return
+        self._invalidate_keys(None if data is None else [_text(key) for key in data])
+
+    def samples(self) -> Dict[str, float]:
+        """Cache stats as metrics samples, see `HandlerMetrics.add_collector`."""
+        return {
+            "bot_item_cache_hits_total": self.hits,
+            "bot_item_cache_misses_total": self.misses,
+            "bot_item_cache_invalidations_total": self.invalidations,
+            "bot_item_cache_size": len(self._cache),
+            "bot_item_cache_tracking": int(self.tracking),
+        }
@@ -0,0 +1,77 @@
+"""
+Redis key schema shared by every store of the bot.
+
+All per-user records are keyed by the Telegram user id, so carts, sessions
+and FSM records of one user can be found (and expired) together:
+
+    item:{item_id}                        catalog item JSON
+    catalog:seq                           catalog sequence the items are at
+    catalog:digests, catalog:rows:{n}     catalog bucket digests and row hashes
+    catalog:recs, catalog:recs:version    items bought together with each item
+    cart:{user_id}                        user cart
+    stock:{item_id}                       units available of a limited item
+    hold:{user_id}                        units held for the user's cart
+    stock:holds                           hold expiry times ("{user_id}:{item_id}")
+    stock:sold, stock:flushing            sales not written back to Postgres yet
+    stats:views, stats:adds, stats:rollup item counters not rolled up to Postgres yet
+    stats:viewers:{item_id}               HyperLogLog of the item's viewers
+    session:{user_id}                     user session hash
+    users                                 broadcast recipients (scored by user id)
+    broadcast:{id}, broadcast:{id}:lock   broadcast progress and the lease of its sender
+    fsm:{bot_id}:{chat_id}:{user_id}:*    aiogram FSM state and data
+    update:{update_id}                    webhook update dedupe claim
+"""
+
+FSM_PREFIX = "fsm"
+ITEM_PREFIX = "item:"
+CATALOG_SEQ_KEY = "catalog:seq"
+CATALOG_DIGESTS_KEY = "catalog:digests"
+RECS_KEY = "catalog:recs"
+RECS_VERSION_KEY = "catalog:recs:version"
+STOCK_HOLDS_KEY = "stock:holds"
+STOCK_SOLD_KEY = "stock:sold"
+STOCK_FLUSHING_KEY = "stock:flushing"
+STATS_VIEWS_KEY = "stats:views"
+STATS_ADDS_KEY = "stats:adds"
+STATS_ROLLUP_KEY = "stats:rollup"
+USERS_KEY = "users"
+
+
+def item_key(item_id: int) -> str:
+    return f"{ITEM_PREFIX}{item_id}"
+
+
+def catalog_rows_key(bucket: int) -> str:
+    return f"catalog:rows:{bucket}"
+
+
+def cart_key(user_id: int) -> str:
+    return f"cart:{user_id}"
+
+
+def stock_key(item_id: int) -> str:
+    return f"stock:{item_id}"
+
+
+def hold_key(user_id: int) -> str:
+    return f"hold:{user_id}"
+
+
+def item_viewers_key(item_id: int) -> str:
+    return f"stats:viewers:{item_id}"
+
+
+def session_key(user_id: int) -> str:
+    return f"session:{user_id}"
+
+
+def broadcast_key(broadcast_id: int) -> str:
+    return f"broadcast:{broadcast_id}"
+
+
+def broadcast_lock_key(broadcast_id: int) -> str:
+    return f"broadcast:{broadcast_id}:lock"
+
+
+def update_key(update_id: int) -> str:
+    return f"update:{update_id}"
@@ -1,4 +1,4 @@
-from typing import Dict
+from typing import Dict, Literal
 from pydantic import BaseModel
 
 
@@ -16,13 +16,21 @@ class Item(BaseModel):
     description: str | None
 
 
-class ItemDeleteMessage(BaseModel):
-    channel: str
-    id: int
-
-
 class ItemUpdateMessage(BaseModel):
     id: int
     name: str
     price: float | int
     description: str | None
+    # Units on hand, None if not limited; the change made by an admin edit
+    stock: int | None = None
+    stock_delta: int | None = None
+
+
+class CatalogEvent(BaseModel):
+    """Versioned catalog change envelope published by the admin."""
+
+    v: int
+    seq: int
+    op: Literal["upsert", "delete", "reload"]
+    id: int | None = None
+    item: ItemUpdateMessage | None = None
@@ -0,0 +1,97 @@
+from typing import Any, Dict
+
+import redis
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+from bot import config
+from bot.db.cache import LRUCache
+from bot.db.keys import session_key
+
+_MISSING = object()
+
+
+class CachedStorage(BaseStorage):
+    """
+    FSM storage that serves hot records from a bounded in-process LRU and keeps
+    the actual records in another storage (Redis).
+
+    Writes go through to the wrapped storage. Cached entries live only
+    `cache_ttl` seconds, because another replica may update the same record.
+    """
+
+    def __init__(self, storage: BaseStorage, cache_size: int, cache_ttl: float):
+        self.storage = storage
+        self._states = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+        self._data = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self.storage.set_state(key, state)
+        self._states.set(key, state.state if isinstance(state, State) else state)
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        state = self._states.get(key, _MISSING)
+        if state is _MISSING:
+            state = await self.storage.get_state(key)
+            self._states.set(key, state)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        await self.storage.set_data(key, data)
+        self._data.set(key, data.copy())
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        data = self._data.get(key, _MISSING)
+        if data is _MISSING:
+            data = await self.storage.get_data(key)
+            self._data.set(key, data)
+        return data.copy()
+
+    async def close(self) -> None:
+        self._states.clear()
+        self._data.clear()
+        await self.storage.close()
+
+
+class SessionStore:
+    """
+    Per-user session records kept in Redis hashes (`session:{user_id}`).
+
+    Every write refreshes the TTL, so sessions of inactive users expire in
+    Redis on their own, and only a bounded number of hot sessions is kept in
+    process memory.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        ttl: int = config.SESSION_TTL,
+        cache_size: int = config.SESSION_CACHE_SIZE,
+        cache_ttl: float = config.SESSION_CACHE_TTL,
+    ):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self._cache = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def get(self, user_id: int) -> Dict[str, str]:
+        session = self._cache.get(user_id)
+        if session is None:
+            session = self.redis_client.hgetall(session_key(user_id))
+            self._cache.set(user_id, session)
+        return dict(session)
+
+    def update(self, user_id: int, **fields: Any):
+        """Stores session fields (None values are skipped) and refreshes the TTL."""
+        mapping = {name: value for name, value in fields.items() if value is not None}
+        key = session_key(user_id)
+        pipeline = self.redis_client.pipeline()
+        if mapping:
+            pipeline.hset(key, mapping=mapping)
+        pipeline.expire(key, self.ttl)
+        pipeline.execute()
+        # Drop instead of merging: Redis may hold fields written by another replica
+        self._cache.pop(user_id)
+
+    def delete(self, user_id: int):
+        self.redis_client.delete(session_key(user_id))
+        self._cache.pop(user_id)
@@ -0,0 +1,133 @@
+import threading
+import uuid
+from collections import Counter, defaultdict
+from typing import Dict, Set, Tuple
+
+import redis
+
+from bot.db.keys import (
+    STATS_ADDS_KEY,
+    STATS_ROLLUP_KEY,
+    STATS_VIEWS_KEY,
+    item_viewers_key,
+)
+
+
+class ItemStats:
+    """
+    Counters of item views and add-to-cart taps.
+
+    Events are counted in process and `flush` sends them to Redis as one
+    pipeline of increments (`stats:views`, `stats:adds`) plus the viewers of
+    every item to a HyperLogLog (`stats:viewers:{item_id}`, about 12 KB per
+    item however many users), so handlers never wait for Redis. Counters in
+    Redis are shared by all replicas and rolled up to Postgres in batches,
+    the same way as the sales of `StockEngine`.
+    """
+
+    # KEYS[1] - views hash, KEYS[2] - adds hash, KEYS[3] - roll-up hash
+    # ARGV[1] - id of a new batch
+    TAKE_ROLLUP_SCRIPT = """
+    if redis.call('EXISTS', KEYS[3]) == 0 then
+        local views = redis.call('HGETALL', KEYS[1])
+        local adds = redis.call('HGETALL', KEYS[2])
+        if #views == 0 and #adds == 0 then
+            return {}
+        end
+        for i = 1, #views, 2 do
+            redis.call('HSET', KEYS[3], 'v:' .. views[i], views[i + 1])
+        end
+        for i = 1, #adds, 2 do
+            redis.call('HSET', KEYS[3], 'a:' .. adds[i], adds[i + 1])
+        end
+        redis.call('DEL', KEYS[1], KEYS[2])
+        redis.call('HSET', KEYS[3], '_batch', ARGV[1])
+    end
+    return redis.call('HGETALL', KEYS[3])
+    """
+
+    # KEYS[1] - roll-up hash; ARGV[1] - batch id
+    ACK_ROLLUP_SCRIPT = """
+    if redis.call('HGET', KEYS[1], '_batch') == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    return 1
+    """
+
+    def __init__(self, redis_client: redis.Redis):
+        self.redis_client = redis_client
+        self._lock = threading.Lock()
+        self._views: Counter = Counter()
+        self._adds: Counter = Counter()
+        self._viewers: Dict[int, Set[int]] = defaultdict(set)
+        self._take_rollup = redis_client.register_script(self.TAKE_ROLLUP_SCRIPT)
+        self._ack_rollup = redis_client.register_script(self.ACK_ROLLUP_SCRIPT)
+
+    def record_view(self, item_id: int, user_id: int):
+        with self._lock:
+            self._views[item_id] += 1
+            self._viewers[item_id].add(user_id)
+
+    def record_add(self, item_id: int, qty: int = 1):
+        with self._lock:
+            self._adds[item_id] += qty
+
+    def flush(self) -> int:
+        """
+        Sends the events counted since the last flush to Redis, returns how
+        many. Events of a failed flush are kept for the next one.
+        """
+        with self._lock:
+            views, adds, viewers = self._views, self._adds, self._viewers
+            self._views, self._adds = Counter(), Counter()
+            self._viewers = defaultdict(set)
+        if not views and not adds:
+            return 0
+        pipeline = self.redis_client.pipeline()
+        for item_id, count in views.items():
+            pipeline.hincrby(STATS_VIEWS_KEY, item_id, count)
+        for item_id, count in adds.items():
+            pipeline.hincrby(STATS_ADDS_KEY, item_id, count)
+        for item_id, user_ids in viewers.items():
+            pipeline.pfadd(item_viewers_key(item_id), *user_ids)
+        try:
+            pipeline.execute()
+        except redis.RedisError:
+            with self._lock:
+                self._views.update(views)
+                self._adds.update(adds)
+                for item_id, user_ids in viewers.items():
+                    self._viewers[item_id] |= user_ids
+            raise
+        return sum(views.values()) + sum(adds.values())
+
+    def take_rollup(self) -> Tuple[str, Dict[str, Dict[int, int]]] | None:
+        """
+        Counters to roll up to Postgres as (batch id, {"views": {item_id: n},
+        "adds": {item_id: n}, "viewers": {item_id: unique viewers}}), None if
+        there are none. Views and adds are increments since the last batch,
+        viewers are HyperLogLog estimates of all time. A batch that was not
+        acknowledged is handed out again, with the same id.
+        """
+        fields = self._take_rollup(
+            keys=[STATS_VIEWS_KEY, STATS_ADDS_KEY, STATS_ROLLUP_KEY],
+            args=[uuid.uuid4().hex],
+        )
+        if not fields:
+            return None
+        batch = dict(zip(fields[::2], fields[1::2]))
+        batch_id = batch.pop("_batch")
+        counts = {"views": {}, "adds": {}}
+        for name, value in batch.items():
+            kind, item_id = name.split(":")
+            counts["views" if kind == "v" else "adds"][int(item_id)] = int(value)
+        item_ids = list(counts["views"])
+        pipeline = self.redis_client.pipeline()
+        for item_id in item_ids:
+            pipeline.pfcount(item_viewers_key(item_id))
+        counts["viewers"] = dict(zip(item_ids, pipeline.execute()))
+        return batch_id, counts
+
+    def ack_rollup(self, batch_id: str):
+        """Drops a batch of `take_rollup` once the backend applied it."""
+        self._ack_rollup(keys=[STATS_ROLLUP_KEY], args=[batch_id])
@@ -0,0 +1,351 @@
+import time
+import uuid
+from typing import Dict, Iterable, List, Tuple
+
+import redis
+
+from bot import config
+from bot.db.keys import (
+    STOCK_FLUSHING_KEY,
+    STOCK_HOLDS_KEY,
+    STOCK_SOLD_KEY,
+    hold_key,
+    stock_key,
+)
+
+
+class OutOfStock(Exception):
+    """Not enough units of `item_ids` left, `available` is set for one item."""
+
+    def __init__(self, item_ids: List[int], available: int | None = None):
+        super().__init__(f"Not enough stock of items {item_ids}")
+        self.item_ids = item_ids
+        self.available = available
+
+
+class StockEngine:
+    """
+    Stock of limited items in Redis, so reserving never touches Postgres.
+
+    `stock:{item_id}` holds the units still available for new holds (field
+    `avail`) and the catalog sequence of the last stock change applied to it
+    (field `seq`); items without `avail` are not limited. Adding to the cart
+    moves units from `avail` to the user's hold (`hold:{user_id}`), which
+    expires after `hold_ttl` seconds unless checked out; expiry times are
+    kept in the `stock:holds` sorted set and `release_expired` gives expired
+    holds back. Checkout turns holds into sales counted in `stock:sold`,
+    which are written back to Postgres in batches (`take_sold`/`ack_sold`).
+
+    Admin stock edits arrive as catalog events carrying the change made
+    (`stock_delta`) and are applied once per sequence number, however many
+    replicas receive them. Every change is one server-side script.
+    """
+
+    # KEYS[1] - stock key, KEYS[2] - sold hash, KEYS[3] - flushing hash
+    # ARGV - item id, catalog seq ('' if unknown), stock ('' if not limited),
+    # stock delta ('' if unknown)
+    APPLY_SCRIPT = """
+    local seq = tonumber(ARGV[2])
+    if seq then
+        local applied = tonumber(redis.call('HGET', KEYS[1], 'seq'))
+        if applied and applied >= seq then
+            return 0
+        end
+        redis.call('HSET', KEYS[1], 'seq', seq)
+    end
+    if ARGV[3] == '' then
+        redis.call('HDEL', KEYS[1], 'avail')
+    elseif redis.call('HEXISTS', KEYS[1], 'avail') == 1 then
+        if ARGV[4] ~= '' then
+            redis.call('HINCRBY', KEYS[1], 'avail', ARGV[4])
+        end
+    else
+        -- Sales not written back to Postgres yet are not part of the stock
+        local pending = tonumber(redis.call('HGET', KEYS[2], ARGV[1]) or 0)
+            + tonumber(redis.call('HGET', KEYS[3], ARGV[1]) or 0)
+        redis.call('HSET', KEYS[1], 'avail', tonumber(ARGV[3]) - pending)
+    end
+    return 1
+    """
+
+    # KEYS[1] - stock key, KEYS[2] - hold key, KEYS[3] - holds zset
+    # ARGV - item id, quantity, zset member, hold expiry time
+    RESERVE_SCRIPT = """
+    local avail = tonumber(redis.call('HGET', KEYS[1], 'avail'))
+    if not avail then
+        return false
+    end
+    local qty = tonumber(ARGV[2])
+    if qty > avail then
+        return {0, avail}
+    end
+    redis.call('HINCRBY', KEYS[1], 'avail', -qty)
+    redis.call('HINCRBY', KEYS[2], ARGV[1], qty)
+    redis.call('ZADD', KEYS[3], ARGV[4], ARGV[3])
+    return {1, avail - qty}
+    """
+
+    # KEYS - the same as for RESERVE_SCRIPT; ARGV - item id, quantity, zset member
+    UNRESERVE_SCRIPT = """
+    local held = tonumber(redis.call('HGET', KEYS[2], ARGV[1]))
+    if not held then
+        return 0
+    end
+    local qty = math.min(tonumber(ARGV[2]), held)
+    if qty == held then
+        redis.call('HDEL', KEYS[2], ARGV[1])
+        redis.call('ZREM', KEYS[3], ARGV[3])
+    else
+        redis.call('HINCRBY', KEYS[2], ARGV[1], -qty)
+    end
+    if redis.call('HEXISTS', KEYS[1], 'avail') == 1 then
+        redis.call('HINCRBY', KEYS[1], 'avail', qty)
+    end
+    return qty
+    """
+
+    # KEYS[1] - holds zset, then a (hold key, stock key) pair per hold
+    # ARGV[1] - release only holds expired by this time, '' releases any,
+    # then a (zset member, item id) pair per hold
+    RELEASE_SCRIPT = """
+    local released = 0
+    for i = 2, #KEYS, 2 do
+        local member, item_id = ARGV[i], ARGV[i + 1]
+        local expires = tonumber(redis.call('ZSCORE', KEYS[1], member))
+        if ARGV[1] == '' or (expires and expires <= tonumber(ARGV[1])) then
+            local qty = tonumber(redis.call('HGET', KEYS[i], item_id))
+            if qty then
+                redis.call('HDEL', KEYS[i], item_id)
+                if redis.call('HEXISTS', KEYS[i + 1], 'avail') == 1 then
+                    redis.call('HINCRBY', KEYS[i + 1], 'avail', qty)
+                end
+                released = released + qty
+            end
+            redis.call('ZREM', KEYS[1], member)
+        end
+    end
+    return released
+    """
+
+    # KEYS[1] - hold key, KEYS[2] - holds zset, KEYS[3] - sold hash, then
+    # a stock key per cart entry
+    # ARGV[1] - user id, then an (item id, quantity) pair per cart entry
+    COMMIT_SCRIPT = """
+    local short = {}
+    for j = 4, #KEYS do
+        local i = 2 * (j - 4) + 2
+        local avail = tonumber(redis.call('HGET', KEYS[j], 'avail'))
+        if avail then
+            local held = tonumber(redis.call('HGET', KEYS[1], ARGV[i]) or 0)
+            if tonumber(ARGV[i + 1]) - held > avail then
+                table.insert(short, ARGV[i])
+            end
+        end
+    end
+    if #short > 0 then
+        return short
+    end
+    for j = 4, #KEYS do
+        local i = 2 * (j - 4) + 2
+        local item_id, qty = ARGV[i], tonumber(ARGV[i + 1])
+        if redis.call('HEXISTS', KEYS[j], 'avail') == 1 then
+            -- Surplus held units go back, missing ones (expired holds) are taken
+            local held = tonumber(redis.call('HGET', KEYS[1], item_id) or 0)
+            redis.call('HINCRBY', KEYS[j], 'avail', held - qty)
+            redis.call('HINCRBY', KEYS[3], item_id, qty)
+        end
+        redis.call('HDEL', KEYS[1], item_id)
+        redis.call('ZREM', KEYS[2], ARGV[1] .. ':' .. item_id)
+    end
+    return {}
+    """
+
+    # KEYS - the same as for COMMIT_SCRIPT
+    # ARGV[1] - user id, ARGV[2] - hold expiry time, then an (item id,
+    # quantity) pair per cart entry
+    CANCEL_SCRIPT = """
+    for j = 4, #KEYS do
+        local i = 2 * (j - 4) + 3
+        local item_id, qty = ARGV[i], tonumber(ARGV[i + 1])
+        if redis.call('HEXISTS', KEYS[j], 'avail') == 1 then
+            redis.call('HINCRBY', KEYS[3], item_id, -qty)
+            redis.call('HINCRBY', KEYS[1], item_id, qty)
+            redis.call('ZADD', KEYS[2], ARGV[2], ARGV[1] .. ':' .. item_id)
+        end
+    end
+    return 1
+    """
+
+    # KEYS[1] - sold hash, KEYS[2] - flushing hash; ARGV[1] - new batch id
+    TAKE_SOLD_SCRIPT = """
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        if redis.call('EXISTS', KEYS[1]) == 0 then
+            return {}
+        end
+        redis.call('RENAME', KEYS[1], KEYS[2])
+        redis.call('HSET', KEYS[2], '_batch', ARGV[1])
+    end
+    return redis.call('HGETALL', KEYS[2])
+    """
+
+    # KEYS[1] - flushing hash; ARGV[1] - batch id
+    ACK_SOLD_SCRIPT = """
+    if redis.call('HGET', KEYS[1], '_batch') == ARGV[1] then
+        redis.call('DEL', KEYS[1])
+    end
+    return 1
+    """
+
+    def __init__(
+        self, redis_client: redis.Redis, hold_ttl: int = config.STOCK_HOLD_TTL
+    ):
+        self.redis_client = redis_client
+        self.hold_ttl = hold_ttl
+        self._apply = redis_client.register_script(self.APPLY_SCRIPT)
+        self._reserve = redis_client.register_script(self.RESERVE_SCRIPT)
+        self._unreserve = redis_client.register_script(self.UNRESERVE_SCRIPT)
+        self._release = redis_client.register_script(self.RELEASE_SCRIPT)
+        self._commit = redis_client.register_script(self.COMMIT_SCRIPT)
+        self._cancel = redis_client.register_script(self.CANCEL_SCRIPT)
+        self._take_sold = redis_client.register_script(self.TAKE_SOLD_SCRIPT)
+        self._ack_sold = redis_client.register_script(self.ACK_SOLD_SCRIPT)
+
+    def available(self, item_id: int) -> int | None:
+        """Units left for new holds, None if the item is not limited."""
+        avail = self.redis_client.hget(stock_key(item_id), "avail")
+        return int(avail) if avail is not None else None
+
+    def apply(
+        self,
+        item_id: int,
+        stock: int | None,
+        stock_delta: int | None = None,
+        seq: int | None = None,
+        pipeline: redis.client.Pipeline | None = None,
+    ):
+        """
+        Applies the stock of a catalog change or snapshot: the delta when it
+        is known and the item is already tracked, the stock less the sales
+        not written back yet otherwise. Changes at or below the sequence
+        already applied are skipped.
+        """
+        self._apply(
+            keys=[stock_key(item_id), STOCK_SOLD_KEY, STOCK_FLUSHING_KEY],
+            args=[
+                item_id,
+                "" if seq is None else seq,
+                "" if stock is None else stock,
+                "" if stock_delta is None else stock_delta,
+            ],
+            client=pipeline,
+        )
+
+    def reserve(self, user_id: int, item_id: int, qty: int = 1) -> int | None:
+        """
+        Holds `qty` units for the user, returns the units left (None if the
+        item is not limited). Raises `OutOfStock` if there are not enough.
+        """
+        result = self._reserve(
+            keys=[stock_key(item_id), hold_key(user_id), STOCK_HOLDS_KEY],
+            args=[item_id, qty, f"{user_id}:{item_id}", time.time() + self.hold_ttl],
+        )
+        if result is None:
+            return None
+        reserved, available = result
+        if not reserved:
+            raise OutOfStock([item_id], int(available))
+        return int(available)
+
+    def unreserve(self, user_id: int, item_id: int, qty: int = 1) -> int:
+        """
+        Gives back `qty` units of a `reserve` that could not be used, the
+        rest of the user's hold is kept. Returns the units given back.
+        """
+        return int(
+            self._unreserve(
+                keys=[stock_key(item_id), hold_key(user_id), STOCK_HOLDS_KEY],
+                args=[item_id, qty, f"{user_id}:{item_id}"],
+            )
+        )
+
+    def release(self, user_id: int, item_ids: Iterable[int] | None = None) -> int:
+        """Gives the user's holds back, all of them if `item_ids` is None."""
+        if item_ids is None:
+            item_ids = self.redis_client.hkeys(hold_key(user_id))
+        holds = [(user_id, int(item_id)) for item_id in item_ids]
+        return self._release_holds(holds, "")
+
+    def release_expired(self, limit: int = 1000) -> int:
+        """Gives back up to `limit` expired holds, returns the units released."""
+        now = time.time()
+        members = self.redis_client.zrangebyscore(
+            STOCK_HOLDS_KEY, "-inf", now, start=0, num=limit
+        )
+        holds = []
+        for member in members:
+            user_id, item_id = member.split(":")
+            holds.append((int(user_id), int(item_id)))
+        return self._release_holds(holds, now)
+
+    def _release_holds(self, holds: List[Tuple[int, int]], deadline) -> int:
+        if not holds:
+            return 0
+        keys, args = [STOCK_HOLDS_KEY], [deadline]
+        for user_id, item_id in holds:
+            keys += [hold_key(user_id), stock_key(item_id)]
+            args += [f"{user_id}:{item_id}", item_id]
+        return int(self._release(keys=keys, args=args))
+
+    def commit(self, user_id: int, entries: List[Dict]):
+        """
+        Turns the user's holds for checked out cart entries into sales,
+        taking units whose hold expired from the available ones. Raises
+        `OutOfStock` with the items that ran out, nothing is changed then.
+        """
+        short = self._commit(
+            keys=self._entry_keys(user_id, entries),
+            args=[user_id] + self._entry_args(entries),
+        )
+        if short:
+            raise OutOfStock([int(item_id) for item_id in short])
+
+    def cancel(self, user_id: int, entries: List[Dict]):
+        """Turns sales of `commit` back into holds, e.g. when the order failed."""
+        self._cancel(
+            keys=self._entry_keys(user_id, entries),
+            args=[user_id, time.time() + self.hold_ttl] + self._entry_args(entries),
+        )
+
+    @staticmethod
+    def _entry_keys(user_id: int, entries: List[Dict]) -> List[str]:
+        return [hold_key(user_id), STOCK_HOLDS_KEY, STOCK_SOLD_KEY] + [
+            stock_key(entry["id"]) for entry in entries
+        ]
+
+    @staticmethod
+    def _entry_args(entries: List[Dict]) -> List:
+        args = []
+        for entry in entries:
+            args += [entry["id"], entry["qty"]]
+        return args
+
+    def take_sold(self) -> Tuple[str, Dict[int, int]] | None:
+        """
+        Sales to write back to Postgres as (batch id, {item_id: units}),
+        None if there are none. A batch that was not acknowledged is handed
+        out again, with the same id, so the backend can skip it if it was
+        applied already.
+        """
+        fields = self._take_sold(
+            keys=[STOCK_SOLD_KEY, STOCK_FLUSHING_KEY], args=[uuid.uuid4().hex]
+        )
+        if not fields:
+            return None
+        batch = dict(zip(fields[::2], fields[1::2]))
+        batch_id = batch.pop("_batch")
+        sold = {int(item_id): int(qty) for item_id, qty in batch.items()}
+        return batch_id, {item_id: qty for item_id, qty in sold.items() if qty}
+
+    def ack_sold(self, batch_id: str):
+        """Drops a batch of `take_sold` once the backend applied it."""
+        self._ack_sold(keys=[STOCK_FLUSHING_KEY], args=[batch_id])
@@ -1,13 +1,42 @@
-from typing import Dict, List
+from typing import Dict, List, Tuple
 import httpx
+import redis
 import asyncio
 import logging
 import threading
-from bot.db.schemas import ItemDeleteMessage, ItemUpdateMessage
-from bot.config import ADMIN_API_URL, ADMIN_API_KEY, redis_client, rabbitmq_client
+import time
+from bot.metrics import BACKEND_EVENT_HOOKS
+from bot.db import keys
+from bot.db.cart import CartEngine
+from bot.db.digests import CatalogDigests, ReconcileReport, row_hash
+from bot.db.item_cache import ItemCache
+from bot.db.schemas import CatalogEvent
+from bot.db.stats import ItemStats
+from bot.db.stock import OutOfStock, StockEngine
+from bot.db.users import UserRegistry
+from bot.config import (
+    ADMIN_API_URL,
+    ADMIN_API_KEY,
+    POPULARITY_RANKING_SIZE,
+    POPULARITY_REFRESH_INTERVAL,
+    RECONCILE_INTERVAL,
+    RECS_REFRESH_INTERVAL,
+    RECS_SHOWN,
+    STATS_FLUSH_INTERVAL,
+    STATS_ROLLUP_INTERVAL,
+    STOCK_FLUSH_INTERVAL,
+    STOCK_SWEEP_INTERVAL,
+    redis_client,
+    rabbitmq_client,
+)
 import json
 from pydantic import ValidationError
 
+try:
+    import msgpack
+except ImportError:  # only needed when the admin publishes msgpack events
+    msgpack = None
+
 logger = logging.Logger("bot")
 
 
@@ -20,37 +49,168 @@ class DataStorage:
     It also handles cart operations and manages the local cache of items.
 
     Attributes:
-        ITEM_QUEUE (str): The name of the RabbitMQ queue for item update messages.
+        ITEM_EXCHANGE (str): The fanout exchange catalog changes are broadcast to.
+            Every bot replica consumes it through its own exclusive queue.
+        RECONNECT_DELAY (int): Seconds between RabbitMQ reconnect attempts.
         _items (List[Dict]): A local cache of items loaded from Redis.
         _items_lock (threading.Lock): A lock to ensure thread safety when accessing
             and modifying the `_items` list.
+        _catalog_version (int): Bumped on every change of the local catalog,
+            used to key rendered catalog pages. Local to the process, buttons
+            carry `_catalog_seq` instead.
+        _catalog_seq (int): Sequence number of the last catalog change applied,
+            used to detect missed or out-of-order catalog events.
+        _seq_lock (threading.Lock): Serializes applying catalog changes.
         redis_client: The Redis client instance for interacting with Redis.
+        cart (CartEngine): User carts stored in Redis.
+        stock (StockEngine): Stock of limited items and the holds on it, in Redis.
+        digests (CatalogDigests): Bucket digests of the catalog in Redis,
+            compared with the backend by `reconcile`.
+        stats (ItemStats): Item view and add-to-cart counters.
+        users (UserRegistry): Users to send broadcasts to.
+        _ranking (Dict[int, int]): Position of the most popular items in the
+            last popularity ranking fetched from the backend.
+        _ranking_version (int): Bumped on every new ranking, keys rendered
+            catalog pages sorted by popularity.
         rabbit_client: The RabbitMQ client instance for interacting with RabbitMQ.
         consumer_thread (threading.Thread): Thread, that starts rabbit consumer.
+        _consumer_ready (threading.Event): Set once the consumer queue is bound.
+        _catalog_loaded (threading.Event): Set once the startup catalog is loaded,
+            catalog events wait for it to have a sequence to compare with.
     """
-    ITEM_QUEUE = "item_queue"
+
+    ITEM_EXCHANGE = "item_events"
+    RECONNECT_DELAY = 5
+    CONSUMER_READY_TIMEOUT = 10
+    CHANGES_PAGE_SIZE = 1000
 
     def __init__(self):
         self._items: List[Dict] = []
         self._items_lock = threading.Lock()
+        self._catalog_version = 0
+        self._catalog_seq = 0
+        self._seq_lock = threading.Lock()
         self.redis_client = redis_client
         self.rabbit_client = rabbitmq_client
+        self.cart = CartEngine(self.redis_client)
+        self.item_cache = ItemCache()
+        self.stock = StockEngine(self.redis_client)
+        self.digests = CatalogDigests(self.redis_client)
+        self.stats = ItemStats(self.redis_client)
+        self.users = UserRegistry(self.redis_client)
+        self._ranking: Dict[int, int] = {}
+        self._ranking_version = 0
+        self._tasks: List[asyncio.Task] = []
+        self.consumer_thread = None
+        self._catalog_listeners = []
+        self._consumer_ready = threading.Event()
+        self._catalog_loaded = threading.Event()
+
+    async def start(self):
+        """
+        Used on app start: binds the item consumer and loads the catalog.
 
-        self.set_item_consumption()
+        The consumer is bound first, so no change is lost between loading the
+        catalog and consuming updates (duplicates are skipped by sequence).
+        """
+        self.item_cache.start(self.redis_client)
         self.consumer_thread = threading.Thread(
             target=self._start_consuming_sync, daemon=True
         )
         self.consumer_thread.start()
+        ready = await asyncio.to_thread(
+            self._consumer_ready.wait, self.CONSUMER_READY_TIMEOUT
+        )
+        if not ready:
+            logger.warning("Item consumer is not bound yet, loading catalog anyway")
+        await self.warm_start()
+        self._tasks = [
+            asyncio.create_task(self._release_expired_holds()),
+            asyncio.create_task(self._write_back_sales()),
+            asyncio.create_task(self._flush_stats()),
+            asyncio.create_task(self._roll_up_stats()),
+            asyncio.create_task(self._refresh_ranking()),
+            asyncio.create_task(self._refresh_recommendations()),
+        ]
+        if RECONCILE_INTERVAL:
+            self._tasks.append(asyncio.create_task(self._reconcile_periodically()))
+
+    async def stop(self):
+        """
+        Used on app stop: stops background work, writes back pending sales
+        and flushes the item counters to Redis.
+        """
+        for task in self._tasks:
+            task.cancel()
+        self.item_cache.stop()
+        await self.write_back_sales()
+        self.flush_stats()
+
+    async def fetch_catalog_seq(self) -> int | None:
+        """Cheap check of the backend catalog version, None if unavailable."""
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+            try:
+                response = await client.get(
+                    f"{ADMIN_API_URL}/items/version", headers=headers
+                )
+                response.raise_for_status()
+                return response.json()["seq"]
+            except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+                logger.error(f"Error loading catalog version from admin API: {e}")
+                return None
+
+    async def warm_start(self):
+        """
+        Serves the catalog snapshot left in Redis by a previous run when it is
+        at the backend version. A snapshot that is behind is brought up to
+        date with the missed changes only; the full catalog is fetched when
+        there is no snapshot or its version cannot be related to the backend.
+        """
+        started = time.monotonic()
+        redis_seq = self.redis_client.get(keys.CATALOG_SEQ_KEY)
+        redis_seq = int(redis_seq) if redis_seq is not None else None
+        backend_seq = await self.fetch_catalog_seq()
+
+        if redis_seq is None or (backend_seq is not None and redis_seq > backend_seq):
+            await self.fetch_items()
+            source = "admin API"
+        else:
+            items = await self.get_all_items()
+            await asyncio.to_thread(self._resume_from, redis_seq, backend_seq)
+            if backend_seq is None:
+                logger.warning("Admin API unavailable, serving catalog from Redis")
+            source = f"Redis snapshot ({len(items)} items)"
+        logger.info(
+            f"Catalog loaded from {source} at seq={self._catalog_seq} "
+            f"in {time.monotonic() - started:.3f}s"
+        )
+        self._catalog_loaded.set()
+
+    def _resume_from(self, seq: int, backend_seq: int | None):
+        with self._seq_lock:
+            self._catalog_seq = seq
+            if backend_seq is not None and seq < backend_seq:
+                self._apply_changes_since(seq)
+
+    def fetch_items_sync(self):
+        """Fetches the catalog snapshot from backend in the consumer thread."""
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        response = httpx.get(f"{ADMIN_API_URL}/items/", headers=headers)
+        response.raise_for_status()
+        items = response.json()
+        self.store_items_in_redis(items, self._get_catalog_seq(response))
+        logger.info(f"Resynced {len(items)} items from admin API")
 
     async def fetch_items(self):
         """Used on app start to fetch items from backend and store them to redis"""
         headers = {"X-API-Key": ADMIN_API_KEY}
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
             try:
                 response = await client.get(f"{ADMIN_API_URL}/items/", headers=headers)
                 response.raise_for_status()
                 items = response.json()
-                self.store_items_in_redis(items)
+                self.store_items_in_redis(items, self._get_catalog_seq(response))
                 logger.info(
                     f"Fetched {len(items)} items from admin API and stored in Redis"
                 )
@@ -59,16 +219,29 @@ class DataStorage:
             except json.JSONDecodeError as e:
                 logger.error(f"Error decoding JSON from admin API: {e}")
 
-    def store_item(self, new_item: Dict):
-        """Stores or updates an item in Redis and updates the local cache."""
+    def store_item(self, new_item: Dict, seq: int | None = None) -> bool:
+        """
+        Stores or updates an item in Redis and updates the local cache.
+        Returns whether the write went through.
+        """
         try:
+            new_item, stock, stock_delta = self._split_stock(new_item)
             item_key = self._get_item_key(new_item["id"])
-            self.redis_client.set(item_key, json.dumps(new_item))
+            pipeline = self.redis_client.pipeline()
+            pipeline.set(item_key, json.dumps(new_item))
+            self.digests.update(new_item["id"], new_item, pipeline)
+            self.stock.apply(new_item["id"], stock, stock_delta, seq, pipeline)
+            if seq is not None:
+                pipeline.set(keys.CATALOG_SEQ_KEY, seq)
+            pipeline.execute()
+            # Redis pushes the invalidation too, this replica needn't wait for it
+            self.item_cache.invalidate([new_item["id"]])
 
             with self._items_lock:
                 existing_item_index = next(
                     (
-                        i for i, item in enumerate(self._items)
+                        i
+                        for i, item in enumerate(self._items)
                         if item["id"] == new_item["id"]
                     ),
                     None,
@@ -77,34 +250,54 @@ class DataStorage:
                     self._items[existing_item_index] = new_item
                 else:
                     self._items.append(new_item)
+                self._catalog_version += 1
+                for listener in self._catalog_listeners:
+                    listener.upsert(new_item)
             logger.info(f"Updated item {new_item['id']} in Redis and local cache")
+            return True
 
         except Exception as e:
             logger.error(f"Error in store_item: {e}")
+            return False
 
-    def delete_item(self, item_id: int):
-        """Deletes an item from Redis and the local cache."""
+    def delete_item(self, item_id: int, seq: int | None = None) -> bool:
+        """
+        Deletes an item from Redis and the local cache.
+        Returns whether the write went through.
+        """
         try:
             # Validate item_id type
             if not isinstance(item_id, int):
                 raise TypeError(f"item_id must be an integer, got {type(item_id)}")
 
             item_key = self._get_item_key(item_id)
-            deleted_count = self.redis_client.delete(item_key)
+            pipeline = self.redis_client.pipeline()
+            pipeline.delete(item_key)
+            self.digests.update(item_id, None, pipeline)
+            self.stock.apply(item_id, None, seq=seq, pipeline=pipeline)
+            if seq is not None:
+                pipeline.set(keys.CATALOG_SEQ_KEY, seq)
+            deleted_count = pipeline.execute()[0]
+            self.item_cache.invalidate([item_id])
             if deleted_count == 0:
                 logger.warning(
                     f"Item with ID {item_id} not found in Redis for deletion"
                 )
-                return
+                return True
 
             with self._items_lock:
                 self._items = [item for item in self._items if item["id"] != item_id]
+                self._catalog_version += 1
+                for listener in self._catalog_listeners:
+                    listener.remove(item_id)
             logger.info(f"Deleted item with ID {item_id} from Redis and local cache")
+            return True
 
         except TypeError as e:
             logger.error(f"Invalid item_id type: {e}")
         except Exception as e:
             logger.error(f"Error in delete_item: {e}")
+        return False
 
     async def get_all_items(self) -> List[Dict]:
         """
@@ -116,7 +309,7 @@ class DataStorage:
                 return self._items.copy()
 
         try:
-            item_keys = self.redis_client.keys("item:*")
+            item_keys = list(self.redis_client.scan_iter(match="item:*", count=1000))
             if not item_keys:
                 return []
             pipeline = self.redis_client.pipeline()
@@ -126,120 +319,620 @@ class DataStorage:
             items = [json.loads(item) for item in results if item]
             with self._items_lock:
                 self._items = items.copy()
+                self._catalog_version += 1
+                for listener in self._catalog_listeners:
+                    listener.rebuild(items)
             return items
         except Exception as e:
             logger.error(f"Error in get_all_items: {e}")
             return []
 
-    def store_items_in_redis(self, items: List[Dict]):
-        """Stores items in Redis."""
+    @property
+    def catalog_version(self) -> int:
+        return self._catalog_version
+
+    @property
+    def catalog_seq(self) -> int:
+        return self._catalog_seq
+
+    @property
+    def ranking_version(self) -> int:
+        return self._ranking_version
+
+    def add_catalog_listener(self, listener):
+        """
+        Keeps `listener` in sync with the local catalog: it is rebuilt from the
+        current items now and on every full reload, then gets `upsert(item)`
+        and `remove(item_id)` for single item changes.
+        """
+        with self._items_lock:
+            self._catalog_listeners.append(listener)
+            listener.rebuild(list(self._items))
+
+    def store_items_in_redis(self, items: List[Dict], seq: int | None = None):
+        """
+        Replaces the catalog in Redis and the local cache with `items`,
+        removing items that are not part of the snapshot.
+
+        `seq` is the catalog sequence the snapshot was taken at. If events
+        newer than the snapshot were already applied, they are replayed on top.
+        """
         try:
-            pipeline = self.redis_client.pipeline()
-            for item in items:
-                pipeline.set(self._get_item_key(item["id"]), json.dumps(item))
-            pipeline.execute()
-            logger.info(f"Successfully stored {len(items)} items in redis")
+            self._replace_catalog(items, seq)
+            if seq is not None:
+                with self._seq_lock:
+                    applied_seq, self._catalog_seq = self._catalog_seq, seq
+                    if applied_seq > seq:
+                        self._apply_changes_since(seq)
         except Exception as e:
             logger.error(f"Error in store_items_in_redis: {e}")
 
+    def _replace_catalog(self, items: List[Dict], seq: int | None):
+        """Writes the snapshot to Redis and swaps the local catalog at once."""
+        snapshot = [self._split_stock(item) for item in items]
+        items = [item for item, _, _ in snapshot]
+        item_keys = {self._get_item_key(item["id"]) for item in items}
+        stale_keys = [
+            key
+            for key in self.redis_client.scan_iter(
+                match=f"{keys.ITEM_PREFIX}*", count=1000
+            )
+            if key not in item_keys
+        ]
+        pipeline = self.redis_client.pipeline()
+        if stale_keys:
+            pipeline.delete(*stale_keys)
+        for key in stale_keys:
+            item_id = int(key.removeprefix(keys.ITEM_PREFIX))
+            self.stock.apply(item_id, None, seq=seq, pipeline=pipeline)
+        for item, stock, _ in snapshot:
+            pipeline.set(self._get_item_key(item["id"]), json.dumps(item))
+            # A snapshot has no deltas: the stock of tracked items is kept
+            self.stock.apply(item["id"], stock, seq=seq, pipeline=pipeline)
+        self.digests.rebuild(items, pipeline)
+        if seq is not None:
+            pipeline.set(keys.CATALOG_SEQ_KEY, seq)
+        pipeline.execute()
+        self.item_cache.invalidate()
+        with self._items_lock:
+            self._items = list(items)
+            self._catalog_version += 1
+            for listener in self._catalog_listeners:
+                listener.rebuild(items)
+        logger.info(f"Successfully stored {len(items)} items in redis")
+
+    @staticmethod
+    def _split_stock(item: Dict) -> Tuple[Dict, int | None, int | None]:
+        """
+        The item without its stock fields, its stock and stock delta. Stock
+        is served from its own counters, not from the item record.
+        """
+        item = dict(item)
+        return item, item.pop("stock", None), item.pop("stock_delta", None)
+
+    @staticmethod
+    def _get_catalog_seq(response: httpx.Response) -> int | None:
+        seq = response.headers.get("X-Catalog-Seq")
+        return int(seq) if seq is not None else None
+
+    # ---------- Catalog change events ---------- #
+    def apply_event(self, event: CatalogEvent):
+        """
+        Applies a catalog change in sequence order.
+
+        Events at or below the applied sequence are duplicates or arrived out
+        of order and are skipped. An event beyond the next expected sequence
+        means events were missed: only the missing changes are fetched from
+        the backend and applied in order (including this event).
+        """
+        self._catalog_loaded.wait(self.CONSUMER_READY_TIMEOUT)
+        with self._seq_lock:
+            if event.seq <= self._catalog_seq:
+                logger.info(f"Skipping stale catalog event seq={event.seq}")
+                return
+            if event.seq > self._catalog_seq + 1:
+                logger.warning(
+                    f"Catalog events {self._catalog_seq + 1}..{event.seq - 1} missed, "
+                    f"fetching changes since {self._catalog_seq}"
+                )
+                self._apply_changes_since(self._catalog_seq)
+                return
+            self._apply_change(event)
+
+    def _apply_change(self, event: CatalogEvent) -> bool:
+        """
+        Applies one change and advances the applied sequence. A failed write
+        leaves the sequence behind, so the next event sees the gap and
+        fetches the change again.
+        """
+        if event.op == "reload":
+            self._reload_catalog(event.seq)
+            return True
+        if event.op == "delete":
+            applied = self.delete_item(event.id, seq=event.seq)
+        else:
+            applied = self.store_item(event.item.model_dump(), seq=event.seq)
+        if applied:
+            self._catalog_seq = event.seq
+        return applied
+
+    def _reload_catalog(self, seq: int):
+        """
+        Applies a bulk change (an import) as one swap of the whole catalog
+        instead of item by item. The snapshot may already include later
+        changes, those are then skipped as stale.
+        """
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        response = httpx.get(f"{ADMIN_API_URL}/items/", headers=headers)
+        response.raise_for_status()
+        items = response.json()
+        snapshot_seq = max(self._get_catalog_seq(response) or seq, seq)
+        self._replace_catalog(items, snapshot_seq)
+        self._catalog_seq = snapshot_seq
+        logger.info(f"Reloaded {len(items)} items at seq={snapshot_seq}")
+
+    def _apply_changes_since(self, since: int):
+        """Fetches changes after `since` from the backend and applies them."""
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        try:
+            while True:
+                response = httpx.get(
+                    f"{ADMIN_API_URL}/items/changes",
+                    params={"since": since, "limit": self.CHANGES_PAGE_SIZE},
+                    headers=headers,
+                )
+                response.raise_for_status()
+                changes = response.json()["changes"]
+                for change in changes:
+                    # A reload may have jumped past the rest of the page
+                    if change["seq"] > self._catalog_seq:
+                        if not self._apply_change(CatalogEvent(**change)):
+                            # Later changes must not skip past this one
+                            return
+                    since = change["seq"]
+                if len(changes) < self.CHANGES_PAGE_SIZE:
+                    break
+            logger.info(f"Catalog caught up to seq={self._catalog_seq}")
+        except (httpx.HTTPError, ValidationError, KeyError) as e:
+            # The next event detects the gap again and retries
+            logger.error(f"Error fetching catalog changes since {since}: {e}")
+
+    # ---------- Reconciliation ---------- #
+    def reconcile(self) -> ReconcileReport:
+        """
+        Compares the catalog digests in Redis with the backend's and repairs
+        the buckets that differ, fetching only their items. Runs at the
+        backend catalog sequence (catching up first if events were lost), so
+        changes in flight are not mistaken for drift.
+        """
+        report = ReconcileReport()
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        try:
+            response = httpx.get(
+                f"{ADMIN_API_URL}/items/digests",
+                params={"buckets": self.digests.buckets},
+                headers=headers,
+            )
+            response.raise_for_status()
+            data = response.json()
+            report.seq = data["seq"]
+            remote = {
+                int(bucket): tuple(digest) for bucket, digest in data["buckets"].items()
+            }
+            with self._seq_lock:
+                if self._catalog_seq < report.seq:
+                    self._apply_changes_since(self._catalog_seq)
+                if self._catalog_seq != report.seq:
+                    report.skipped = (
+                        f"catalog at seq={self._catalog_seq}, "
+                        f"backend at seq={report.seq}"
+                    )
+                    return report
+                if not self.digests.exists():
+                    self._rebuild_digests()
+                report.differing = self.digests.differing(
+                    self.digests.digests(), remote
+                )
+                for bucket in report.differing:
+                    if not self._repair_bucket(bucket, report, headers):
+                        report.skipped = "catalog changed during the check"
+                        break
+        except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+            logger.error(f"Error reconciling catalog with admin API: {e}")
+            report.skipped = f"admin API error: {e}"
+            return report
+
+        if report.updated or report.deleted:
+            logger.warning(
+                f"Catalog drift repaired at seq={report.seq}: buckets "
+                f"{report.differing}, updated {report.updated}, "
+                f"deleted {report.deleted}"
+            )
+        return report
+
+    def _repair_bucket(self, bucket: int, report: ReconcileReport, headers) -> bool:
+        """Brings one bucket in line with the backend, False if it moved on."""
+        response = httpx.get(
+            f"{ADMIN_API_URL}/items/",
+            params={"bucket": bucket, "buckets": self.digests.buckets},
+            headers=headers,
+        )
+        response.raise_for_status()
+        if self._get_catalog_seq(response) != report.seq:
+            return False
+        local = self.digests.rows(bucket)
+        for item in response.json():
+            if local.pop(item["id"], None) != row_hash(item):
+                self.store_item(item)
+                report.updated.append(item["id"])
+        for item_id in local:
+            self.delete_item(item_id)
+            report.deleted.append(item_id)
+        return True
+
+    def _rebuild_digests(self):
+        """Digests of a catalog stored before they were kept, from memory."""
+        with self._items_lock:
+            items = list(self._items)
+        pipeline = self.redis_client.pipeline()
+        self.digests.rebuild(items, pipeline)
+        pipeline.execute()
+        logger.info(f"Rebuilt catalog digests of {len(items)} items")
+
+    async def _reconcile_periodically(self):
+        while True:
+            await asyncio.sleep(RECONCILE_INTERVAL)
+            await asyncio.to_thread(self.reconcile)
+
     @staticmethod
     def _get_item_key(item_id: int) -> str:
-        return f"item:{item_id}"
+        return keys.item_key(item_id)
 
     def set_item_consumption(self):
-        """Set up RabbitMQ consumption for item updates"""
-        self.rabbit_client.channel.basic_consume(
-            queue=DataStorage.ITEM_QUEUE,
+        """
+        Set up RabbitMQ consumption for item updates.
+
+        Binds an exclusive, auto-deleted queue to the fanout item exchange, so
+        every replica gets every catalog change and the queue disappears
+        together with the replica.
+        """
+        channel = self.rabbit_client.channel
+        channel.exchange_declare(
+            exchange=DataStorage.ITEM_EXCHANGE, exchange_type="fanout"
+        )
+        result = channel.queue_declare(queue="", exclusive=True, auto_delete=True)
+        queue = result.method.queue
+        channel.queue_bind(queue=queue, exchange=DataStorage.ITEM_EXCHANGE)
+        channel.basic_consume(
+            queue=queue,
             on_message_callback=self._item_update_callback,
             auto_ack=True,
         )
 
+    def get_item(self, item_id: int) -> Dict | None:
+        """
+        Returns a single item, None if it does not exist. Served from the
+        process-local item cache, loaded from Redis on a miss.
+        """
+        item = self.item_cache.get(item_id, self._load_item)
+        return dict(item) if item else None
+
+    def _load_item(self, item_id: int) -> Dict | None:
+        item = self.redis_client.get(self._get_item_key(item_id))
+        return json.loads(item) if item else None
+
+    def get_stock(self, item_id: int) -> int | None:
+        """Units of the item left, None if it is not limited."""
+        return self.stock.available(item_id)
+
     # ---------- Cart operations ---------- #
-    def add_to_cart(self, user_id: int, item_id: int):
-        cart_key = f"cart:{user_id}"
-        self.redis_client.sadd(cart_key, str(item_id))
+    def add_to_cart(self, user_id: int, item: Dict, qty: int = 1) -> int:
+        """
+        Holds the units of a limited item and adds it to the cart, returns
+        its new quantity in the cart. Raises `OutOfStock` if it ran out.
+        """
+        limited = self.stock.reserve(user_id, item["id"], qty) is not None
+        try:
+            return self.cart.add(user_id, item, qty)
+        except Exception:
+            # Not in the cart, the units must not stay held until the hold expires
+            if limited:
+                self.stock.unreserve(user_id, item["id"], qty)
+            raise
 
     def get_cart_items(self, user_id: int) -> list[Dict]:
-        cart_key = f"cart:{user_id}"
-        item_ids = self.redis_client.smembers(cart_key)
-        items_in_cart = []
-        if item_ids:
-            pipeline = self.redis_client.pipeline()
-            for item_id in item_ids:
-                pipeline.get(f"item:{item_id}")
-            results = pipeline.execute()
-            items_in_cart = [json.loads(item) for item in results if item]
-        return items_in_cart
+        return self.cart.get_items(user_id)
 
     def is_item_in_cart(self, user_id: int, item_id: int) -> bool:
         """Checks if an item is in the user's cart."""
-        cart_key = f"cart:{user_id}"
-        return self.redis_client.sismember(cart_key, str(item_id))
+        return self.cart.contains(user_id, item_id)
 
     def remove_from_cart(self, user_id: int, item_id: int):
-        """Removes item from cart in redis."""
-        cart_key = f"cart:{user_id}"
-        self.redis_client.srem(cart_key, str(item_id))
+        """Removes item from cart in redis and releases its hold."""
+        self.cart.remove(user_id, item_id)
+        self.stock.release(user_id, [item_id])
 
     def clear_cart(self, user_id: int):
-        """Clear user cart in redis."""
-        cart_key = f"cart:{user_id}"
-        self.redis_client.delete(cart_key)
+        """Clear user cart in redis and release its holds."""
+        self.cart.clear(user_id)
+        self.stock.release(user_id)
 
-    # ---------- RabbitMQ operations ---------- #
-    def _start_consuming_sync(self):
+    def checkout_cart(self, user_id: int) -> list[Dict]:
+        """
+        Atomically takes all items out of the user cart for an order and
+        turns their holds into sales. Raises `OutOfStock` (the cart is kept)
+        if a limited item ran out while its hold was expired.
+        """
+        cart_items = self.cart.checkout(user_id)
+        if cart_items:
+            try:
+                self.stock.commit(user_id, cart_items)
+            except OutOfStock:
+                self.cart.restore(user_id, cart_items)
+                raise
+        return cart_items
+
+    def restore_cart(self, user_id: int, cart_items: list[Dict]):
+        """Puts items taken by `checkout_cart` back into the cart, held again."""
+        self.stock.cancel(user_id, cart_items)
+        self.cart.restore(user_id, cart_items)
+
+    # ---------- Stock maintenance ---------- #
+    async def _release_expired_holds(self):
+        while True:
+            await asyncio.sleep(STOCK_SWEEP_INTERVAL)
+            try:
+                released = self.stock.release_expired()
+                if released:
+                    logger.info(f"Released {released} units of expired holds")
+            except redis.RedisError as e:
+                logger.error(f"Error releasing expired holds: {e}")
+
+    async def _write_back_sales(self):
+        while True:
+            await asyncio.sleep(STOCK_FLUSH_INTERVAL)
+            await self.write_back_sales()
+
+    async def write_back_sales(self):
+        """
+        Sends the sales of limited items made since the last call to the
+        backend in one batch. A batch that failed is sent again next time.
+        """
         try:
-            self.rabbit_client.channel.start_consuming()
-        except Exception as e:
-            logger.error(f"An error occurred in Rabbit consumer: {e}")
+            batch = self.stock.take_sold()
+        except redis.RedisError as e:
+            logger.error(f"Error taking sales to write back: {e}")
+            return
+        if batch is None:
+            return
+        batch_id, sold = batch
+        if sold:
+            headers = {"X-API-Key": ADMIN_API_KEY}
+            payload = {"batch": batch_id, "sold": sold}
+            async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+                try:
+                    response = await client.post(
+                        f"{ADMIN_API_URL}/items/stock", json=payload, headers=headers
+                    )
+                    response.raise_for_status()
+                except httpx.HTTPError as e:
+                    logger.error(f"Error writing back sales batch {batch_id}: {e}")
+                    return
+            logger.info(f"Wrote back sales of {len(sold)} items")
+        self.stock.ack_sold(batch_id)
 
-    def _item_update_callback(self, ch, method, properties, body):
+    # ---------- Item stats and popularity ---------- #
+    def record_view(self, item_id: int, user_id: int):
+        self.stats.record_view(item_id, user_id)
+
+    def record_add_to_cart(self, item_id: int, qty: int = 1):
+        self.stats.record_add(item_id, qty)
+
+    def sort_by_popularity(self, items: List[Dict]) -> List[Dict]:
+        """
+        `items` ordered by the last popularity ranking fetched, items out of
+        the ranking go after the ranked ones in their own order.
         """
-        Callback function for handling item update messages from RabbitMQ.
+        ranking = self._ranking
+        return sorted(items, key=lambda item: ranking.get(item["id"], len(ranking)))
 
-        Parses incoming messages to determine if they are item update or
-        item delete messages and dispatches them to the appropriate handlers.
+    def flush_stats(self):
+        try:
+            self.stats.flush()
+        except redis.RedisError as e:
+            logger.error(f"Error flushing item stats: {e}")
 
-        Args:
-            ch: The Pika channel object.
-            method: The Pika method frame.
-            properties: The Pika message properties.
-            body: The message body.
+    async def _flush_stats(self):
+        while True:
+            await asyncio.sleep(STATS_FLUSH_INTERVAL)
+            self.flush_stats()
 
-        Raises:
-            json.JSONDecodeError: If the message body is not valid JSON.
-            ValidationError: If the message content does not match
-                `ItemDeleteMessage` or `ItemUpdateMessage` schema.
+    async def _roll_up_stats(self):
+        while True:
+            await asyncio.sleep(STATS_ROLLUP_INTERVAL)
+            await self.roll_up_stats()
+
+    async def roll_up_stats(self):
+        """
+        Sends the item counters collected in Redis by all replicas to the
+        backend in one batch. A batch that failed is sent again next time.
         """
         try:
-            item = json.loads(body.decode())
-            if item.get("channel") == "item_deletes":
-                try:
-                    item_delete_message = ItemDeleteMessage(**item)
-                    asyncio.create_task(self.delete_item(item_delete_message.id))
-                    logger.info(
-                        f"Received request: delete item with id={item_delete_message.id}"
-                    )
-                except ValidationError as e:
-                    logger.error(
-                        f"Error validating item delete message: {e}. Message body: {body}"
-                    )
+            batch = self.stats.take_rollup()
+        except redis.RedisError as e:
+            logger.error(f"Error taking item stats to roll up: {e}")
+            return
+        if batch is None:
+            return
+        batch_id, counts = batch
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        payload = {"batch": batch_id, **counts}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+            try:
+                response = await client.post(
+                    f"{ADMIN_API_URL}/items/stats", json=payload, headers=headers
+                )
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.error(f"Error rolling up item stats batch {batch_id}: {e}")
                 return
+        self.stats.ack_rollup(batch_id)
+
+    async def _refresh_ranking(self):
+        while True:
+            await self.refresh_ranking()
+            await asyncio.sleep(POPULARITY_REFRESH_INTERVAL)
 
+    async def refresh_ranking(self):
+        """
+        Fetches the popularity ranking the backend precomputes on schedule.
+        A new ranking bumps the ranking version, so catalog pages sorted by
+        popularity are rendered again; catalog buttons stay valid.
+        """
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
             try:
-                item_update_message = ItemUpdateMessage(**item)
-                asyncio.create_task(self.store_item(item_update_message.model_dump()))
-                logger.info(
-                    f"Received request: update item with id={item_update_message.id}"
+                response = await client.get(
+                    f"{ADMIN_API_URL}/items/popular",
+                    params={"limit": POPULARITY_RANKING_SIZE},
+                    headers=headers,
                 )
+                response.raise_for_status()
+                item_ids = response.json()["ids"]
+            except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+                logger.error(f"Error loading popularity ranking from admin API: {e}")
+                return
+        ranking = {item_id: position for position, item_id in enumerate(item_ids)}
+        if ranking != self._ranking:
+            with self._items_lock:
+                self._ranking = ranking
+                self._ranking_version += 1
 
-            except ValidationError as e:
-                logger.error(
-                    f"Error validating item update message: {e}. Message body: {body}"
+    # ---------- Recommendations ---------- #
+    def get_also_bought(self, item_id: int, limit: int = RECS_SHOWN) -> List[Dict]:
+        """
+        Items bought most often together with the item: one Redis lookup,
+        the items themselves come from the item cache.
+        """
+        rec_ids = self.redis_client.hget(keys.RECS_KEY, item_id)
+        items = []
+        for rec_id in rec_ids.split(",") if rec_ids else ():
+            item = self.get_item(int(rec_id))
+            # Lists may name items deleted since
+            if item is not None:
+                items.append(item)
+                if len(items) == limit:
+                    break
+        return items
+
+    async def _refresh_recommendations(self):
+        while True:
+            await self.refresh_recommendations()
+            await asyncio.sleep(RECS_REFRESH_INTERVAL)
+
+    async def refresh_recommendations(self):
+        """
+        Fetches the "also bought" lists changed since the version in Redis,
+        or all of them when the backend rebuilt them, and stores them.
+        """
+        params = {"since": 0}
+        state = self.redis_client.get(keys.RECS_VERSION_KEY)
+        if state:
+            params["generation"], _, since = state.partition(":")
+            params["since"] = int(since)
+        headers = {"X-API-Key": ADMIN_API_KEY}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+            try:
+                response = await client.get(
+                    f"{ADMIN_API_URL}/items/recommendations",
+                    params=params,
+                    headers=headers,
                 )
+                if response.status_code == 503:
+                    # A backend instance that does not compute them (yet)
+                    return
+                response.raise_for_status()
+                data = response.json()
+                generation, version = data["generation"], data["version"]
+                lists = {
+                    int(item_id): ",".join(str(rec_id) for rec_id in rec_ids)
+                    for item_id, rec_ids in data["items"].items()
+                }
+                full = data["full"]
+            except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+                logger.error(f"Error loading recommendations from admin API: {e}")
+                return
+        pipeline = self.redis_client.pipeline()
+        if full:
+            pipeline.delete(keys.RECS_KEY)
+        if lists:
+            pipeline.hset(keys.RECS_KEY, mapping=lists)
+        pipeline.set(keys.RECS_VERSION_KEY, f"{generation}:{version}")
+        pipeline.execute()
+        if lists:
+            logger.info(f"Stored recommendations of {len(lists)} items")
+
+    # ---------- RabbitMQ operations ---------- #
+    def _start_consuming_sync(self):
+        """
+        Consumes item updates, connecting lazily and reconnecting when the
+        connection is lost.
 
-        except json.JSONDecodeError as e:
-            logger.error(f"Error decoding JSON: {e}. Message body: {body}")
+        Changes published while the replica was disconnected went to its old,
+        now deleted, queue, so after every reconnect the catalog catches up
+        with the backend (after binding, so nothing falls in between).
+        """
+        while True:
+            try:
+                self.rabbit_client.ensure_connection()
+                self.set_item_consumption()
+                if self._catalog_loaded.is_set():
+                    self._catch_up()
+                self._consumer_ready.set()
+                self.rabbit_client.channel.start_consuming()
+            except Exception as e:
+                logger.error(f"An error occurred in Rabbit consumer: {e}")
+            self._consumer_ready.set()
+            time.sleep(DataStorage.RECONNECT_DELAY)
+
+    def _catch_up(self):
+        """Applies changes missed while disconnected, or resyncs the snapshot."""
+        with self._seq_lock:
+            since = self._catalog_seq
+            if since:
+                self._apply_changes_since(since)
+        if not since:
+            self.fetch_items_sync()
+
+    def _item_update_callback(self, ch, method, properties, body):
+        """
+        Callback function for handling catalog change messages from RabbitMQ.
+
+        Decodes the message (JSON or msgpack, depending on its content type),
+        validates it as a `CatalogEvent` and applies it in sequence order.
+
+        Args:
+            ch: The Pika channel object.
+            method: The Pika method frame.
+            properties: The Pika message properties.
+            body: The message body.
+        """
+        try:
+            if properties.content_type == "application/msgpack":
+                payload = msgpack.unpackb(body)
+            else:
+                payload = json.loads(body.decode())
+            event = CatalogEvent(**payload)
+            logger.info(
+                f"Received catalog event: {event.op} item with id={event.id}, "
+                f"seq={event.seq}"
+            )
+            self.apply_event(event)
+
+        except ValidationError as e:
+            logger.error(f"Error validating catalog event: {e}. Message body: {body}")
+        except (json.JSONDecodeError, ValueError) as e:
+            logger.error(f"Error decoding catalog event: {e}. Message body: {body}")
         except Exception as e:
             logger.error(f"An error occurred: {e}")
 
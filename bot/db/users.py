@@ -0,0 +1,47 @@
+from typing import List
+
+import redis
+
+from bot.db.cache import LRUCache
+from bot.db.keys import USERS_KEY
+
+
+class UserRegistry:
+    """
+    Users who started the bot or placed an order, the recipients of
+    broadcasts. A sorted set (`users`) scored by the user id itself, so
+    recipients can be read in stable chunks after any user id, also while
+    users are added or removed.
+
+    Users registered recently are remembered in process, so repeated
+    /start and checkouts do not write to Redis again.
+    """
+
+    def __init__(
+        self,
+        redis_client: redis.Redis,
+        cache_size: int = 10000,
+        cache_ttl: float = 3600,
+    ):
+        self.redis_client = redis_client
+        self._known = LRUCache(maxsize=cache_size, ttl=cache_ttl)
+
+    def add(self, user_id: int):
+        if self._known.get(user_id) is None:
+            self.redis_client.zadd(USERS_KEY, {user_id: user_id})
+            self._known.set(user_id, True)
+
+    def remove(self, user_id: int):
+        """Drops a user who blocked the bot or deleted their account."""
+        self.redis_client.zrem(USERS_KEY, user_id)
+        self._known.pop(user_id)
+
+    def count(self) -> int:
+        return self.redis_client.zcard(USERS_KEY)
+
+    def chunk(self, after: int, limit: int) -> List[int]:
+        """Up to `limit` user ids greater than `after`, in ascending order."""
+        user_ids = self.redis_client.zrangebyscore(
+            USERS_KEY, f"({after}", "+inf", start=0, num=limit
+        )
+        return [int(user_id) for user_id in user_ids]
@@ -2,11 +2,26 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.fsm.storage.base import DefaultKeyBuilder
+from aiogram.fsm.storage.redis import RedisStorage
 from aiogram.utils.callback_answer import CallbackAnswerMiddleware
-from bot.modules.middlewares import BotMiddleware
+from bot.modules.middlewares import (
+    BotMiddleware,
+    MetricsMiddleware,
+    ProfilerMiddleware,
+    StartupTimerMiddleware,
+    UserSerializationMiddleware,
+)
+from bot import config
+from bot.metrics import handler_metrics, start_metrics_server
+from bot.profiler import LoopLagMonitor, SamplingProfiler
+from bot.db.keys import FSM_PREFIX
+from bot.db.sessions import CachedStorage, SessionStore
 from bot.db.storage import data_storage
+from bot.modules.broadcast import BroadcastEngine
 from bot.modules.handlers import create_router
+from bot.modules.sender import SendSchedulerMiddleware, send_scheduler
+from bot.webhook import run_webhook
 
 
 logging.basicConfig(level=logging.INFO)
@@ -14,34 +29,93 @@ logger = logging.getLogger("bot")
 
 
 async def main():
-    from bot.config import BOT_TOKEN
-    bot = Bot(token=BOT_TOKEN)
-    storage: MemoryStorage = MemoryStorage()
+    bot = Bot(token=config.BOT_TOKEN)
+    bot.session.middleware(SendSchedulerMiddleware(send_scheduler))
+    storage = CachedStorage(
+        RedisStorage(
+            config.get_async_redis_client(),
+            key_builder=DefaultKeyBuilder(prefix=FSM_PREFIX),
+            state_ttl=config.FSM_STATE_TTL,
+            data_ttl=config.FSM_DATA_TTL,
+        ),
+        cache_size=config.SESSION_CACHE_SIZE,
+        cache_ttl=config.SESSION_CACHE_TTL,
+    )
     dp = Dispatcher(storage=storage)
+    startup_timer = StartupTimerMiddleware()
+    dp.update.outer_middleware(startup_timer)
+    user_serialization = UserSerializationMiddleware(
+        max_concurrency=config.UPDATE_MAX_CONCURRENCY,
+        timeout=config.UPDATE_TIMEOUT,
+        max_pending=config.UPDATE_MAX_PENDING_PER_USER,
+    )
+    dp.update.outer_middleware(user_serialization)
+    profiler = SamplingProfiler(
+        config.PROFILE_INTERVAL_MS / 1000, config.PROFILE_MAX_SECONDS
+    )
+    dp.update.outer_middleware(ProfilerMiddleware(profiler))
+    loop_monitor = None
+    if config.LOOP_LAG_THRESHOLD_MS:
+        loop_monitor = LoopLagMonitor(config.LOOP_LAG_THRESHOLD_MS / 1000)
+        handler_metrics.add_collector(loop_monitor.samples)
 
     dp.callback_query.middleware(CallbackAnswerMiddleware())
-    router = create_router(data_storage, bot=bot)
+    session_store = SessionStore(config.redis_client)
+    router = create_router(data_storage, bot=bot, session_store=session_store)
     router.message.middleware(BotMiddleware(bot))
     router.callback_query.middleware(BotMiddleware(bot))
+    metrics_middleware = MetricsMiddleware(handler_metrics, config.SLOW_UPDATE_MS)
+    router.message.middleware(metrics_middleware)
+    router.callback_query.middleware(metrics_middleware)
+    handler_metrics.add_collector(send_scheduler.samples)
+    handler_metrics.add_collector(startup_timer.samples)
+    handler_metrics.add_collector(user_serialization.samples)
+    handler_metrics.add_collector(data_storage.item_cache.samples)
     dp.include_router(router)
+    broadcaster = BroadcastEngine(bot, data_storage.users, config.redis_client)
+    metrics_runner = None
 
     async def on_startup(dispatcher):
         """
         runs right before polling start
         """
-        await data_storage.fetch_items()
+        nonlocal metrics_runner
+        if config.METRICS_PORT:
+            metrics_runner = await start_metrics_server(
+                handler_metrics,
+                config.METRICS_HOST,
+                config.METRICS_PORT,
+                profiler,
+                data_storage.reconcile,
+            )
+        if loop_monitor is not None:
+            loop_monitor.start()
+        await data_storage.start()
+        await broadcaster.start()
         logging.info("Bot started")
 
     async def on_shutdown(dispatcher):
         logging.warning("Shutting down..")
+        await broadcaster.close()
         await dispatcher.storage.close()
-        await dispatcher.storage.wait_closed()
+        await send_scheduler.close()
+        await data_storage.stop()
+        if loop_monitor is not None:
+            loop_monitor.stop()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
         logging.warning("Bye!")
 
     dp.startup.register(on_startup)
     dp.shutdown.register(on_shutdown)
 
+    if config.BOT_MODE == "webhook":
+        await run_webhook(dp, bot)
+        return
+
     try:
+        # Polling is meant for local development, a single process only
+        await bot.delete_webhook()
         await dp.start_polling(bot, skip_updates=True)
     finally:
         await bot.session.close()
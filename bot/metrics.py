@@ -0,0 +1,195 @@
+"""
+In-process metrics of the bot, exported in the Prometheus text format on a
+local endpoint.
+
+Redis commands and backend HTTP calls are counted per update: the handler
+middleware opens a counter in a context variable, and the Redis connection
+classes and httpx event hooks below increment it. Calls made outside of an
+update (the catalog consumer thread, startup) are not counted.
+"""
+
+import asyncio
+import bisect
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging import getLogger
+from typing import Any, Callable, Dict, Iterator, List, Sequence
+
+import httpx
+import redis
+import redis.asyncio
+from aiohttp import web
+
+from bot.profiler import SamplingProfiler, profile_handler
+
+logger = getLogger("bot")
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+CALL_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50)
+
+REDIS = "redis"
+BACKEND = "backend"
+
+_update_calls: ContextVar[Counter | None] = ContextVar("update_calls", default=None)
+
+
+def count_call(kind: str):
+    """Counts a Redis command or backend call against the current update."""
+    calls = _update_calls.get()
+    if calls is not None:
+        calls[kind] += 1
+
+
+@contextmanager
+def track_calls() -> Iterator[Counter]:
+    """Collects the calls made until exit, including in `asyncio.to_thread`."""
+    calls = Counter()
+    token = _update_calls.set(calls)
+    try:
+        yield calls
+    finally:
+        _update_calls.reset(token)
+
+
+class CountingConnection(redis.Connection):
+    """Redis connection counting replies, one per command (pipelines too)."""
+
+    def read_response(self, *args, **kwargs):
+        count_call(REDIS)
+        return super().read_response(*args, **kwargs)
+
+
+class AsyncCountingConnection(redis.asyncio.Connection):
+    """Asyncio counterpart of `CountingConnection`."""
+
+    async def read_response(self, *args, **kwargs):
+        count_call(REDIS)
+        return await super().read_response(*args, **kwargs)
+
+
+async def _count_backend_request(request: httpx.Request):
+    count_call(BACKEND)
+
+
+# Passed to the httpx clients talking to the admin API
+BACKEND_EVENT_HOOKS = {"request": [_count_backend_request]}
+
+
+class Histogram:
+    """Cumulative bucket histogram, as Prometheus expects it."""
+
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def render(self, name: str, labels: str) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {self.count}')
+        lines.append(f"{name}_sum{{{labels}}} {self.sum}")
+        lines.append(f"{name}_count{{{labels}}} {self.count}")
+        return lines
+
+
+class HandlerMetrics:
+    """
+    Per-handler latency, errors and Redis/backend calls per update.
+
+    Extra gauges (send queue, startup time) are added by collectors: callables
+    returning a mapping of sample name (with labels) to value.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latency: Dict[str, Histogram] = {}
+        self._calls: Dict[tuple[str, str], Histogram] = {}
+        self._errors: Counter = Counter()
+        self._collectors: List[Callable[[], Dict[str, float]]] = []
+
+    def observe(self, handler: str, seconds: float, calls: Counter, error: bool):
+        with self._lock:
+            latency = self._latency.setdefault(handler, Histogram(LATENCY_BUCKETS))
+            latency.observe(seconds)
+            for kind in (REDIS, BACKEND):
+                histogram = self._calls.setdefault(
+                    (handler, kind), Histogram(CALL_BUCKETS)
+                )
+                histogram.observe(calls[kind])
+            if error:
+                self._errors[handler] += 1
+
+    def add_collector(self, collector: Callable[[], Dict[str, float]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = ["# TYPE bot_handler_seconds histogram"]
+        with self._lock:
+            for handler, histogram in sorted(self._latency.items()):
+                lines += histogram.render("bot_handler_seconds", f'handler="{handler}"')
+            lines.append("# TYPE bot_update_calls histogram")
+            for (handler, kind), histogram in sorted(self._calls.items()):
+                labels = f'handler="{handler}",kind="{kind}"'
+                lines += histogram.render("bot_update_calls", labels)
+            lines.append("# TYPE bot_handler_errors_total counter")
+            for handler in sorted(self._latency):
+                errors = self._errors[handler]
+                lines.append(
+                    f'bot_handler_errors_total{{handler="{handler}"}} {errors}'
+                )
+        for collector in self._collectors:
+            try:
+                samples = collector()
+            except Exception as e:
+                logger.error(f"Metrics collector failed: {e}")
+                continue
+            lines += [f"{name} {value}" for name, value in samples.items()]
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(
+    registry: HandlerMetrics,
+    host: str,
+    port: int,
+    profiler: SamplingProfiler | None = None,
+    reconcile: Callable[[], Any] | None = None,
+) -> web.AppRunner:
+    """
+    Serves `GET /metrics` and, with a profiler, `GET /debug/profile`. With
+    `reconcile` (blocking, returns a report with `as_dict`), `POST
+    /debug/reconcile` runs it and returns the report. The caller cleans the
+    returned runner up.
+    """
+
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=registry.render(), content_type="text/plain")
+
+    async def handle_reconcile(request: web.Request) -> web.Response:
+        report = await asyncio.to_thread(reconcile)
+        return web.json_response(report.as_dict())
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    if profiler is not None:
+        app.router.add_get("/debug/profile", profile_handler(profiler))
+    if reconcile is not None:
+        app.router.add_post("/debug/reconcile", handle_reconcile)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host=host, port=port).start()
+    logger.info(f"Serving metrics on {host}:{port}/metrics")
+    return runner
+
+
+handler_metrics = HandlerMetrics()
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from collections import Counter
+from typing import Dict, List
+
+import httpx
+import redis
+from aiogram import Bot
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+
+from bot import config
+from bot.db.keys import broadcast_key, broadcast_lock_key
+from bot.db.users import UserRegistry
+from bot.metrics import BACKEND_EVENT_HOOKS
+from bot.modules.sender import Priority, priority
+
+logger = logging.getLogger("bot")
+
+SENT = "sent"
+FAILED = "failed"
+BLOCKED = "blocked"
+
+
+class BroadcastEngine:
+    """
+    Sends broadcast campaigns created in the admin panel to every registered
+    user.
+
+    Replicas poll the backend for active campaigns and one of them takes a
+    campaign by a lease in Redis, renewed while it sends. Recipients are
+    read from the `UserRegistry` in chunks; each chunk is sent by a pool of
+    `workers` in the BROADCAST lane of the `SendScheduler`, so broadcasts
+    stay within Telegram's global limit and never delay replies. After every
+    chunk the cursor (last user id sent) and the counters are stored in
+    Redis: when a replica dies, the lease expires and another one resumes
+    from the cursor, sending at most one chunk again. Users who blocked the
+    bot are removed from the registry. Progress is reported to the backend,
+    which answers with the campaign status, so a cancelled campaign stops.
+    """
+
+    # KEYS[1] - lease; ARGV[1] - owner token, ARGV[2] - lease seconds ('' releases)
+    RENEW_SCRIPT = """
+    if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+        return 0
+    end
+    if ARGV[2] == '' then
+        redis.call('DEL', KEYS[1])
+    else
+        redis.call('EXPIRE', KEYS[1], ARGV[2])
+    end
+    return 1
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        users: UserRegistry,
+        redis_client: redis.Redis,
+        chunk_size: int = config.BROADCAST_CHUNK_SIZE,
+        workers: int = config.BROADCAST_WORKERS,
+        lease: int = config.BROADCAST_LEASE,
+        poll_interval: float = config.BROADCAST_POLL_INTERVAL,
+        report_interval: float = config.BROADCAST_REPORT_INTERVAL,
+    ):
+        self.bot = bot
+        self.users = users
+        self.redis_client = redis_client
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self.report_interval = report_interval
+        self.token = uuid.uuid4().hex
+        self._renew = redis_client.register_script(self.RENEW_SCRIPT)
+        self._task: asyncio.Task | None = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._poll())
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _poll(self):
+        while True:
+            for campaign in await self._fetch_active():
+                try:
+                    await self.run(campaign["id"], campaign["text"])
+                except redis.RedisError as e:
+                    logger.error(f"Broadcast {campaign['id']} interrupted: {e}")
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self, broadcast_id: int, text: str) -> bool:
+        """
+        Sends a campaign to the users not reached yet, False if another
+        replica holds it or it was cancelled.
+        """
+        lock = broadcast_lock_key(broadcast_id)
+        if not self.redis_client.set(lock, self.token, nx=True, ex=self.lease):
+            return False
+        key = broadcast_key(broadcast_id)
+        try:
+            progress = self.redis_client.hgetall(key)
+            if not progress:
+                progress = {"cursor": 0, "total": self.users.count()}
+                self.redis_client.hset(key, mapping=progress)
+            cursor = int(progress["cursor"])
+            if progress.get("status") == "done":
+                user_ids = []
+            else:
+                user_ids = self.users.chunk(cursor, self.chunk_size)
+                logger.info(f"Broadcast {broadcast_id} sending after user {cursor}")
+            reported_at = 0.0
+            while user_ids:
+                if time.monotonic() - reported_at >= self.report_interval:
+                    reported_at = time.monotonic()
+                    status = await self._report(broadcast_id, key, done=False)
+                    if status == "cancelled":
+                        logger.info(f"Broadcast {broadcast_id} cancelled")
+                        return False
+                counts = await self._send_chunk(user_ids, text)
+                cursor = user_ids[-1]
+                pipeline = self.redis_client.pipeline()
+                pipeline.hset(key, "cursor", cursor)
+                for outcome, count in counts.items():
+                    pipeline.hincrby(key, outcome, count)
+                pipeline.execute()
+                if not self._renew(keys=[lock], args=[self.token, self.lease]):
+                    logger.warning(f"Broadcast {broadcast_id} lease lost, stopping")
+                    return False
+                user_ids = self.users.chunk(cursor, self.chunk_size)
+            self.redis_client.hset(key, "status", "done")
+            await self._report(broadcast_id, key, done=True)
+            return True
+        finally:
+            self._renew(keys=[lock], args=[self.token, ""])
+
+    async def _send_chunk(self, user_ids: List[int], text: str) -> Counter:
+        queue: asyncio.Queue[int] = asyncio.Queue()
+        for user_id in user_ids:
+            queue.put_nowait(user_id)
+        counts: Counter = Counter()
+
+        async def worker():
+            while not queue.empty():
+                counts[await self._send(queue.get_nowait(), text)] += 1
+
+        await asyncio.gather(
+            *(worker() for _ in range(min(self.workers, len(user_ids))))
+        )
+        return counts
+
+    async def _send(self, user_id: int, text: str) -> str:
+        try:
+            with priority(Priority.BROADCAST):
+                await self.bot.send_message(chat_id=user_id, text=text)
+            return SENT
+        except TelegramForbiddenError:
+            self.users.remove(user_id)
+            return BLOCKED
+        except TelegramBadRequest as e:
+            if "chat not found" in str(e):
+                self.users.remove(user_id)
+                return BLOCKED
+            logger.error(f"Failed to send broadcast to {user_id}: {e}")
+            return FAILED
+        except Exception as e:
+            logger.error(f"Failed to send broadcast to {user_id}: {e}")
+            return FAILED
+
+    async def _fetch_active(self) -> List[Dict]:
+        headers = {"X-API-Key": config.ADMIN_API_KEY}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+            try:
+                response = await client.get(
+                    f"{config.ADMIN_API_URL}/broadcasts/active", headers=headers
+                )
+                response.raise_for_status()
+                return response.json()
+            except (httpx.HTTPError, json.JSONDecodeError) as e:
+                logger.error(f"Error loading broadcasts from admin API: {e}")
+                return []
+
+    async def _report(self, broadcast_id: int, key: str, done: bool) -> str | None:
+        """Sends the progress to the backend, returns the campaign status."""
+        progress = self.redis_client.hgetall(key)
+        payload = {
+            name: int(progress.get(name, 0))
+            for name in ("total", SENT, FAILED, BLOCKED)
+        }
+        payload["done"] = done
+        headers = {"X-API-Key": config.ADMIN_API_KEY}
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
+            try:
+                response = await client.post(
+                    f"{config.ADMIN_API_URL}/broadcasts/{broadcast_id}/progress",
+                    json=payload,
+                    headers=headers,
+                )
+                response.raise_for_status()
+                return response.json()["status"]
+            except (httpx.HTTPError, json.JSONDecodeError, KeyError) as e:
+                logger.error(f"Error reporting broadcast {broadcast_id} progress: {e}")
+                return None
@@ -0,0 +1,18 @@
+from aiogram.filters.callback_data import CallbackData
+
+
+class CatalogCallback(CallbackData, prefix="catalog"):
+    """
+    Callback data of catalog navigation buttons.
+
+    The page to show travels with the button itself, so navigation needs no
+    server-side cursor and any bot replica can handle the tap. `version` is the
+    catalog sequence the button was rendered for, the same on every replica and
+    after restarts; 0 means "not tied to a version" (used by static keyboards
+    such as item details and cart). `popular` shows the catalog sorted by
+    popularity.
+    """
+
+    page: int = 0
+    version: int = 0
+    popular: bool = False
@@ -1,25 +1,42 @@
+import asyncio
 from dataclasses import dataclass
 import json
 import httpx
 from bot import config
+from bot.metrics import BACKEND_EVENT_HOOKS
 from pydantic import ValidationError
 from logging import getLogger
 from bot.db.schemas import Order
+from bot.db.sessions import SessionStore
+from bot.db.stock import OutOfStock
 from aiogram import F, Router, Bot
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import CommandStart
-from aiogram.types import Message, CallbackQuery
+from aiogram.types import (
+    Message,
+    CallbackQuery,
+    InlineQuery,
+    InlineQueryResultArticle,
+    InputTextMessageContent,
+)
+from aiogram.utils.callback_answer import CallbackAnswer
+from bot.modules.callbacks import CatalogCallback
+from bot.modules.notifications import ManagerNotifier
+from bot.modules.search import CatalogSearchIndex
 
 
 from bot.modules.keyboards import (
     main_menu_kb,
     contacts_inline_kb,
-    get_catalog_keyboard,
     get_item_details_keyboard,
-    get_cart_keyboard,
+    get_inline_item_keyboard,
+    cart_kb,
+    catalog_render_cache,
+    CatalogPage,
 )
 
 ITEMS_PER_PAGE = 3
-current_page = 0
+INLINE_RESULTS_PER_PAGE = 20
 
 logger = getLogger("bot")
 
@@ -31,36 +48,50 @@ class CustomFilters:
     CART = "Корзина"
 
 
-def create_router(data_storage, bot: Bot):
+def create_router(data_storage, bot: Bot, session_store: SessionStore):
     """
     Creates and configures the router for the Telegram bot.
 
     Args:
         data_storage: An instance of DataStorage for interacting with item data.
         bot: The aiogram Bot instance.
+        session_store: An instance of SessionStore for per-user session records.
         manager_chat_id: The chat ID of the manager to receive order notifications.
     Returns:
         The configured aiogram Router.
     """
     router = Router()
-
-    async def _notify_manager(bot: Bot, username: str = None, order_id: int = None):
-        """Sends a notification to the manager about a new order."""
-        try:
-            order_info_text = (
-                f"🔔 Новый заказ!\n\n"
-                f"- Пользователь: {f'@{username}' if username else 'Не указан'}\n"
-                f"- Номер заказа: {order_id if order_id else 'Не указан'}"
-            )
-            await bot.send_message(chat_id=config.MANAGER_USER_ID, text=order_info_text)
-            logger.info(
-                f"Successfully sent order notification to manager (user_id: {config.MANAGER_USER_ID})"
+    manager_notifier = ManagerNotifier(bot, config.MANAGER_USER_ID)
+    router.startup.register(manager_notifier.start)
+    router.shutdown.register(manager_notifier.close)
+    search_index = CatalogSearchIndex()
+    data_storage.add_catalog_listener(search_index)
+
+    async def _render_catalog(page: int, popular: bool = False) -> CatalogPage:
+        """Returns the cached catalog page, rendering it only on a cache miss."""
+        seq = data_storage.catalog_seq
+        version = data_storage.catalog_version
+        ranking = data_storage.ranking_version if popular else 0
+        catalog_page = catalog_render_cache.get(version, page, popular, seq, ranking)
+        if catalog_page is None:
+            items = await data_storage.get_all_items()
+            if popular:
+                items = data_storage.sort_by_popularity(items)
+            # Loading items may have bumped the version (e.g. first load from Redis)
+            catalog_page = catalog_render_cache.render(
+                data_storage.catalog_version, page, items, popular, seq, ranking
             )
-        except Exception as e:
-            logger.error(f"Failed to send order notification to manager: {e}")
+        return catalog_page
 
     @router.message(CommandStart())
     async def cmd_start(message: Message):
+        session_store.update(
+            message.from_user.id,
+            full_name=message.from_user.full_name,
+            username=message.from_user.username,
+            language_code=message.from_user.language_code,
+        )
+        data_storage.users.add(message.from_user.id)
         await message.answer(
             text=f"👋 Приветствуем в Design Studio, {message.from_user.full_name}!",
             reply_markup=main_menu_kb,
@@ -72,19 +103,19 @@ def create_router(data_storage, bot: Bot):
         cart_items = data_storage.get_cart_items(user_id)
 
         if not cart_items:
+            catalog_page = await _render_catalog(0)
             await message.answer(
                 "Ваша корзина пуста. 🛒 Добавьте товары из каталога",
-                reply_markup=get_catalog_keyboard(
-                    0, items=await data_storage.get_all_items()
-                ),
+                reply_markup=catalog_page.markup,
             )
             return
         else:
             cart_item_names = [
-                f"- {item['name']} (Цена: {item['price']})" for item in cart_items
+                f"- {item['name']} x{item['qty']} (Цена: {item['price']})"
+                for item in cart_items
             ]
             cart_text = "🛒 Ваша корзина:\n" + "\n".join(cart_item_names)
-            await message.answer(cart_text, reply_markup=get_cart_keyboard(user_id))
+            await message.answer(cart_text, reply_markup=cart_kb)
 
     @router.message(F.text == CustomFilters.CONTACTS)
     async def cmd_contacts(message: Message):
@@ -92,81 +123,153 @@ def create_router(data_storage, bot: Bot):
 
     @router.message(F.text == CustomFilters.CATALOG)
     async def cmd_catalog(message: Message):
-        global current_page
-        current_page = 0
-        items = await data_storage.get_all_items()
-        keyboard = get_catalog_keyboard(current_page, items=items)
-        total_pages = await data_storage.calculate_total_pages(items)
-        catalog_message_text = (
-            f"🌟 Наши услуги 🌟\n\n"
-            "Выберите услугу или используйте кнопки для навигации.\n\n"
-            f"Страница {current_page + 1} из {total_pages}"
-        )
-        await message.answer(catalog_message_text, reply_markup=keyboard)
+        catalog_page = await _render_catalog(0)
+        await message.answer(catalog_page.intro_text, reply_markup=catalog_page.markup)
 
     @router.callback_query(F.data.startswith("item_"))
-    async def view_item_details(callback_query: CallbackQuery):
+    async def view_item_details(
+        callback_query: CallbackQuery, callback_answer: CallbackAnswer
+    ):
         item_id = int(callback_query.data.split("_")[1])
-        item_key = f"item:{item_id}"
-        item = data_storage.redis_client.get(item_key)
-        item = json.loads(item)
-        user_id = callback_query.from_user.id
-        keyboard = get_item_details_keyboard(item_id=item_id, user_id=user_id)
-        await callback_query.message.answer(
+        item = data_storage.get_item(item_id)
+        if item is None:
+            # Deleted since the button was shown (catalog, "also bought", search)
+            callback_answer.text = "⚠️ Товар больше не доступен"
+            return
+        also_bought = tuple(
+            (rec["id"], rec["name"]) for rec in data_storage.get_also_bought(item_id)
+        )
+        keyboard = get_item_details_keyboard(item_id, also_bought)
+        text = (
             f"📋 {item['name']}\n"
             f"💰 Цена: от {item['price']}\n"
-            f"📝 Описание: {item['description']}",
-            reply_markup=keyboard,
+            f"📝 Описание: {item['description']}"
         )
-
-    @router.callback_query(F.data.in_(["next_page", "prev_page", "back_to_catalog"]))
-    async def handle_navigation(callback_query: CallbackQuery):
-        global current_page
-        if callback_query.data == "next_page":
-            current_page += 1
-        elif callback_query.data == "prev_page":
-            current_page -= 1
-        elif callback_query.data == "back_to_catalog":
-            current_page = 0  # Return to first page
-        items = await data_storage.get_all_items()
-        keyboard = get_catalog_keyboard(current_page, items=items)
-        total_pages = await data_storage.calculate_total_pages(items)
-        catalog_text = (
-            f"🌟 Каталог услуг 🌟\n\n(Страница {current_page + 1} из {total_pages})"
+        stock = data_storage.get_stock(item_id)
+        if stock is not None:
+            text += (
+                f"\n📦 В наличии: {stock} шт." if stock > 0 else "\n📦 Нет в наличии"
+            )
+        if also_bought:
+            text += "\n\n🤝 С этим также покупают:"
+        await callback_query.message.answer(text, reply_markup=keyboard)
+        data_storage.record_view(item_id, callback_query.from_user.id)
+
+    @router.inline_query()
+    async def inline_search(inline_query: InlineQuery):
+        # Answered from memory only: inline queries arrive on every keystroke
+        offset = int(inline_query.offset) if inline_query.offset.isdigit() else 0
+        items, next_offset = search_index.page(
+            inline_query.query, offset, INLINE_RESULTS_PER_PAGE
+        )
+        results = [
+            InlineQueryResultArticle(
+                id=str(item["id"]),
+                title=f"{item['name']} - ${item['price']}",
+                description=item["description"],
+                input_message_content=InputTextMessageContent(
+                    message_text=f"📋 {item['name']}\n"
+                    f"💰 Цена: от {item['price']}\n"
+                    f"📝 Описание: {item['description']}"
+                ),
+                reply_markup=get_inline_item_keyboard(item["id"]),
+            )
+            for item in items
+        ]
+        await inline_query.answer(
+            results,
+            cache_time=config.INLINE_CACHE_TIME,
+            is_personal=False,
+            next_offset=next_offset,
         )
-        await callback_query.message.edit_text(catalog_text, reply_markup=keyboard)
+
+    @router.callback_query(CatalogCallback.filter())
+    async def handle_navigation(
+        callback_query: CallbackQuery,
+        callback_data: CatalogCallback,
+        callback_answer: CallbackAnswer,
+    ):
+        catalog_page = await _render_catalog(callback_data.page, callback_data.popular)
+        version = callback_data.version
+        if version and version < data_storage.catalog_seq:
+            # Button was rendered for an older catalog: show the current one instead
+            callback_answer.text = "Каталог обновлён 🔄"
+        try:
+            await callback_query.message.edit_text(
+                catalog_page.nav_text, reply_markup=catalog_page.markup
+            )
+        except TelegramBadRequest as e:
+            # Repeated or stale taps may render exactly what is already shown
+            if "message is not modified" not in str(e):
+                raise
 
     @router.callback_query(F.data.startswith("add_to_cart_"))
-    async def add_to_cart(callback_query: CallbackQuery):
+    async def add_to_cart(
+        callback_query: CallbackQuery, callback_answer: CallbackAnswer
+    ):
         user_id = callback_query.from_user.id
         item_id = int(callback_query.data.split("_")[-1])
 
-        if data_storage.is_item_in_cart(user_id, item_id):
-            await callback_query.answer("⚠️ Уже в корзине")
+        item = data_storage.get_item(item_id)
+        if item is None:
+            callback_answer.text = "⚠️ Товар больше не доступен"
+            return
 
-        data_storage.add_to_cart(user_id, item_id)
-        await callback_query.answer("✅ Добавлено в корзину")
+        try:
+            qty = data_storage.add_to_cart(user_id, item)
+        except OutOfStock as e:
+            callback_answer.text = (
+                f"⚠️ Осталось только {e.available} шт."
+                if e.available
+                else "⚠️ Товар закончился"
+            )
+            return
+        data_storage.record_add_to_cart(item_id)
+        if qty == 1:
+            callback_answer.text = "✅ Добавлено в корзину"
+        else:
+            callback_answer.text = f"✅ Добавлено, в корзине {qty} шт."
 
     @router.callback_query(F.data.startswith("clear_cart"))
-    async def clear_cart(callback_query: CallbackQuery):
+    async def clear_cart(
+        callback_query: CallbackQuery, callback_answer: CallbackAnswer
+    ):
         user_id = callback_query.from_user.id
         data_storage.clear_cart(user_id)
-        await callback_query.answer("Корзина очищена 👌")
+        callback_answer.text = "Корзина очищена 👌"
 
     @router.callback_query(F.data.startswith("checkout"))
-    async def send_order(callback_query: CallbackQuery):
+    async def send_order(
+        callback_query: CallbackQuery, callback_answer: CallbackAnswer
+    ):
         user_id = callback_query.from_user.id
-        cart_items: list[dict] = data_storage.get_cart_items(user_id)
+        # Takes the items out of the cart, a concurrent tap gets an empty cart
+        try:
+            cart_items: list[dict] = data_storage.checkout_cart(user_id)
+        except OutOfStock as e:
+            # The rest of the cart is kept, the user can check it out again
+            names = []
+            for item in data_storage.get_cart_items(user_id):
+                if item["id"] in e.item_ids:
+                    data_storage.remove_from_cart(user_id, item["id"])
+                    names.append(item["name"])
+            sold_out = ", ".join(names)
+            callback_answer.text = f"⚠️ Закончились и убраны из корзины: {sold_out}"
+            callback_answer.show_alert = True
+            return
 
         if not cart_items:
-            await callback_query.answer("Ваша корзина пуста!", show_alert=True)
+            callback_answer.text = "Ваша корзина пуста!"
+            callback_answer.show_alert = True
             return
 
         order_items_details = []
         total_price = 0
         for item in cart_items:
-            order_items_details.append({"name": item["name"], "price": item["price"]})
-            total_price += float(item["price"])
+            order_items_details.append(
+                {"name": item["name"], "price": item["price"], "qty": item["qty"]}
+            )
+            total_price += float(item["price"]) * item["qty"]
 
         order_data = {
             "user_id": user_id,
@@ -175,39 +278,47 @@ def create_router(data_storage, bot: Bot):
             "total_price": total_price,
         }
 
-        await _validate_order(order_data)
-
         try:
+            await _validate_order(order_data)
             order_id = await _post_order(order_data)
+        except asyncio.CancelledError:
+            # Update timed out or the bot is stopping: keep the cart for a retry
+            data_storage.restore_cart(user_id, cart_items)
+            raise
         except Exception as exc:
             logger.error(f"Failed to process order: {exc}")
-            await callback_query.answer(
-                "Произошла ошибка при оформлении заказа. Попробуйте позже.",
-                show_alert=True,
+            data_storage.restore_cart(user_id, cart_items)
+            callback_answer.text = (
+                "Произошла ошибка при оформлении заказа. Попробуйте позже."
             )
+            callback_answer.show_alert = True
             return
 
-        data_storage.clear_cart(user_id=user_id)
-
         order_text = "📦 Ваш заказ принят!\n\n"
         for item_detail in order_items_details:
-            order_text += f"- {item_detail['name']} ({item_detail['price']})\n"
+            order_text += (
+                f"- {item_detail['name']} x{item_detail['qty']} "
+                f"({item_detail['price']})\n"
+            )
         order_text += f"\nИтого: ${total_price}"
 
-        await _notify_manager(
-            bot, username=callback_query.from_user.username, order_id=order_id
+        data_storage.users.add(user_id)
+        manager_notifier.notify(
+            username=callback_query.from_user.username,
+            order_id=order_id,
+            total_price=total_price,
         )
 
         await callback_query.message.answer(order_text)
-        await callback_query.answer(
-            text="Заказ принят в работу 👌 Менеджер свяжется с вами в ближайшее время",
-            show_alert=True,
+        callback_answer.text = (
+            "Заказ принят в работу 👌 Менеджер свяжется с вами в ближайшее время"
         )
+        callback_answer.show_alert = True
 
     async def _post_order(order_data: dict) -> int | None:
         """Posts the order data to the backend API and returns the order_id."""
         headers = {"X-API-Key": config.ADMIN_API_KEY}
-        async with httpx.AsyncClient() as client:
+        async with httpx.AsyncClient(event_hooks=BACKEND_EVENT_HOOKS) as client:
             try:
                 response = await client.post(
                     f"{config.ADMIN_API_URL}/order/", json=order_data, headers=headers
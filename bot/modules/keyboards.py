@@ -1,4 +1,7 @@
-from typing import Dict
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Tuple
 from aiogram.types import (
     ReplyKeyboardMarkup,
     KeyboardButton,
@@ -6,6 +9,8 @@ from aiogram.types import (
     InlineKeyboardButton,
 )
 
+from bot.modules.callbacks import CatalogCallback
+
 
 main_menu_kb = ReplyKeyboardMarkup(
     keyboard=[
@@ -26,7 +31,11 @@ contacts_inline_kb = InlineKeyboardMarkup(
 
 
 def get_catalog_keyboard(
-    page: int, items: list[Dict], items_per_page: int = 3
+    page: int,
+    items: list[Dict],
+    items_per_page: int = 3,
+    version: int = 0,
+    popular: bool = False,
 ) -> InlineKeyboardMarkup:
     total_pages = (len(items) + items_per_page - 1) // items_per_page
     keyboard = []
@@ -48,19 +57,138 @@ def get_catalog_keyboard(
     nav_row = []
     if page > 0:
         nav_row.append(
-            InlineKeyboardButton(text="⬅️ Предыдущая", callback_data="prev_page")
+            InlineKeyboardButton(
+                text="⬅️ Предыдущая",
+                callback_data=CatalogCallback(
+                    page=page - 1, version=version, popular=popular
+                ).pack(),
+            )
         )
     if page < total_pages - 1:
         nav_row.append(
-            InlineKeyboardButton(text="Следующая ➡️", callback_data="next_page")
+            InlineKeyboardButton(
+                text="Следующая ➡️",
+                callback_data=CatalogCallback(
+                    page=page + 1, version=version, popular=popular
+                ).pack(),
+            )
         )
     if nav_row:
         keyboard.append(nav_row)
 
+    # Switches the sort order, back to the first page
+    keyboard.append(
+        [
+            InlineKeyboardButton(
+                text="🔤 Обычный порядок" if popular else "🔥 Сначала популярные",
+                callback_data=CatalogCallback(
+                    version=version, popular=not popular
+                ).pack(),
+            )
+        ]
+    )
+
     return InlineKeyboardMarkup(inline_keyboard=keyboard)
 
 
-def get_item_details_keyboard(item_id: int, user_id) -> InlineKeyboardMarkup:
+@dataclass(frozen=True)
+class CatalogPage:
+    """Ready-made catalog page: markup plus both message texts that show it."""
+
+    page: int
+    total_pages: int
+    markup: InlineKeyboardMarkup
+    intro_text: str
+    nav_text: str
+
+
+class CatalogRenderCache:
+    """
+    Caches rendered catalog pages keyed by (catalog version, page, page size,
+    sort order).
+
+    Only pages of the newest catalog version seen are kept: as soon as a lookup
+    arrives with a different version the whole cache is dropped, so memory is
+    bounded by the number of pages in one catalog. The version is the local
+    one together with the catalog sequence the buttons are rendered for.
+    Pages sorted by popularity also keep the popularity ranking they were
+    sorted by, a new ranking replaces them without touching the others.
+    """
+
+    def __init__(self, items_per_page: int = 3):
+        self.items_per_page = items_per_page
+        self._version: Tuple[int, int] | None = None
+        # Page key -> (ranking, page), ranking is 0 for unsorted pages
+        self._pages: Dict[Tuple[int, int, bool], Tuple[int, CatalogPage]] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        version: int,
+        page: int,
+        popular: bool = False,
+        seq: int = 0,
+        ranking: int = 0,
+    ) -> CatalogPage | None:
+        with self._lock:
+            if (version, seq) != self._version:
+                return None
+            cached = self._pages.get((page, self.items_per_page, popular))
+            if cached is None or cached[0] != ranking:
+                return None
+            return cached[1]
+
+    def render(
+        self,
+        version: int,
+        page: int,
+        items: list[Dict],
+        popular: bool = False,
+        seq: int = 0,
+        ranking: int = 0,
+    ) -> CatalogPage:
+        """
+        Builds the page for `items` (already in the order of `popular`, by
+        `ranking`) with buttons tied to catalog sequence `seq`, stores it
+        under `version` and returns it.
+        """
+        total_pages = (len(items) + self.items_per_page - 1) // self.items_per_page
+        page = max(0, min(page, total_pages - 1))
+        catalog_page = CatalogPage(
+            page=page,
+            total_pages=total_pages,
+            markup=get_catalog_keyboard(page, items, self.items_per_page, seq, popular),
+            intro_text=(
+                "🌟 Наши услуги 🌟\n\n"
+                "Выберите услугу или используйте кнопки для навигации.\n\n"
+                f"Страница {page + 1} из {total_pages}"
+            ),
+            nav_text=f"🌟 Каталог услуг 🌟\n\n(Страница {page + 1} из {total_pages})",
+        )
+        with self._lock:
+            if (version, seq) != self._version:
+                self._version = (version, seq)
+                self._pages = {}
+            self._pages[(page, self.items_per_page, popular)] = (ranking, catalog_page)
+        return catalog_page
+
+    def clear(self):
+        with self._lock:
+            self._version = None
+            self._pages = {}
+
+
+catalog_render_cache = CatalogRenderCache()
+
+
+@lru_cache(maxsize=4096)
+def get_item_details_keyboard(
+    item_id: int, also_bought: Tuple[Tuple[int, str], ...] = ()
+) -> InlineKeyboardMarkup:
+    """
+    `also_bought` are (id, name) of items bought together with this one.
+    Does not depend on the user, so every item keyboard is built only once.
+    """
     return InlineKeyboardMarkup(
         inline_keyboard=[
             [
@@ -68,28 +196,47 @@ def get_item_details_keyboard(item_id: int, user_id) -> InlineKeyboardMarkup:
                     text="🛒 В корзину", callback_data=f"add_to_cart_{item_id}"
                 )
             ],
+            *(
+                [
+                    InlineKeyboardButton(
+                        text=f"🤝 {name}", callback_data=f"item_{rec_id}"
+                    )
+                ]
+                for rec_id, name in also_bought
+            ),
             [
                 InlineKeyboardButton(
-                    text="🔙 Назад к каталогу", callback_data="back_to_catalog"
+                    text="🔙 Назад к каталогу",
+                    callback_data=CatalogCallback(page=0).pack(),
                 )
             ],
         ]
     )
 
 
-def get_cart_keyboard(user_id: int) -> InlineKeyboardMarkup:
+@lru_cache(maxsize=4096)
+def get_inline_item_keyboard(item_id: int) -> InlineKeyboardMarkup:
+    # Messages sent via inline mode have no catalog to go back to
     return InlineKeyboardMarkup(
         inline_keyboard=[
-            [InlineKeyboardButton(text="🛍 Оформить заказ", callback_data="checkout")],
-            [
-                InlineKeyboardButton(
-                    text="🗑 Очистить корзину", callback_data="clear_cart}"
-                )
-            ],
             [
                 InlineKeyboardButton(
-                    text="🔙 Вернуться к каталогу", callback_data="back_to_catalog"
+                    text="🛒 В корзину", callback_data=f"add_to_cart_{item_id}"
                 )
-            ],
+            ]
         ]
     )
+
+
+cart_kb = InlineKeyboardMarkup(
+    inline_keyboard=[
+        [InlineKeyboardButton(text="🛍 Оформить заказ", callback_data="checkout")],
+        [InlineKeyboardButton(text="🗑 Очистить корзину", callback_data="clear_cart")],
+        [
+            InlineKeyboardButton(
+                text="🔙 Вернуться к каталогу",
+                callback_data=CatalogCallback(page=0).pack(),
+            )
+        ],
+    ]
+)
@@ -1,9 +1,18 @@
+import asyncio
+import os
+import time
+from logging import getLogger
 from typing import Callable, Dict, Any, Awaitable
 
 from aiogram import BaseMiddleware
 from aiogram.types import TelegramObject
 from aiogram import Bot
 
+from bot.metrics import BACKEND, REDIS, HandlerMetrics, track_calls
+from bot.profiler import SamplingProfiler
+
+logger = getLogger("bot")
+
 
 class BotMiddleware(BaseMiddleware):
     """
@@ -21,3 +30,181 @@ class BotMiddleware(BaseMiddleware):
     ) -> Any:
         data["bot"] = self.bot
         return await handler(event, data)
+
+
+def process_started_at() -> float:
+    """
+    Process start time on the `time.monotonic()` clock, so interpreter start
+    and imports are measured too. Falls back to "now" where /proc is missing.
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            # Fields after the command name, starttime is the 22nd field overall
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+        return time.monotonic() - (uptime - start_ticks / os.sysconf("SC_CLK_TCK"))
+    except (OSError, ValueError, IndexError):
+        return time.monotonic()
+
+
+class StartupTimerMiddleware(BaseMiddleware):
+    """
+    Outer update middleware that reports the time from process start to the
+    first answered update, the end-to-end cold start cost of the bot.
+    """
+
+    def __init__(self, started_at: float | None = None):
+        self.started_at = started_at if started_at is not None else process_started_at()
+        self.time_to_first_update: float | None = None
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        result = await handler(event, data)
+        if self.time_to_first_update is None:
+            self.time_to_first_update = time.monotonic() - self.started_at
+            logger.info(
+                f"First update answered {self.time_to_first_update:.3f}s after start"
+            )
+        return result
+
+    def samples(self) -> Dict[str, float]:
+        """Metrics collector, empty until the first update is answered."""
+        if self.time_to_first_update is None:
+            return {}
+        return {"bot_time_to_first_update_seconds": self.time_to_first_update}
+
+
+class ProfilerMiddleware(BaseMiddleware):
+    """Outer update middleware counting handled updates for update-bound profiles."""
+
+    def __init__(self, profiler: SamplingProfiler):
+        self.profiler = profiler
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            self.profiler.record_request()
+
+
+class MetricsMiddleware(BaseMiddleware):
+    """
+    Handler middleware recording latency, errors and Redis/backend calls per
+    update into `HandlerMetrics`, and logging updates slower than `slow_ms`.
+    """
+
+    def __init__(self, registry: HandlerMetrics, slow_ms: float):
+        self.registry = registry
+        self.slow_ms = slow_ms
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        name = data["handler"].callback.__name__
+        started = time.perf_counter()
+        error = False
+        with track_calls() as calls:
+            try:
+                return await handler(event, data)
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                self.registry.observe(name, elapsed, calls, error)
+                if elapsed * 1000 >= self.slow_ms:
+                    logger.warning(
+                        f"Slow update in {name}: {elapsed * 1000:.0f}ms, "
+                        f"redis={calls[REDIS]} backend={calls[BACKEND]}"
+                    )
+
+
+class _UserSlot:
+    __slots__ = ("lock", "pending")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.pending = 0
+
+
+class UserSerializationMiddleware(BaseMiddleware):
+    """
+    Outer update middleware running the updates of one user in arrival order,
+    while updates of different users run in parallel.
+
+    Each user with updates in flight has a lock that is dropped as soon as the
+    user goes idle, so memory stays bounded by the active users. At most
+    `max_concurrency` updates are handled at a time, each for at most
+    `timeout` seconds, and updates beyond `max_pending` queued for one user
+    (tap spam) are dropped.
+    """
+
+    def __init__(self, max_concurrency: int, timeout: float, max_pending: int = 10):
+        self.timeout = timeout
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._users: Dict[int, _UserSlot] = {}
+        self.in_flight = 0
+        self.timeouts = 0
+        self.dropped = 0
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        if user is None:
+            return await self._handle(handler, event, data)
+
+        slot = self._users.get(user.id)
+        if slot is None:
+            slot = self._users[user.id] = _UserSlot()
+        if slot.pending >= self.max_pending:
+            self.dropped += 1
+            logger.warning(f"Dropping update from user {user.id}: too many queued")
+            return None
+        slot.pending += 1
+        try:
+            async with slot.lock:
+                return await self._handle(handler, event, data)
+        finally:
+            slot.pending -= 1
+            if not slot.pending:
+                del self._users[user.id]
+
+    async def _handle(self, handler, event, data) -> Any:
+        async with self._semaphore:
+            self.in_flight += 1
+            try:
+                async with asyncio.timeout(self.timeout):
+                    return await handler(event, data)
+            except TimeoutError:
+                self.timeouts += 1
+                logger.error(f"Update timed out after {self.timeout}s")
+                return None
+            finally:
+                self.in_flight -= 1
+
+    def samples(self) -> Dict[str, float]:
+        """Metrics collector, see `HandlerMetrics.add_collector`."""
+        return {
+            "bot_updates_in_flight": self.in_flight,
+            "bot_active_users": len(self._users),
+            "bot_update_timeouts_total": self.timeouts,
+            "bot_updates_dropped_total": self.dropped,
+        }
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import Counter, deque
+from typing import Deque
+
+from aiogram import Bot
+
+from bot import config
+from bot.modules.sender import Priority, priority
+
+logger = logging.getLogger("bot")
+
+
+class OrderDigest:
+    """Bounded roll-up of orders waiting to be reported in one message."""
+
+    MAX_HANDLES = 20
+
+    def __init__(self):
+        self.count = 0
+        self.total_price = 0.0
+        self.handles: Counter = Counter()
+        self.anonymous = 0
+
+    def add(self, username: str | None, total_price: float):
+        self.count += 1
+        self.total_price += total_price
+        if not username:
+            self.anonymous += 1
+        elif username in self.handles or len(self.handles) < self.MAX_HANDLES:
+            self.handles[username] += 1
+
+    def render(self) -> str:
+        users = ", ".join(
+            f"@{handle}" + (f" ({count})" if count > 1 else "")
+            for handle, count in self.handles.most_common()
+        )
+        shown = sum(self.handles.values()) + self.anonymous
+        if shown < self.count:
+            users += f" и ещё {self.count - shown}"
+        if self.anonymous:
+            users += f", без username: {self.anonymous}"
+        return (
+            f"🔔 Новые заказы: {self.count}\n\n"
+            f"- Сумма: {self.total_price:.2f}\n"
+            f"- Пользователи: {users.strip(', ')}"
+        )
+
+
+class ManagerNotifier:
+    """
+    Reports new orders to the manager outside of the checkout path.
+
+    While orders come in slower than `threshold` per minute every order is
+    reported with its own message. Above that, orders are rolled up into an
+    `OrderDigest` that is sent every `interval` seconds. Pending messages and
+    the digest are bounded and flushed on shutdown.
+    """
+
+    def __init__(
+        self,
+        bot: Bot,
+        chat_id: int | str | None,
+        threshold: int = config.MANAGER_DIGEST_THRESHOLD,
+        interval: float = config.MANAGER_DIGEST_INTERVAL,
+        max_pending: int = 100,
+    ):
+        self.bot = bot
+        self.chat_id = chat_id
+        self.threshold = threshold
+        self.interval = interval
+        self._recent: Deque[float] = deque()
+        self._digest = OrderDigest()
+        self._messages: asyncio.Queue[str] = asyncio.Queue(maxsize=max_pending)
+        self._tasks: list[asyncio.Task] = []
+
+    def notify(self, username: str | None, order_id: int, total_price: float):
+        """Registers a new order, never waits for Telegram."""
+        now = time.monotonic()
+        self._recent.append(now)
+        while self._recent and self._recent[0] < now - 60:
+            self._recent.popleft()
+
+        if len(self._recent) <= self.threshold and not self._digest.count:
+            try:
+                self._messages.put_nowait(
+                    f"🔔 Новый заказ!\n\n"
+                    f"- Пользователь: {f'@{username}' if username else 'Не указан'}\n"
+                    f"- Номер заказа: {order_id if order_id else 'Не указан'}"
+                )
+                return
+            except asyncio.QueueFull:
+                pass
+        self._digest.add(username, total_price)
+
+    async def start(self):
+        self._tasks = [
+            asyncio.create_task(self._send_messages()),
+            asyncio.create_task(self._flush_periodically()),
+        ]
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        self._roll_digest()
+        while not self._messages.empty():
+            await self._send(self._messages.get_nowait())
+
+    def _roll_digest(self):
+        if not self._digest.count:
+            return
+        digest, self._digest = self._digest, OrderDigest()
+        try:
+            self._messages.put_nowait(digest.render())
+        except asyncio.QueueFull:
+            # Keep the orders for the next digest rather than losing them
+            self._digest = digest
+
+    async def _flush_periodically(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self._roll_digest()
+
+    async def _send_messages(self):
+        while True:
+            await self._send(await self._messages.get())
+
+    async def _send(self, text: str):
+        try:
+            with priority(Priority.NOTIFICATION):
+                await self.bot.send_message(chat_id=self.chat_id, text=text)
+            logger.info(
+                f"Successfully sent order notification to manager (user_id: {self.chat_id})"
+            )
+        except Exception as e:
+            logger.error(f"Failed to send order notification to manager: {e}")
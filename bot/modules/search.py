@@ -0,0 +1,182 @@
+import re
+import threading
+from collections import defaultdict
+from typing import Dict, Iterable, List, Set, Tuple
+
+from bot.db.cache import LRUCache
+
+
+def tokenize(text: str | None) -> List[str]:
+    """Lowercased words of `text`, "ё" folded to "е" as users rarely type it."""
+    if not text:
+        return []
+    return re.findall(r"\w+", text.casefold().replace("ё", "е"))
+
+
+def trigrams(word: str) -> Set[str]:
+    padded = f" {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class CatalogSearchIndex:
+    """
+    In-memory search over item names and descriptions.
+
+    Every word is indexed by its prefixes, so results appear while the query
+    is being typed, and by trigrams, so misspelled words and word parts still
+    match. All query words must match; matches in the name and whole-word
+    prefix matches rank higher. Ranked results are cached per (query, index
+    version), any catalog change bumps the version.
+
+    The index is a catalog listener of `DataStorage`: it is rebuilt when the
+    whole catalog is loaded and updated incrementally on item changes.
+    """
+
+    MAX_PREFIX = 12
+    MIN_TRIGRAM_SIMILARITY = 0.35
+    NAME_WEIGHT = 3.0
+    DESCRIPTION_WEIGHT = 1.0
+    FUZZY_WEIGHT = 0.5
+
+    def __init__(self, cache_size: int = 1000):
+        self._lock = threading.Lock()
+        self._items: Dict[int, Dict] = {}
+        # item_id -> (name words, description words)
+        self._words: Dict[int, Tuple[Set[str], Set[str]]] = {}
+        self._prefixes: Dict[str, Set[int]] = defaultdict(set)
+        self._trigrams: Dict[str, Set[str]] = defaultdict(set)
+        self._word_items: Dict[str, Set[int]] = defaultdict(set)
+        self._order: List[int] = []
+        self.version = 0
+        self._results = LRUCache(maxsize=cache_size)
+
+    # ---------- Catalog listener ---------- #
+    def rebuild(self, items: Iterable[Dict]):
+        with self._lock:
+            self._items.clear()
+            self._words.clear()
+            self._prefixes.clear()
+            self._trigrams.clear()
+            self._word_items.clear()
+            for item in items:
+                self._add(item)
+            self._changed()
+
+    def upsert(self, item: Dict):
+        with self._lock:
+            self._remove(item["id"])
+            self._add(item)
+            self._changed()
+
+    def remove(self, item_id: int):
+        with self._lock:
+            if self._remove(item_id):
+                self._changed()
+
+    def _add(self, item: Dict):
+        name_words = set(tokenize(item.get("name")))
+        description_words = set(tokenize(item.get("description")))
+        self._items[item["id"]] = item
+        self._words[item["id"]] = (name_words, description_words)
+        for word in name_words | description_words:
+            for length in range(1, min(len(word), self.MAX_PREFIX) + 1):
+                self._prefixes[word[:length]].add(item["id"])
+            if not self._word_items[word]:
+                for trigram in trigrams(word):
+                    self._trigrams[trigram].add(word)
+            self._word_items[word].add(item["id"])
+
+    def _remove(self, item_id: int) -> bool:
+        if item_id not in self._items:
+            return False
+        del self._items[item_id]
+        name_words, description_words = self._words.pop(item_id)
+        for word in name_words | description_words:
+            for length in range(1, min(len(word), self.MAX_PREFIX) + 1):
+                self._prefixes[word[:length]].discard(item_id)
+                if not self._prefixes[word[:length]]:
+                    del self._prefixes[word[:length]]
+            self._word_items[word].discard(item_id)
+            if not self._word_items[word]:
+                del self._word_items[word]
+                for trigram in trigrams(word):
+                    self._trigrams[trigram].discard(word)
+                    if not self._trigrams[trigram]:
+                        del self._trigrams[trigram]
+        return True
+
+    def _changed(self):
+        self.version += 1
+        self._order = sorted(
+            self._items, key=lambda item_id: self._items[item_id]["name"]
+        )
+        self._results.clear()
+
+    # ---------- Queries ---------- #
+    def search(self, query: str) -> List[Dict]:
+        """Items matching every word of `query`, best first."""
+        words = tokenize(query)
+        key = (" ".join(words), self.version)
+        ranked = self._results.get(key)
+        if ranked is None:
+            with self._lock:
+                ranked = self._rank(words)
+            self._results.set(key, ranked)
+        return ranked
+
+    def page(self, query: str, offset: int, limit: int) -> Tuple[List[Dict], str]:
+        """One page of results and the `next_offset` for Telegram ("" at the end)."""
+        ranked = self.search(query)
+        next_offset = str(offset + limit) if offset + limit < len(ranked) else ""
+        return ranked[offset : offset + limit], next_offset
+
+    def _rank(self, words: List[str]) -> List[Dict]:
+        if not words:
+            return [self._items[item_id] for item_id in self._order]
+
+        scores: Dict[int, float] = {}
+        for position, word in enumerate(words):
+            word_scores = self._score_word(word)
+            if position == 0:
+                scores = word_scores
+            else:
+                scores = {
+                    item_id: score + word_scores[item_id]
+                    for item_id, score in scores.items()
+                    if item_id in word_scores
+                }
+            if not scores:
+                return []
+        ranked = sorted(
+            scores, key=lambda item_id: (-scores[item_id], self._items[item_id]["name"])
+        )
+        return [self._items[item_id] for item_id in ranked]
+
+    def _score_word(self, word: str) -> Dict[int, float]:
+        scores: Dict[int, float] = {}
+        for item_id in self._prefixes.get(word[: self.MAX_PREFIX], ()):
+            name_words, description_words = self._words[item_id]
+            if any(w.startswith(word) for w in name_words):
+                scores[item_id] = self.NAME_WEIGHT
+            elif any(w.startswith(word) for w in description_words):
+                scores[item_id] = self.DESCRIPTION_WEIGHT
+        if len(word) < 3:
+            return scores
+
+        # Fuzzy matches for typos and word parts, ranked below prefix matches
+        query_trigrams = trigrams(word)
+        shared: Dict[str, int] = defaultdict(int)
+        for trigram in query_trigrams:
+            for indexed_word in self._trigrams.get(trigram, ()):
+                shared[indexed_word] += 1
+        for indexed_word, count in shared.items():
+            # Dice coefficient over the trigram sets
+            similarity = 2 * count / (len(query_trigrams) + len(trigrams(indexed_word)))
+            if similarity < self.MIN_TRIGRAM_SIMILARITY:
+                continue
+            for item_id in self._word_items[indexed_word]:
+                name_words, _ = self._words[item_id]
+                weight = self.NAME_WEIGHT if indexed_word in name_words else 1.0
+                score = self.FUZZY_WEIGHT * weight * similarity
+                scores[item_id] = max(scores.get(item_id, 0.0), score)
+        return scores
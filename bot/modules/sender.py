@@ -0,0 +1,289 @@
+import asyncio
+import itertools
+import logging
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import Deque, Dict, Iterator
+
+from aiogram import Bot
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import Response, TelegramMethod
+from aiogram.methods.base import TelegramType
+
+from bot import config
+
+logger = logging.getLogger("bot")
+
+
+class Priority(IntEnum):
+    """Send lanes, served strictly in this order."""
+
+    REPLY = 0
+    NOTIFICATION = 1
+    BROADCAST = 2
+
+
+send_priority: ContextVar[Priority] = ContextVar(
+    "send_priority", default=Priority.REPLY
+)
+
+
+@contextmanager
+def priority(lane: Priority) -> Iterator[None]:
+    """Sends made inside the block are queued in `lane` instead of REPLY."""
+    token = send_priority.set(lane)
+    try:
+        yield
+    finally:
+        send_priority.reset(token)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate: float, capacity: float, now: float = 0.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        if now > self.updated:
+            self.tokens = min(
+                self.capacity, self.tokens + (now - self.updated) * self.rate
+            )
+            self.updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token can be taken, 0 if one is available now."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        """Takes no tokens for `seconds` (Telegram's retry_after)."""
+        self.paused_until = max(self.paused_until, now + seconds)
+        self.tokens = 0
+        self.updated = self.paused_until
+
+
+@dataclass
+class _Waiter:
+    chat_id: int | str
+    future: asyncio.Future
+    enqueued_at: float
+
+
+class SendScheduler:
+    """
+    Grants outbound send slots under Telegram's global and per-chat limits.
+
+    Every send waits for a token in the global bucket and in the bucket of its
+    chat. Waiters are served lane by lane (see `Priority`), so user replies
+    overtake queued notifications and broadcasts, and a waiter whose chat is
+    throttled does not hold back sends to other chats.
+
+    Attributes:
+        SCAN_LIMIT (int): How many waiters of one lane are inspected per grant
+            when looking for a chat that is not throttled.
+    """
+
+    SCAN_LIMIT = 100
+
+    def __init__(
+        self,
+        global_rate: float = config.SEND_GLOBAL_RATE,
+        chat_rate: float = config.SEND_CHAT_RATE,
+        chat_burst: float = config.SEND_CHAT_BURST,
+        max_chats: int = 10000,
+    ):
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats: OrderedDict[int | str, TokenBucket] = OrderedDict()
+        self._lanes: Dict[Priority, Deque[_Waiter]] = {
+            lane: deque() for lane in Priority
+        }
+        self._wakeup: asyncio.Event | None = None
+        self._task: asyncio.Task | None = None
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.sent = 0
+
+    def _now(self) -> float:
+        return asyncio.get_running_loop().time()
+
+    def _chat_bucket(self, chat_id: int | str) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = TokenBucket(self.chat_rate, self.chat_burst, self._now())
+            self._chats[chat_id] = bucket
+            # Buckets of idle chats are full anyway, forgetting them is harmless
+            while len(self._chats) > self.max_chats:
+                self._chats.popitem(last=False)
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id: int | str, lane: Priority = Priority.REPLY):
+        """Waits until a message may be sent to `chat_id`."""
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        waiter = _Waiter(
+            chat_id, asyncio.get_running_loop().create_future(), self._now()
+        )
+        self._lanes[lane].append(waiter)
+        self._wakeup.set()
+        await waiter.future
+
+    def pause(self, chat_id: int | str, seconds: float):
+        """Stops sending to `chat_id` for `seconds`."""
+        self._chat_bucket(chat_id).pause(self._now(), seconds)
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def _grant(self) -> float | None:
+        """
+        Resolves waiters while tokens are available.
+
+        Returns seconds until the next waiter may be served, or None if there
+        are no waiters left.
+        """
+        now = self._now()
+        while True:
+            global_delay = self._global.delay(now)
+            next_delay = None
+            granted = False
+            for lane in Priority:
+                queue = self._lanes[lane]
+                for index, waiter in enumerate(
+                    itertools.islice(queue, self.SCAN_LIMIT)
+                ):
+                    if waiter.future.done():
+                        continue
+                    chat_delay = self._chat_bucket(waiter.chat_id).delay(now)
+                    if chat_delay == 0 and global_delay == 0:
+                        self._global.take(now)
+                        self._chat_bucket(waiter.chat_id).take(now)
+                        del queue[index]
+                        waiter.future.set_result(None)
+                        self._latencies.append(now - waiter.enqueued_at)
+                        self.sent += 1
+                        granted = True
+                        break
+                    delay = max(chat_delay, global_delay)
+                    next_delay = delay if next_delay is None else min(next_delay, delay)
+                if granted:
+                    break
+                # Drop cancelled waiters from the head of the lane
+                while queue and queue[0].future.done():
+                    queue.popleft()
+            if not granted:
+                return next_delay
+
+    async def _run(self):
+        while True:
+            delay = self._grant()
+            self._wakeup.clear()
+            if delay is None:
+                await self._wakeup.wait()
+                continue
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict:
+        """Queue depth per lane and wait latency of recently granted sends."""
+        latencies = sorted(self._latencies)
+
+        def percentile(p: float) -> float:
+            if not latencies:
+                return 0.0
+            return latencies[min(len(latencies) - 1, int(len(latencies) * p))]
+
+        return {
+            "queue_depth": {
+                lane.name.lower(): len(self._lanes[lane]) for lane in Priority
+            },
+            "wait_p50": percentile(0.5),
+            "wait_p99": percentile(0.99),
+            "sent": self.sent,
+        }
+
+    def samples(self) -> Dict[str, float]:
+        """`stats()` as metrics samples, see `HandlerMetrics.add_collector`."""
+        stats = self.stats()
+        samples = {
+            f'bot_send_queue_depth{{lane="{lane}"}}': depth
+            for lane, depth in stats["queue_depth"].items()
+        }
+        samples['bot_send_wait_seconds{quantile="0.5"}'] = stats["wait_p50"]
+        samples['bot_send_wait_seconds{quantile="0.99"}'] = stats["wait_p99"]
+        samples["bot_send_total"] = stats["sent"]
+        return samples
+
+
+class SendSchedulerMiddleware(BaseRequestMiddleware):
+    """
+    Bot session middleware that passes every outgoing message through the
+    SendScheduler and retries sends rejected with `retry_after`.
+    """
+
+    RATE_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+    def __init__(
+        self, scheduler: SendScheduler, max_retries: int = config.SEND_MAX_RETRIES
+    ):
+        self.scheduler = scheduler
+        self.max_retries = max_retries
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: Bot,
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is None or not method.__api_method__.startswith(
+            self.RATE_LIMITED_PREFIXES
+        ):
+            return await make_request(bot, method)
+
+        lane = send_priority.get()
+        for attempt in range(self.max_retries + 1):
+            await self.scheduler.acquire(chat_id, lane)
+            try:
+                return await make_request(bot, method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                logger.warning(
+                    f"Flood control on {method.__api_method__} to chat {chat_id}, "
+                    f"retrying in {e.retry_after}s"
+                )
+                self.scheduler.pause(chat_id, e.retry_after)
+
+
+send_scheduler = SendScheduler()
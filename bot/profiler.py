@@ -0,0 +1,83 @@
+"""
+Profiling endpoints of the bot.
+
+The sampler and the event loop lag monitor are shared with the backend
+(`common.profiling`); this module adds the `/debug/profile` handler of the
+metrics server and the loop stall metrics.
+"""
+
+import logging
+from typing import Dict
+
+from aiohttp import web
+
+from common import profiling
+from common.profiling import (
+    FORMAT_COLLAPSED,
+    FORMAT_SPEEDSCOPE,
+    Profile,
+    ProfilerBusy,
+    SamplingProfiler,
+    render_profile,
+)
+
+logger = logging.getLogger("bot")
+
+__all__ = [
+    "FORMAT_COLLAPSED",
+    "FORMAT_SPEEDSCOPE",
+    "LoopLagMonitor",
+    "Profile",
+    "ProfilerBusy",
+    "SamplingProfiler",
+    "profile_handler",
+    "render_profile",
+]
+
+
+def profile_handler(profiler: SamplingProfiler):
+    """
+    `GET /debug/profile?seconds=10&updates=N&format=collapsed|speedscope`,
+    profiles for `seconds` or until N updates were handled.
+    """
+
+    async def handle_profile(request: web.Request) -> web.Response:
+        query = request.query
+        fmt = query.get("format", FORMAT_COLLAPSED)
+        if fmt not in (FORMAT_COLLAPSED, FORMAT_SPEEDSCOPE):
+            raise web.HTTPBadRequest(text=f"Unknown format: {fmt}")
+        try:
+            updates = int(query["updates"]) if "updates" in query else None
+            seconds = float(query.get("seconds", 0 if updates else 10))
+        except ValueError:
+            raise web.HTTPBadRequest(text="seconds and updates must be numbers")
+        try:
+            profile = await profiler.profile(seconds, updates)
+        except ProfilerBusy as e:
+            raise web.HTTPConflict(text=str(e))
+        body, content_type, filename = render_profile(profile, fmt, "bot")
+        logger.info(
+            f"Profiled {profile.duration:.1f}s, {profile.requests} updates, "
+            f"{sum(profile.stacks.values())} samples"
+        )
+        return web.Response(
+            text=body,
+            content_type=content_type,
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
+
+    return handle_profile
+
+
+class LoopLagMonitor(profiling.LoopLagMonitor):
+    """Loop lag monitor logging to the bot log, with stall metrics."""
+
+    def __init__(self, threshold: float):
+        super().__init__(threshold, logger)
+
+    def samples(self) -> Dict[str, float]:
+        """Stall stats as metrics samples, see `HandlerMetrics.add_collector`."""
+        return {
+            "bot_loop_stalls_total": self.stalls,
+            "bot_loop_max_lag_seconds": self.max_lag,
+        }
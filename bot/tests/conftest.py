@@ -0,0 +1,25 @@
+import fakeredis
+import pytest
+
+from bot.db import storage as storage_module
+from bot.db.storage import DataStorage
+
+
+@pytest.fixture
+def storage_factory(monkeypatch):
+    """
+    Builds `DataStorage` instances on their own fake Redis, which every
+    engine of the storage (cart, stock, stats, users...) is bound to.
+    """
+
+    def build() -> DataStorage:
+        fake = fakeredis.FakeRedis(decode_responses=True)
+        monkeypatch.setattr(storage_module, "redis_client", fake)
+        return DataStorage()
+
+    return build
+
+
+@pytest.fixture
+def storage(storage_factory) -> DataStorage:
+    return storage_factory()
@@ -0,0 +1,102 @@
+import asyncio
+
+import fakeredis
+import httpx
+from aiogram.exceptions import TelegramForbiddenError
+from aiogram.methods import SendMessage
+
+from bot.db import keys
+from bot.db.users import UserRegistry
+from bot.modules.broadcast import BroadcastEngine
+
+
+class FakeBot:
+    def __init__(self, blocked=(), crash_after=None):
+        self.blocked = set(blocked)
+        self.crash_after = crash_after
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        if chat_id in self.blocked:
+            raise TelegramForbiddenError(
+                method=SendMessage(chat_id=chat_id, text=text),
+                message="Forbidden: bot was blocked by the user",
+            )
+        if self.crash_after is not None and len(self.sent) >= self.crash_after:
+            raise asyncio.CancelledError
+        self.sent.append(chat_id)
+
+
+def make_engine(redis_client, bot: FakeBot) -> BroadcastEngine:
+    users = UserRegistry(redis_client)
+    for user_id in range(1, 11):
+        users.add(user_id)
+    return BroadcastEngine(bot, users, redis_client, chunk_size=3, workers=2)
+
+
+def mock_backend(monkeypatch, reports, status="running"):
+    class Client(httpx.AsyncClient):
+        async def post(self, url, json=None, headers=None):
+            reports.append(json)
+            request = httpx.Request("POST", url)
+            return httpx.Response(200, json={"status": status}, request=request)
+
+    monkeypatch.setattr(httpx, "AsyncClient", Client)
+
+
+def test_broadcast_prunes_blocked_users(monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    bot = FakeBot(blocked={4, 7})
+    engine = make_engine(redis_client, bot)
+    reports = []
+    mock_backend(monkeypatch, reports)
+
+    assert asyncio.run(engine.run(1, "Скидки!"))
+    assert sorted(bot.sent) == [1, 2, 3, 5, 6, 8, 9, 10]
+    assert engine.users.count() == 8
+    assert reports[-1] == {
+        "total": 10,
+        "sent": 8,
+        "failed": 0,
+        "blocked": 2,
+        "done": True,
+    }
+    assert not redis_client.exists(keys.broadcast_lock_key(1))
+    # A finished campaign is not sent again
+    assert asyncio.run(engine.run(1, "Скидки!"))
+    assert len(bot.sent) == 8
+
+
+def test_broadcast_resumes_after_crash(monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    mock_backend(monkeypatch, [])
+    crashed = make_engine(redis_client, FakeBot(crash_after=4))
+    try:
+        asyncio.run(crashed.run(1, "Скидки!"))
+    except asyncio.CancelledError:
+        pass
+    # The first chunk is stored, the second is sent again
+    assert redis_client.hget(keys.broadcast_key(1), "cursor") == "3"
+    redis_client.delete(keys.broadcast_lock_key(1))
+
+    bot = FakeBot()
+    assert asyncio.run(make_engine(redis_client, bot).run(1, "Скидки!"))
+    assert bot.sent == sorted(bot.sent) and bot.sent[0] == 4
+    assert redis_client.hget(keys.broadcast_key(1), "sent") == "10"
+
+
+def test_broadcast_is_sent_by_one_replica(monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    mock_backend(monkeypatch, [])
+    redis_client.set(keys.broadcast_lock_key(1), "other replica")
+    bot = FakeBot()
+    assert not asyncio.run(make_engine(redis_client, bot).run(1, "Скидки!"))
+    assert bot.sent == []
+
+
+def test_cancelled_broadcast_stops(monkeypatch):
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    mock_backend(monkeypatch, [], status="cancelled")
+    bot = FakeBot()
+    assert not asyncio.run(make_engine(redis_client, bot).run(1, "Скидки!"))
+    assert bot.sent == []
@@ -0,0 +1,32 @@
+import fakeredis
+
+from bot.db.cart import CartEngine
+
+ITEM = {"id": 1, "name": "Логотип", "price": 300, "description": "..."}
+
+
+def make_engine() -> CartEngine:
+    return CartEngine(fakeredis.FakeRedis(decode_responses=True), ttl=60)
+
+
+def test_add_counts_quantity_and_keeps_snapshot():
+    cart = make_engine()
+    assert cart.add(1, ITEM) == 1
+    assert cart.add(1, {**ITEM, "price": 999}) == 2
+    assert cart.get_items(1) == [{"id": 1, "name": "Логотип", "price": 300, "qty": 2}]
+    assert 0 < cart.redis_client.ttl("cart:1") <= 60
+
+
+def test_checkout_takes_items_once():
+    cart = make_engine()
+    cart.add(1, ITEM)
+    assert [entry["id"] for entry in cart.checkout(1)] == [1]
+    assert cart.checkout(1) == []
+
+
+def test_restore_puts_items_back():
+    cart = make_engine()
+    cart.add(1, ITEM, qty=3)
+    entries = cart.checkout(1)
+    cart.restore(1, entries)
+    assert cart.get_items(1) == entries
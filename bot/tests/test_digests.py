@@ -0,0 +1,88 @@
+import httpx
+import pytest
+
+from bot.db.digests import CatalogDigests, row_hash
+from bot.db.storage import DataStorage
+
+ITEMS = [
+    {"id": i, "name": f"Товар {i}", "price": 100 * i, "description": "..."}
+    for i in range(1, 6)
+]
+
+
+@pytest.fixture
+def storage(storage_factory) -> DataStorage:
+    storage = storage_factory()
+    storage.digests = CatalogDigests(storage.redis_client, buckets=4)
+    for item in ITEMS:
+        storage.store_item(item, seq=item["id"])
+    storage._catalog_seq = 5
+    return storage
+
+
+def digests_of(items, buckets=4):
+    digests = {}
+    for item in items:
+        count, total = digests.get(item["id"] % buckets, (0, 0))
+        digests[item["id"] % buckets] = (count + 1, total + row_hash(item))
+    return digests
+
+
+def test_digests_follow_item_writes(storage):
+    storage.store_item({**ITEMS[0], "price": 150})
+    storage.delete_item(5)
+    expected = digests_of([{**ITEMS[0], "price": 150}, *ITEMS[1:4]])
+    assert storage.digests.digests() == expected
+
+    pipeline = storage.redis_client.pipeline()
+    storage.digests.rebuild(storage._items, pipeline)
+    pipeline.execute()
+    assert storage.digests.digests() == expected
+    assert storage.digests.rows(1) == {1: row_hash({**ITEMS[0], "price": 150})}
+
+
+def test_differing_compares_both_sides():
+    local = {0: (1, 10), 1: (2, 20), 2: (1, 5)}
+    remote = {0: (1, 10), 1: (2, 21), 3: (1, 7)}
+    assert CatalogDigests.differing(local, remote) == [1, 2, 3]
+
+
+def test_reconcile_repairs_only_differing_buckets(monkeypatch, storage):
+    # Drift: a lost update of item 2 and a lost delete of item 3
+    backend = [{**ITEMS[1], "name": "Новое имя"}, ITEMS[0], ITEMS[3], ITEMS[4]]
+    requests = []
+
+    def get(url, params, headers):
+        requests.append(params)
+        request = httpx.Request("GET", url)
+        headers = {"X-Catalog-Seq": "5"}
+        if url.endswith("/items/digests"):
+            body = {"seq": 5, "buckets": digests_of(backend)}
+        else:
+            body = [item for item in backend if item["id"] % 4 == params["bucket"]]
+        return httpx.Response(200, json=body, headers=headers, request=request)
+
+    monkeypatch.setattr(httpx, "get", get)
+    report = storage.reconcile()
+    assert report.skipped is None
+    assert report.differing == [2, 3]
+    assert report.updated == [2]
+    assert report.deleted == [3]
+    assert [params.get("bucket") for params in requests] == [None, 2, 3]
+    assert storage.digests.digests() == digests_of(backend)
+    assert storage.get_item(2)["name"] == "Новое имя"
+
+    # Nothing left to repair
+    assert storage.reconcile().differing == []
+
+
+def test_reconcile_skips_when_backend_is_behind(monkeypatch, storage):
+    def get(url, params, headers):
+        request = httpx.Request("GET", url)
+        return httpx.Response(200, json={"seq": 4, "buckets": {}}, request=request)
+
+    monkeypatch.setattr(httpx, "get", get)
+    report = storage.reconcile()
+    assert report.skipped is not None
+    assert report.differing == []
+    assert storage.digests.digests() == digests_of(ITEMS)
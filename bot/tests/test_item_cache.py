@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from bot.db import keys
+from bot.db.item_cache import INVALIDATE_CHANNEL, ItemCache
+from bot.db.storage import DataStorage
+
+ITEM = {"id": 1, "name": "Логотип", "price": 300, "description": "..."}
+
+
+def invalidation(*redis_keys):
+    # What Redis pushes to the tracking connection, None means "everything"
+    return ["message", INVALIDATE_CHANNEL, list(redis_keys) if redis_keys else None]
+
+
+@pytest.fixture
+def storage(storage_factory) -> DataStorage:
+    storage = storage_factory()
+    storage.redis_client.set(keys.item_key(1), json.dumps(ITEM))
+    storage.item_cache = ItemCache(cache_size=10, fallback_ttl=60)
+    storage.item_cache.tracking = True
+    return storage
+
+
+def test_item_is_served_from_memory_until_invalidated(storage):
+    assert storage.get_item(1) == ITEM
+    storage.redis_client.set(keys.item_key(1), json.dumps({**ITEM, "price": 400}))
+    assert storage.get_item(1)["price"] == 300
+    assert (storage.item_cache.hits, storage.item_cache.misses) == (1, 1)
+
+    storage.item_cache._handle(invalidation(keys.item_key(1)))
+    assert storage.get_item(1)["price"] == 400
+
+
+def test_flush_invalidates_everything(storage):
+    storage.get_item(1)
+    storage.get_item(2)
+    storage.item_cache._handle(invalidation())
+    assert len(storage.item_cache._cache) == 0
+
+
+def test_load_racing_with_invalidation_is_not_cached(storage):
+    def load(item_id):
+        item = storage._load_item(item_id)
+        # The key changes after it was read, before the value is cached
+        storage.item_cache._handle(invalidation(keys.item_key(item_id)))
+        return item
+
+    storage.item_cache.get(1, load)
+    assert 1 not in storage.item_cache._cache
+
+
+def test_own_writes_invalidate_without_waiting_for_redis(storage):
+    storage.get_item(1)
+    storage.store_item({**ITEM, "name": "Баннер"})
+    assert storage.get_item(1)["name"] == "Баннер"
+    storage.delete_item(1)
+    assert storage.get_item(1) is None
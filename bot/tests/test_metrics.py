@@ -0,0 +1,45 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from bot.metrics import BACKEND, REDIS, HandlerMetrics, count_call
+from bot.modules.middlewares import MetricsMiddleware
+
+
+async def show_cart(event, data):
+    count_call(REDIS)
+    await asyncio.to_thread(count_call, REDIS)
+    count_call(BACKEND)
+
+
+async def send_order(event, data):
+    raise RuntimeError("backend is down")
+
+
+def run(middleware: MetricsMiddleware, handler):
+    data = {"handler": SimpleNamespace(callback=handler)}
+    return asyncio.run(middleware(handler, object(), data))
+
+
+def test_records_latency_and_calls_per_handler():
+    registry = HandlerMetrics()
+    registry.add_collector(lambda: {'bot_send_queue_depth{lane="reply"}': 2})
+    run(MetricsMiddleware(registry, slow_ms=1000), show_cart)
+    count_call(REDIS)  # outside of an update, not counted
+
+    text = registry.render()
+    assert 'bot_handler_seconds_count{handler="show_cart"} 1' in text
+    assert 'bot_update_calls_sum{handler="show_cart",kind="redis"} 2' in text
+    assert 'bot_update_calls_sum{handler="show_cart",kind="backend"} 1' in text
+    assert 'bot_handler_errors_total{handler="show_cart"} 0' in text
+    assert 'bot_send_queue_depth{lane="reply"} 2' in text
+
+
+def test_counts_errors_and_logs_slow_updates(caplog):
+    registry = HandlerMetrics()
+    with pytest.raises(RuntimeError):
+        run(MetricsMiddleware(registry, slow_ms=0), send_order)
+
+    assert 'bot_handler_errors_total{handler="send_order"} 1' in registry.render()
+    assert "Slow update in send_order" in caplog.text
@@ -0,0 +1,51 @@
+import asyncio
+from types import SimpleNamespace
+
+from bot.modules.middlewares import UserSerializationMiddleware
+
+
+def feed(middleware, handler, user_id):
+    data = {"event_from_user": SimpleNamespace(id=user_id)}
+    return middleware(handler, object(), data)
+
+
+def test_serializes_one_user_and_parallelizes_users():
+    log = []
+
+    def make_handler(name, delay):
+        async def handler(event, data):
+            log.append(f"{name} start")
+            await asyncio.sleep(delay)
+            log.append(f"{name} end")
+
+        return handler
+
+    async def scenario():
+        middleware = UserSerializationMiddleware(max_concurrency=10, timeout=1)
+        await asyncio.gather(
+            feed(middleware, make_handler("a1", 0.02), 1),
+            feed(middleware, make_handler("a2", 0), 1),
+            feed(middleware, make_handler("b1", 0), 2),
+        )
+        return middleware
+
+    middleware = asyncio.run(scenario())
+    assert log.index("a1 end") < log.index("a2 start")
+    assert log.index("b1 end") < log.index("a1 end")
+    assert middleware.samples()["bot_active_users"] == 0
+
+
+def test_times_out_stuck_updates_and_drops_spam():
+    async def stuck(event, data):
+        await asyncio.sleep(10)
+
+    async def scenario():
+        middleware = UserSerializationMiddleware(
+            max_concurrency=1, timeout=0.01, max_pending=2
+        )
+        await asyncio.gather(*(feed(middleware, stuck, 1) for _ in range(3)))
+        return middleware.samples()
+
+    samples = asyncio.run(scenario())
+    assert samples["bot_update_timeouts_total"] == 2
+    assert samples["bot_updates_dropped_total"] == 1
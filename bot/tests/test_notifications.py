@@ -0,0 +1,45 @@
+import asyncio
+
+from bot.modules.notifications import ManagerNotifier
+
+
+class FakeBot:
+    def __init__(self):
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        self.sent.append(text)
+
+
+def test_orders_are_sent_one_by_one_when_quiet():
+    async def scenario():
+        bot = FakeBot()
+        notifier = ManagerNotifier(bot, chat_id=1, threshold=10, interval=60)
+        await notifier.start()
+        notifier.notify("alice", order_id=1, total_price=100)
+        notifier.notify(None, order_id=2, total_price=50)
+        await asyncio.sleep(0.01)
+        await notifier.close()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    assert len(sent) == 2
+    assert "@alice" in sent[0]
+
+
+def test_orders_are_rolled_up_above_threshold():
+    async def scenario():
+        bot = FakeBot()
+        notifier = ManagerNotifier(bot, chat_id=1, threshold=2, interval=60)
+        await notifier.start()
+        for order_id in range(1, 6):
+            notifier.notify("bob", order_id=order_id, total_price=10)
+        await asyncio.sleep(0.01)
+        await notifier.close()
+        return bot.sent
+
+    sent = asyncio.run(scenario())
+    assert len(sent) == 3
+    assert "Новые заказы: 3" in sent[-1]
+    assert "30.00" in sent[-1]
+    assert "@bob (3)" in sent[-1]
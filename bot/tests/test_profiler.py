@@ -0,0 +1,74 @@
+import asyncio
+import logging
+import threading
+import time
+
+from bot.profiler import LoopLagMonitor, ProfilerBusy, SamplingProfiler
+
+
+def busy_worker(stop: threading.Event):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_profile_collects_stacks_of_other_threads():
+    stop = threading.Event()
+    threading.Thread(target=busy_worker, args=(stop,), name="worker").start()
+    profiler = SamplingProfiler(interval=0.002, max_seconds=1)
+    try:
+        profile = asyncio.run(profiler.profile(seconds=0.2))
+    finally:
+        stop.set()
+
+    collapsed = profile.collapsed()
+    assert any(
+        line.startswith("worker;") and "busy_worker" in line
+        for line in collapsed.splitlines()
+    )
+    speedscope = profile.speedscope("test")
+    frames = speedscope["shared"]["frames"]
+    samples = speedscope["profiles"][0]["samples"]
+    assert len(samples) == len(profile.stacks)
+    assert all(0 <= index < len(frames) for stack in samples for index in stack)
+
+
+def test_profile_stops_after_requests():
+    profiler = SamplingProfiler(interval=0.001, max_seconds=10)
+
+    async def run():
+        task = asyncio.create_task(profiler.profile(requests=3))
+        await asyncio.sleep(0.05)
+        try:
+            await profiler.profile(seconds=1)
+        except ProfilerBusy:
+            pass
+        else:
+            raise AssertionError("Second profile must not start")
+        for _ in range(3):
+            profiler.record_request()
+        return await asyncio.wait_for(task, 1)
+
+    profile = asyncio.run(run())
+    assert profile.requests == 3
+    assert profile.duration < 1
+
+
+def blocking_callback():
+    time.sleep(0.2)
+
+
+def test_loop_lag_monitor_logs_blocking_stack(caplog):
+    monitor = LoopLagMonitor(threshold=0.05)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        blocking_callback()
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    with caplog.at_level(logging.WARNING, logger="bot"):
+        asyncio.run(run())
+    assert monitor.stalls == 1
+    assert monitor.max_lag >= 0.1
+    assert "blocking_callback" in caplog.text
@@ -0,0 +1,68 @@
+import asyncio
+
+import httpx
+import pytest
+
+from bot.db import keys
+from bot.db.storage import DataStorage
+
+ITEMS = [
+    {"id": i, "name": f"Товар {i}", "price": 100, "description": ""} for i in (1, 2, 3)
+]
+
+
+@pytest.fixture
+def storage(storage_factory) -> DataStorage:
+    storage = storage_factory()
+    for item in ITEMS:
+        storage.store_item(item)
+    return storage
+
+
+def mock_backend(monkeypatch, responses, requests):
+    class Client(httpx.AsyncClient):
+        async def get(self, url, params=None, headers=None):
+            requests.append(params)
+            request = httpx.Request("GET", url)
+            data = responses.pop(0)
+            if data is None:
+                return httpx.Response(503, request=request)
+            return httpx.Response(200, json=data, request=request)
+
+    monkeypatch.setattr(httpx, "AsyncClient", Client)
+
+
+def test_recommendations_are_fetched_incrementally(monkeypatch, storage):
+    requests = []
+    responses = [
+        {"generation": "g1", "version": 1, "full": True, "items": {"1": [2, 9, 3]}},
+        {"generation": "g1", "version": 2, "full": False, "items": {"2": [1]}},
+        {"generation": "g2", "version": 1, "full": True, "items": {"3": [1]}},
+    ]
+    mock_backend(monkeypatch, responses, requests)
+
+    asyncio.run(storage.refresh_recommendations())
+    # Item 9 no longer exists
+    assert [item["id"] for item in storage.get_also_bought(1)] == [2, 3]
+    assert storage.get_also_bought(1, limit=1) == [ITEMS[1]]
+
+    asyncio.run(storage.refresh_recommendations())
+    assert requests[-1] == {"since": 1, "generation": "g1"}
+    assert storage.get_also_bought(2) == [ITEMS[0]]
+
+    asyncio.run(storage.refresh_recommendations())
+    assert requests[-1] == {"since": 2, "generation": "g1"}
+    assert storage.redis_client.hgetall(keys.RECS_KEY) == {"3": "1"}
+    assert storage.get_also_bought(1) == []
+
+
+def test_recommendations_kept_when_backend_has_none(monkeypatch, storage):
+    responses = [
+        {"generation": "g1", "version": 4, "full": True, "items": {"1": [2]}},
+        None,
+    ]
+    mock_backend(monkeypatch, responses, [])
+    asyncio.run(storage.refresh_recommendations())
+    asyncio.run(storage.refresh_recommendations())
+    assert storage.get_also_bought(1) == [ITEMS[1]]
+    assert storage.redis_client.get(keys.RECS_VERSION_KEY) == "g1:4"
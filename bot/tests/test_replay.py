@@ -0,0 +1,17 @@
+import asyncio
+
+from bot.tools.replay import run_level, start_stub_backend
+
+
+def test_replay_runs_every_handler():
+    async def scenario():
+        backend = await start_stub_backend()
+        try:
+            return await run_level(updates=16, concurrency=2, catalog_size=5)
+        finally:
+            await backend.cleanup()
+
+    result = asyncio.run(scenario())
+    assert result["updates"] == 16
+    assert len(result["latencies"]["send_order"]) == 2
+    assert result["requests"]["EditMessageText"] == 2
@@ -0,0 +1,80 @@
+import time
+
+
+from bot.modules.search import CatalogSearchIndex
+
+ITEMS = [
+    {"id": 1, "name": "Логотип", "price": 300, "description": "Фирменный знак"},
+    {
+        "id": 2,
+        "name": "Фирменный стиль",
+        "price": 900,
+        "description": "Логотип и бланки",
+    },
+    {"id": 3, "name": "Баннер", "price": 150, "description": None},
+]
+
+
+def make_index() -> CatalogSearchIndex:
+    index = CatalogSearchIndex()
+    index.rebuild(ITEMS)
+    return index
+
+
+def ids(items):
+    return [item["id"] for item in items]
+
+
+def test_prefix_matches_rank_names_first():
+    index = make_index()
+    assert ids(index.search("лог")) == [1, 2]
+    assert ids(index.search("фирм стил")) == [2]
+    assert ids(index.search("")) == [3, 1, 2]
+
+
+def test_typos_match_fuzzily():
+    assert ids(make_index().search("логатип")) == [1, 2]
+    assert make_index().search("визитки") == []
+
+
+def test_incremental_updates_invalidate_results():
+    index = make_index()
+    assert ids(index.search("баннер")) == [3]
+    index.upsert({"id": 3, "name": "Афиша", "price": 150, "description": None})
+    assert index.search("баннер") == []
+    index.remove(1)
+    assert ids(index.search("лог")) == [2]
+
+
+def test_pages_with_next_offset():
+    index = CatalogSearchIndex()
+    index.rebuild(
+        {"id": i, "name": f"Макет {i:03}", "price": i, "description": ""}
+        for i in range(45)
+    )
+    items, next_offset = index.page("макет", 0, 20)
+    assert len(items) == 20 and next_offset == "20"
+    items, next_offset = index.page("макет", 40, 20)
+    assert ids(items) == [40, 41, 42, 43, 44] and next_offset == ""
+
+
+def test_search_is_fast_on_large_catalog():
+    index = CatalogSearchIndex()
+    index.rebuild(
+        {"id": i, "name": f"Товар {i}", "price": i, "description": f"Описание {i}"}
+        for i in range(5000)
+    )
+    started = time.perf_counter()
+    results = index.search("товр 49")
+    assert time.perf_counter() - started < 0.05
+    assert results[0]["id"] == 49
+
+
+def test_storage_keeps_index_in_sync(storage):
+    index = CatalogSearchIndex()
+    storage.add_catalog_listener(index)
+    storage.store_items_in_redis(ITEMS)
+    storage.store_item({"id": 4, "name": "Визитки", "price": 50, "description": ""})
+    storage.delete_item(1)
+    assert ids(index.search("визит")) == [4]
+    assert ids(index.search("логотип")) == [2]
@@ -0,0 +1,74 @@
+import asyncio
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import SendMessage
+
+from bot.modules.sender import (
+    Priority,
+    SendScheduler,
+    SendSchedulerMiddleware,
+    priority,
+    send_priority,
+)
+
+
+def test_replies_overtake_notifications():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=20, chat_rate=100, chat_burst=100)
+        order = []
+
+        async def send(chat_id, lane):
+            await scheduler.acquire(chat_id, lane)
+            order.append(lane)
+
+        # Drain the global bucket so that everything below has to queue
+        for _ in range(20):
+            await scheduler.acquire(0)
+        tasks = [
+            asyncio.create_task(send(1, Priority.NOTIFICATION)),
+            asyncio.create_task(send(2, Priority.NOTIFICATION)),
+        ]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(send(3, Priority.REPLY)))
+        await asyncio.gather(*tasks)
+        await scheduler.close()
+        return order
+
+    order = asyncio.run(scenario())
+    assert order[0] == Priority.REPLY
+
+
+def test_per_chat_limit_does_not_block_other_chats():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, chat_rate=0.1, chat_burst=1)
+        await scheduler.acquire(1)
+        throttled = asyncio.create_task(scheduler.acquire(1))
+        await asyncio.wait_for(scheduler.acquire(2), timeout=1)
+        assert not throttled.done()
+        throttled.cancel()
+        await scheduler.close()
+
+    asyncio.run(scenario())
+
+
+def test_middleware_retries_after_flood_control():
+    async def scenario():
+        scheduler = SendScheduler(global_rate=100, chat_rate=100, chat_burst=100)
+        middleware = SendSchedulerMiddleware(scheduler, max_retries=1)
+        method = SendMessage(chat_id=1, text="hi")
+        calls = []
+
+        async def make_request(bot, method):
+            calls.append(send_priority.get())
+            if len(calls) == 1:
+                raise TelegramRetryAfter(method, "Too Many Requests", retry_after=0)
+            return "ok"
+
+        with priority(Priority.NOTIFICATION):
+            result = await middleware(make_request, None, method)
+        await scheduler.close()
+        return result, calls
+
+    result, calls = asyncio.run(scenario())
+    assert result == "ok"
+    assert calls == [Priority.NOTIFICATION, Priority.NOTIFICATION]
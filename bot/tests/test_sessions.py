@@ -0,0 +1,38 @@
+import fakeredis
+
+from bot.db.cache import LRUCache
+from bot.db.sessions import SessionStore
+
+
+def test_lru_cache_is_bounded():
+    cache = LRUCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    cache.get("a")
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert "b" not in cache
+    assert cache.get("a") == 1
+
+
+def test_lru_cache_expires_entries():
+    cache = LRUCache(maxsize=2, ttl=-1)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+
+
+def test_session_store_sets_ttl():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    store = SessionStore(redis_client, ttl=60, cache_size=10, cache_ttl=5)
+    store.update(1, username="user", full_name=None)
+    assert store.get(1) == {"username": "user"}
+    assert 0 < redis_client.ttl("session:1") <= 60
+
+
+def test_session_store_reads_fresh_data_after_update():
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    store = SessionStore(redis_client, ttl=60, cache_size=10, cache_ttl=5)
+    store.update(1, username="old")
+    assert store.get(1)["username"] == "old"
+    store.update(1, username="new")
+    assert store.get(1)["username"] == "new"
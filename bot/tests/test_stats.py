@@ -0,0 +1,85 @@
+import fakeredis
+import pytest
+import redis
+
+from bot.db import keys
+from bot.db.stats import ItemStats
+from bot.modules.callbacks import CatalogCallback
+from bot.modules.keyboards import CatalogRenderCache, get_catalog_keyboard
+
+
+def make_stats() -> ItemStats:
+    return ItemStats(fakeredis.FakeRedis(decode_responses=True))
+
+
+def test_flush_sends_aggregated_counters():
+    stats = make_stats()
+    for user_id in (10, 11, 10):
+        stats.record_view(1, user_id)
+    stats.record_add(1)
+    stats.record_add(2, qty=2)
+    assert stats.flush() == 6
+    assert stats.flush() == 0
+    assert stats.redis_client.hgetall(keys.STATS_VIEWS_KEY) == {"1": "3"}
+    assert stats.redis_client.hgetall(keys.STATS_ADDS_KEY) == {"1": "1", "2": "2"}
+    assert stats.redis_client.pfcount(keys.item_viewers_key(1)) == 2
+
+
+def test_failed_flush_keeps_counters():
+    stats = make_stats()
+    stats.record_view(1, 10)
+
+    def execute():
+        raise redis.ConnectionError("down")
+
+    pipeline = stats.redis_client.pipeline()
+    pipeline.execute = execute
+    stats.redis_client.pipeline = lambda: pipeline
+    with pytest.raises(redis.ConnectionError):
+        stats.flush()
+    del stats.redis_client.pipeline
+    assert stats.flush() == 1
+
+
+def test_rollup_is_handed_out_until_acknowledged():
+    stats = make_stats()
+    stats.record_view(1, 10)
+    stats.record_add(1)
+    stats.flush()
+    batch_id, counts = stats.take_rollup()
+    assert counts == {"views": {1: 1}, "adds": {1: 1}, "viewers": {1: 1}}
+
+    stats.record_view(1, 11)
+    stats.flush()
+    retried_id, retried = stats.take_rollup()
+    assert (retried_id, retried["views"]) == (batch_id, {1: 1})
+    # Unique viewers are an all-time estimate, sent as of now
+    assert retried["viewers"] == {1: 2}
+    stats.ack_rollup(batch_id)
+    assert stats.take_rollup()[1] == {"views": {1: 1}, "adds": {}, "viewers": {1: 2}}
+
+
+def test_sort_by_popularity_keeps_unranked_order(storage):
+    storage._ranking = {3: 0, 1: 1}
+    items = [{"id": item_id} for item_id in (1, 2, 3, 4)]
+    assert [item["id"] for item in storage.sort_by_popularity(items)] == [3, 1, 2, 4]
+
+
+def test_catalog_keyboard_keeps_sort_order():
+    items = [{"id": i, "name": f"Товар {i}", "price": 100} for i in range(5)]
+    keyboard = get_catalog_keyboard(0, items, 3, version=7, popular=True)
+    next_button = keyboard.inline_keyboard[-2][0]
+    sort_button = keyboard.inline_keyboard[-1][0]
+    assert CatalogCallback.unpack(next_button.callback_data).popular
+    assert CatalogCallback.unpack(sort_button.callback_data) == CatalogCallback(
+        page=0, version=7, popular=False
+    )
+
+
+def test_new_ranking_renders_only_popular_pages():
+    cache = CatalogRenderCache()
+    items = [{"id": i, "name": f"Товар {i}", "price": 100} for i in range(5)]
+    plain = cache.render(1, 0, items, seq=7)
+    cache.render(1, 0, items, popular=True, seq=7, ranking=1)
+    assert cache.get(1, 0, popular=True, seq=7, ranking=2) is None
+    assert cache.get(1, 0, seq=7) is plain
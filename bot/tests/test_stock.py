@@ -0,0 +1,102 @@
+import json
+
+import fakeredis
+import pytest
+
+from bot.db import keys
+from bot.db.stock import OutOfStock, StockEngine
+
+ITEM = {"id": 1, "name": "Логотип", "price": 300, "description": "..."}
+
+
+def make_engine(stock: int | None = 3) -> StockEngine:
+    engine = StockEngine(fakeredis.FakeRedis(decode_responses=True), hold_ttl=60)
+    if stock is not None:
+        engine.apply(1, stock, seq=1)
+    return engine
+
+
+def test_reserve_holds_units_until_they_run_out():
+    stock = make_engine()
+    assert stock.reserve(10, 1, qty=2) == 1
+    with pytest.raises(OutOfStock) as e:
+        stock.reserve(11, 1, qty=2)
+    assert e.value.available == 1
+    assert stock.available(1) == 1
+    assert make_engine(stock=None).reserve(10, 1) is None
+
+
+def test_commit_turns_holds_into_sales():
+    stock = make_engine()
+    stock.reserve(10, 1, qty=2)
+    stock.commit(10, [{"id": 1, "qty": 3}])
+    assert stock.available(1) == 0
+    assert stock.redis_client.hgetall(keys.STOCK_SOLD_KEY) == {"1": "3"}
+    assert stock.redis_client.zcard(keys.STOCK_HOLDS_KEY) == 0
+
+    stock.cancel(10, [{"id": 1, "qty": 3}])
+    assert stock.redis_client.hget(keys.hold_key(10), "1") == "3"
+
+
+def test_commit_fails_whole_when_an_item_ran_out():
+    stock = make_engine(stock=1)
+    stock.apply(2, 5, seq=1)
+    stock.reserve(11, 1)
+    with pytest.raises(OutOfStock) as e:
+        stock.commit(10, [{"id": 1, "qty": 1}, {"id": 2, "qty": 1}])
+    assert e.value.item_ids == [1]
+    assert stock.available(2) == 5
+
+
+def test_release_expired_gives_back_expired_holds_only():
+    stock = make_engine()
+    stock.reserve(10, 1)
+    stock.hold_ttl = -1
+    stock.reserve(11, 1)
+    assert stock.release_expired() == 1
+    assert stock.available(1) == 2
+    assert stock.redis_client.hgetall(keys.hold_key(10)) == {"1": "1"}
+
+
+def test_stock_changes_apply_once_and_snapshots_keep_counters():
+    stock = make_engine()
+    stock.reserve(10, 1)
+    stock.apply(1, 13, stock_delta=10, seq=2)
+    # Redelivered to another replica
+    stock.apply(1, 13, stock_delta=10, seq=2)
+    assert stock.available(1) == 12
+    stock.apply(1, 13, seq=3)
+    assert stock.available(1) == 12
+    stock.apply(1, None, seq=4)
+    assert stock.available(1) is None
+
+
+def test_sold_batch_is_handed_out_until_acknowledged():
+    stock = make_engine()
+    stock.commit(10, [{"id": 1, "qty": 2}])
+    batch_id, sold = stock.take_sold()
+    assert sold == {1: 2}
+    stock.commit(11, [{"id": 1, "qty": 1}])
+    assert stock.take_sold() == (batch_id, {1: 2})
+    stock.ack_sold(batch_id)
+    assert stock.take_sold()[1] == {1: 1}
+
+
+def test_storage_keeps_stock_out_of_item_records(storage):
+    storage.store_item({**ITEM, "stock": 5, "stock_delta": None}, seq=1)
+    assert json.loads(storage.redis_client.get(keys.item_key(1))) == ITEM
+    assert storage.get_stock(1) == 5
+
+
+def test_failed_add_to_cart_gives_the_units_back(monkeypatch, storage):
+    storage.store_item({**ITEM, "stock": 5, "stock_delta": None}, seq=1)
+    storage.add_to_cart(10, ITEM)
+
+    def add(user_id, item, qty=1):
+        raise ConnectionError("Redis is down")
+
+    monkeypatch.setattr(storage.cart, "add", add)
+    with pytest.raises(ConnectionError):
+        storage.add_to_cart(10, ITEM, qty=2)
+    assert storage.get_stock(1) == 4
+    assert storage.redis_client.hgetall(keys.hold_key(10)) == {"1": "1"}
@@ -0,0 +1,124 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from bot.db import keys
+from bot.db.schemas import CatalogEvent
+from bot.db.storage import DataStorage
+from bot.modules.callbacks import CatalogCallback
+from bot.modules.keyboards import CatalogRenderCache
+
+ITEM = {"id": 1, "name": "Логотип", "price": 300, "description": "..."}
+
+
+@pytest.fixture
+def make_storage(storage_factory):
+    def make(backend_seq, snapshot_seq=None) -> DataStorage:
+        storage = storage_factory()
+        if snapshot_seq is not None:
+            storage.redis_client.set(keys.item_key(1), json.dumps(ITEM))
+            storage.redis_client.set(keys.CATALOG_SEQ_KEY, snapshot_seq)
+        storage.calls = []
+
+        async def fetch_catalog_seq():
+            return backend_seq
+
+        async def fetch_items():
+            storage.calls.append("fetch_items")
+
+        storage.fetch_catalog_seq = fetch_catalog_seq
+        storage.fetch_items = fetch_items
+        storage._apply_changes_since = lambda since: storage.calls.append(since)
+        return storage
+
+    return make
+
+
+def test_warm_start_serves_current_snapshot(make_storage):
+    storage = make_storage(backend_seq=5, snapshot_seq=5)
+    asyncio.run(storage.warm_start())
+    assert storage.calls == []
+    assert storage._items == [ITEM]
+    assert storage._catalog_seq == 5
+    assert storage._catalog_loaded.is_set()
+
+
+def test_warm_start_applies_only_missed_changes(make_storage):
+    storage = make_storage(backend_seq=7, snapshot_seq=5)
+    asyncio.run(storage.warm_start())
+    assert storage.calls == [5]
+
+
+def test_warm_start_fetches_catalog_without_snapshot(make_storage):
+    storage = make_storage(backend_seq=7)
+    asyncio.run(storage.warm_start())
+    assert storage.calls == ["fetch_items"]
+
+
+def test_reload_event_swaps_whole_catalog(monkeypatch, make_storage):
+    storage = make_storage(backend_seq=5, snapshot_seq=5)
+    asyncio.run(storage.warm_start())
+    imported = [{**ITEM, "id": i, "name": f"Импорт {i}"} for i in (2, 3)]
+
+    def get(url, headers):
+        request = httpx.Request("GET", url)
+        return httpx.Response(
+            200, json=imported, headers={"X-Catalog-Seq": "7"}, request=request
+        )
+
+    monkeypatch.setattr(httpx, "get", get)
+    storage.apply_event(CatalogEvent(v=1, seq=6, op="reload"))
+    assert storage._items == imported
+    assert storage.redis_client.get(keys.item_key(1)) is None
+    assert storage._catalog_seq == 7
+    storage.apply_event(CatalogEvent(v=1, seq=7, op="delete", id=2))
+    assert storage._items == imported
+
+
+def test_failed_write_leaves_catalog_seq_behind(monkeypatch, make_storage):
+    storage = make_storage(backend_seq=5, snapshot_seq=5)
+    asyncio.run(storage.warm_start())
+
+    def execute(self):
+        raise ConnectionError("Redis is down")
+
+    pipeline_class = type(storage.redis_client.pipeline())
+    with monkeypatch.context() as patch:
+        patch.setattr(pipeline_class, "execute", execute)
+        changed = {**ITEM, "name": "Логотип+"}
+        storage.apply_event(CatalogEvent(v=1, seq=6, op="upsert", item=changed))
+    assert storage._catalog_seq == 5
+    assert storage._items == [ITEM]
+
+    storage.apply_event(CatalogEvent(v=1, seq=7, op="delete", id=1))
+    assert storage.calls == [5]
+
+
+def test_catalog_buttons_carry_the_shared_seq(make_storage):
+    # A restarted replica, its local catalog version starts over
+    restarted = make_storage(backend_seq=5, snapshot_seq=5)
+    asyncio.run(restarted.warm_start())
+    running = make_storage(backend_seq=5, snapshot_seq=5)
+    asyncio.run(running.warm_start())
+    running.store_item({**ITEM, "name": "Логотип+"})
+    assert running.catalog_version != restarted.catalog_version
+
+    cache = CatalogRenderCache(items_per_page=1)
+    items = [{**ITEM, "id": i} for i in (1, 2)]
+    for storage in (restarted, running):
+        page = cache.render(storage.catalog_version, 0, items, seq=storage.catalog_seq)
+        button = page.markup.inline_keyboard[1][0]
+        assert CatalogCallback.unpack(button.callback_data).version == 5
+
+
+def test_storage_engines_share_its_redis(storage):
+    for engine in (
+        storage.cart,
+        storage.stock,
+        storage.digests,
+        storage.stats,
+        storage.users,
+    ):
+        assert engine.redis_client is storage.redis_client
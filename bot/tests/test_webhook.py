@@ -0,0 +1,87 @@
+import asyncio
+
+import fakeredis
+from aiogram import Bot, Dispatcher, Router
+from aiogram.client.session.base import BaseSession
+from aiohttp.test_utils import TestClient, TestServer
+
+from bot import config
+from bot.webhook import UpdateDeduplicator, create_webhook_app
+
+
+class RecordingSession(BaseSession):
+    """Bot session that records outgoing API calls instead of sending them."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = []
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests.append(method)
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+def make_update(update_id: int, text: str = "/start") -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "chat": {"id": 1, "type": "private"},
+            "from": {"id": 1, "is_bot": False, "first_name": "Test"},
+            "text": text,
+        },
+    }
+
+
+async def send_updates(updates: list[dict], secret: str | None = None):
+    """Plays the role of Telegram: posts updates to a local webhook server."""
+    handled = []
+    router = Router()
+
+    @router.message()
+    async def on_message(message):
+        handled.append(message.message_id)
+
+    dp = Dispatcher()
+    dp.include_router(router)
+    bot = Bot(token="42:TEST", session=RecordingSession())
+    deduplicator = UpdateDeduplicator(fakeredis.FakeRedis(decode_responses=True))
+    app = create_webhook_app(dp, bot, deduplicator)
+
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    statuses = []
+    async with TestClient(TestServer(app)) as client:
+        for update in updates:
+            response = await client.post(
+                config.WEBHOOK_PATH, json=update, headers=headers
+            )
+            statuses.append(response.status)
+    return handled, statuses
+
+
+def test_webhook_processes_updates():
+    handled, statuses = asyncio.run(send_updates([make_update(1), make_update(2)]))
+    assert statuses == [200, 200]
+    assert handled == [1, 2]
+
+
+def test_webhook_skips_redelivered_update():
+    handled, statuses = asyncio.run(
+        send_updates([make_update(1), make_update(1), make_update(2)])
+    )
+    assert statuses == [200, 200, 200]
+    assert handled == [1, 2]
+
+
+def test_webhook_rejects_wrong_secret(monkeypatch):
+    monkeypatch.setattr(config, "WEBHOOK_SECRET", "secret")
+    handled, statuses = asyncio.run(send_updates([make_update(1)], secret="wrong"))
+    assert statuses == [401]
+    assert handled == []
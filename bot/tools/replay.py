@@ -0,0 +1,295 @@
+"""
+Replays synthetic Telegram updates through the bot router to benchmark the
+handlers without Telegram, Redis or the admin API.
+
+The router comes from `create_router` with the middlewares `main.py` uses.
+Outgoing API calls are recorded by a stub session, Redis is fakeredis and the
+admin API is a local stub server answering `POST /order/`. Every simulated
+user walks the same script: /start, catalog, next page, item details, add to
+cart twice, cart, checkout.
+
+Usage:
+    python -m bot.tools.replay --updates 5000 --concurrency 1,10,50
+"""
+
+import argparse
+import asyncio
+import itertools
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Any, Awaitable, Callable, Dict, List
+
+import fakeredis
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.base import BaseSession
+from aiogram.fsm.storage.base import DefaultKeyBuilder
+from aiogram.fsm.storage.redis import RedisStorage
+from aiogram.types import TelegramObject, Update
+from aiogram.utils.callback_answer import CallbackAnswerMiddleware
+from aiohttp import web
+
+from bot import config
+from bot.db import storage as storage_module
+from bot.db.keys import FSM_PREFIX
+from bot.db.sessions import CachedStorage, SessionStore
+from bot.db.storage import DataStorage
+from bot.modules.callbacks import CatalogCallback
+from bot.modules.handlers import CustomFilters, create_router
+from bot.modules.middlewares import BotMiddleware, UserSerializationMiddleware
+
+logger = logging.getLogger("bot")
+
+BOT_TOKEN = "42:REPLAY"
+
+
+class RecordingSession(BaseSession):
+    """Bot session that records outgoing API calls instead of sending them."""
+
+    def __init__(self):
+        super().__init__()
+        self.requests = Counter()
+
+    async def make_request(self, bot, method, timeout=None):
+        self.requests[type(method).__name__] += 1
+        return True
+
+    async def stream_content(self, *args, **kwargs):
+        yield b""
+
+    async def close(self):
+        pass
+
+
+class LatencyRecorder(BaseMiddleware):
+    """Handler middleware keeping every handler latency for percentiles."""
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: Dict[str, Any],
+    ) -> Any:
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        finally:
+            name = data["handler"].callback.__name__
+            self.latencies[name].append(time.perf_counter() - started)
+
+
+async def start_stub_backend() -> web.AppRunner:
+    """Admin API stub on a free local port, the bot config is pointed to it."""
+    order_ids = itertools.count(1)
+
+    async def create_order(request: web.Request) -> web.Response:
+        await request.json()
+        return web.json_response({"order_id": next(order_ids)})
+
+    app = web.Application()
+    app.router.add_post("/order/", create_order)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="127.0.0.1", port=0)
+    await site.start()
+    port = runner.addresses[0][1]
+    config.ADMIN_API_URL = f"http://127.0.0.1:{port}"
+    config.ADMIN_API_KEY = config.ADMIN_API_KEY or "replay"
+    config.MANAGER_USER_ID = config.MANAGER_USER_ID or 1
+    return runner
+
+
+def make_catalog(size: int) -> List[Dict]:
+    return [
+        {
+            "id": item_id,
+            "name": f"Товар {item_id}",
+            "price": 100 + item_id,
+            "description": "Синтетический товар",
+            # Every other item is limited, so holds and sales are exercised
+            "stock": 10**9 if item_id % 2 else None,
+        }
+        for item_id in range(1, size + 1)
+    ]
+
+
+class UpdateFactory:
+    """Builds the raw updates of one user's script."""
+
+    def __init__(self, catalog_size: int, catalog_seq: int):
+        self.catalog_size = catalog_size
+        self.catalog_seq = catalog_seq
+        self._ids = itertools.count(1)
+
+    def _user(self, user_id: int) -> Dict:
+        return {
+            "id": user_id,
+            "is_bot": False,
+            "first_name": "Replay",
+            "username": f"replay_{user_id}",
+        }
+
+    def message(self, user_id: int, text: str) -> Dict:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "message": {
+                "message_id": update_id,
+                "date": 0,
+                "chat": {"id": user_id, "type": "private"},
+                "from": self._user(user_id),
+                "text": text,
+            },
+        }
+
+    def callback(self, user_id: int, data: str) -> Dict:
+        update_id = next(self._ids)
+        return {
+            "update_id": update_id,
+            "callback_query": {
+                "id": str(update_id),
+                "chat_instance": str(user_id),
+                "from": self._user(user_id),
+                "data": data,
+                "message": {
+                    "message_id": update_id,
+                    "date": 0,
+                    "chat": {"id": user_id, "type": "private"},
+                    "from": {"id": 42, "is_bot": True, "first_name": "Bot"},
+                    "text": "Каталог",
+                },
+            },
+        }
+
+    def script(self, user_id: int) -> List[Dict]:
+        item_id = user_id % self.catalog_size + 1
+        next_page = CatalogCallback(page=1, version=self.catalog_seq).pack()
+        return [
+            self.message(user_id, "/start"),
+            self.message(user_id, CustomFilters.CATALOG),
+            self.callback(user_id, next_page),
+            self.callback(user_id, f"item_{item_id}"),
+            self.callback(user_id, f"add_to_cart_{item_id}"),
+            self.callback(user_id, f"add_to_cart_{item_id}"),
+            self.message(user_id, CustomFilters.CART),
+            self.callback(user_id, "checkout"),
+        ]
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+async def run_level(updates: int, concurrency: int, catalog_size: int) -> Dict:
+    """Replays `updates` updates with `concurrency` users in flight at a time."""
+    redis_client = fakeredis.FakeRedis(decode_responses=True)
+    # Every engine of the storage binds the module's client when built
+    real_client = storage_module.redis_client
+    storage_module.redis_client = redis_client
+    try:
+        storage = DataStorage()
+    finally:
+        storage_module.redis_client = real_client
+    storage.store_items_in_redis(make_catalog(catalog_size), seq=1)
+
+    session = RecordingSession()
+    bot = Bot(token=BOT_TOKEN, session=session)
+    fsm_storage = RedisStorage(
+        fakeredis.aioredis.FakeRedis(), key_builder=DefaultKeyBuilder(prefix=FSM_PREFIX)
+    )
+    dp = Dispatcher(
+        storage=CachedStorage(
+            fsm_storage,
+            cache_size=config.SESSION_CACHE_SIZE,
+            cache_ttl=config.SESSION_CACHE_TTL,
+        )
+    )
+    dp.update.outer_middleware(
+        UserSerializationMiddleware(
+            max_concurrency=config.UPDATE_MAX_CONCURRENCY,
+            timeout=config.UPDATE_TIMEOUT,
+            max_pending=config.UPDATE_MAX_PENDING_PER_USER,
+        )
+    )
+    dp.callback_query.middleware(CallbackAnswerMiddleware())
+    router = create_router(storage, bot=bot, session_store=SessionStore(redis_client))
+    recorder = LatencyRecorder()
+    for observer in (router.message, router.callback_query):
+        observer.middleware(BotMiddleware(bot))
+        observer.middleware(recorder)
+    dp.include_router(router)
+
+    factory = UpdateFactory(catalog_size, storage.catalog_seq)
+    queue: asyncio.Queue = asyncio.Queue()
+    handled = 0
+    for user_id in itertools.count(1):
+        if handled >= updates:
+            break
+        script = factory.script(user_id)
+        queue.put_nowait(script)
+        handled += len(script)
+
+    async def user_worker():
+        # A user's updates are sequential, as Telegram delivers them per chat
+        while not queue.empty():
+            for raw in queue.get_nowait():
+                update = Update.model_validate(raw, context={"bot": bot})
+                await dp.feed_update(bot, update)
+
+    await dp.emit_startup(bot=bot)
+    started = time.perf_counter()
+    await asyncio.gather(*(user_worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await dp.emit_shutdown(bot=bot)
+
+    return {
+        "concurrency": concurrency,
+        "updates": handled,
+        "seconds": elapsed,
+        "updates_per_second": handled / elapsed,
+        "latencies": recorder.latencies,
+        "requests": dict(session.requests),
+    }
+
+
+def print_report(result: Dict):
+    print(
+        f"\nconcurrency={result['concurrency']}: {result['updates']} updates "
+        f"in {result['seconds']:.2f}s, {result['updates_per_second']:.0f} updates/s"
+    )
+    print(f"{'handler':<20}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, values in sorted(result["latencies"].items()):
+        print(
+            f"{name:<20}{len(values):>8}"
+            f"{percentile(values, 0.5) * 1000:>10.2f}"
+            f"{percentile(values, 0.95) * 1000:>10.2f}"
+            f"{percentile(values, 0.99) * 1000:>10.2f}"
+        )
+    calls = ", ".join(f"{k}={v}" for k, v in sorted(result["requests"].items()))
+    print(f"Bot API calls: {calls}")
+
+
+async def main(updates: int, levels: List[int], catalog_size: int):
+    backend = await start_stub_backend()
+    try:
+        for concurrency in levels:
+            print_report(await run_level(updates, concurrency, catalog_size))
+    finally:
+        await backend.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--concurrency", default="1,10,50")
+    parser.add_argument("--items", type=int, default=100, help="catalog size")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    logger.setLevel(logging.WARNING)
+    levels = [int(level) for level in args.concurrency.split(",")]
+    asyncio.run(main(args.updates, levels, args.items))
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import Any
+
+import redis
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.types import Update
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from bot import config
+from bot.db.keys import update_key
+
+logger = logging.getLogger("bot")
+
+
+class UpdateDeduplicator:
+    """
+    Makes sure every Telegram update is processed by only one bot replica.
+
+    Telegram redelivers an update when it does not get a 2xx response in time,
+    and behind a load balancer the retry may land on another replica. Each
+    replica claims `update_id` with an atomic SET NX before processing it;
+    whoever loses the race skips the update.
+
+    The claim is first taken as a short lease, so an update whose replica died
+    mid-processing becomes claimable again, and is extended to `ttl` once the
+    update has been processed.
+    """
+
+    def __init__(self, redis_client: redis.Redis, ttl: int = 3600, lease: int = 60):
+        self.redis_client = redis_client
+        self.ttl = ttl
+        self.lease = lease
+
+    def claim(self, update_id: int) -> bool:
+        """Returns True if the caller is the first one to see the update."""
+        key = update_key(update_id)
+        return bool(self.redis_client.set(key, 1, nx=True, ex=self.lease))
+
+    def confirm(self, update_id: int):
+        """Keeps the claim for `ttl` after the update was processed."""
+        self.redis_client.expire(update_key(update_id), self.ttl)
+
+    def release(self, update_id: int):
+        """Forgets a claim so a redelivery of a failed update is processed again."""
+        self.redis_client.delete(update_key(update_id))
+
+
+class DedupRequestHandler(SimpleRequestHandler):
+    """
+    Webhook request handler that skips already claimed updates and limits the
+    number of updates processed concurrently by this replica.
+
+    Updates are processed before responding, so a full replica pushes back on
+    Telegram instead of piling up tasks, and a failed update gets a 500 and is
+    redelivered.
+    """
+
+    def __init__(
+        self,
+        dispatcher: Dispatcher,
+        bot: Bot,
+        deduplicator: UpdateDeduplicator,
+        max_concurrency: int = 100,
+        **kwargs: Any,
+    ):
+        super().__init__(dispatcher, bot, handle_in_background=False, **kwargs)
+        self.deduplicator = deduplicator
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _handle_request(self, bot: Bot, request: web.Request) -> web.Response:
+        update = Update.model_validate(
+            await request.json(loads=bot.session.json_loads), context={"bot": bot}
+        )
+        if not self.deduplicator.claim(update.update_id):
+            logger.info(f"Skipping duplicate update {update.update_id}")
+            return web.json_response({})
+
+        try:
+            async with self._semaphore:
+                result = await self.dispatcher.feed_webhook_update(
+                    bot, update, **self.data
+                )
+        except Exception as e:
+            logger.error(f"Failed to process update {update.update_id}: {e}")
+            self.deduplicator.release(update.update_id)
+            return web.Response(status=500)
+        self.deduplicator.confirm(update.update_id)
+        return web.Response(body=self._build_response_writer(bot=bot, result=result))
+
+
+def create_webhook_app(
+    dp: Dispatcher, bot: Bot, deduplicator: UpdateDeduplicator
+) -> web.Application:
+    """Builds the aiohttp application that receives updates from Telegram."""
+    app = web.Application()
+    # Dispatcher shutdown (flushing pending messages) must run before the
+    # handler closes the bot session, aiohttp runs shutdown hooks in order
+    setup_application(app, dp, bot=bot)
+    DedupRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        deduplicator=deduplicator,
+        max_concurrency=config.WEBHOOK_MAX_CONCURRENCY,
+        secret_token=config.WEBHOOK_SECRET,
+    ).register(app, path=config.WEBHOOK_PATH)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    """Registers the webhook in Telegram and serves updates until cancelled."""
+
+    async def set_webhook():
+        await bot.set_webhook(
+            f"{config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}",
+            secret_token=config.WEBHOOK_SECRET,
+            allowed_updates=dp.resolve_used_update_types(),
+            max_connections=config.WEBHOOK_MAX_CONCURRENCY,
+        )
+        logger.info(f"Webhook set to {config.WEBHOOK_BASE_URL}{config.WEBHOOK_PATH}")
+
+    dp.startup.register(set_webhook)
+    deduplicator = UpdateDeduplicator(config.redis_client, config.UPDATE_DEDUPE_TTL)
+    runner = web.AppRunner(create_webhook_app(dp, bot, deduplicator))
+    await runner.setup()
+    site = web.TCPSite(runner, host=config.WEBHOOK_HOST, port=config.WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Serving webhook on {config.WEBHOOK_HOST}:{config.WEBHOOK_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
@@ -0,0 +1,224 @@
+"""
+Sampling profiler and event loop lag monitor.
+
+`SamplingProfiler` takes the stacks of all threads every `interval` seconds
+from a background thread (`sys._current_frames`, no tracing hooks, so the
+profiled code runs at full speed) and counts identical stacks. Profiles are
+rendered as collapsed stacks (for flamegraph.pl, inferno or speedscope) or
+as a speedscope JSON file.
+
+`LoopLagMonitor` flags callbacks that block the event loop, with the stack
+of the code that was running while the loop was blocked.
+
+Shared by the bot (`bot/profiler.py`) and the backend (`web/core/profiler.py`),
+which add their own endpoints; both images copy this package in.
+"""
+
+import asyncio
+import json
+import logging
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+FORMAT_COLLAPSED = "collapsed"
+FORMAT_SPEEDSCOPE = "speedscope"
+
+# (name, file, line) of a frame
+Frame = Tuple[str, str, int]
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+def _stack(frame) -> Tuple[Frame, ...]:
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        module = frame.f_globals.get("__name__", "?")
+        frames.append(
+            (f"{module}:{code.co_qualname}", code.co_filename, code.co_firstlineno)
+        )
+        frame = frame.f_back
+    return tuple(reversed(frames))
+
+
+@dataclass
+class Profile:
+    # Root-to-leaf stacks (the thread name first) and their sample counts
+    stacks: Counter
+    interval: float
+    duration: float
+    requests: int
+
+    def collapsed(self) -> str:
+        lines = []
+        for stack, count in self.stacks.most_common():
+            names = ";".join(name.replace(";", ":") for name, _, _ in stack)
+            lines.append(f"{names} {count}\n")
+        return "".join(lines)
+
+    def speedscope(self, name: str) -> Dict:
+        frames: Dict[Frame, int] = {}
+        samples, weights = [], []
+        for stack, count in self.stacks.items():
+            samples.append([frames.setdefault(frame, len(frames)) for frame in stack])
+            weights.append(count * self.interval)
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "shared": {
+                "frames": [
+                    {"name": frame_name, "file": file, "line": line}
+                    for frame_name, file, line in frames
+                ]
+            },
+            "profiles": [
+                {
+                    "type": "sampled",
+                    "name": name,
+                    "unit": "seconds",
+                    "startValue": 0,
+                    "endValue": sum(weights),
+                    "samples": samples,
+                    "weights": weights,
+                }
+            ],
+        }
+
+
+def render_profile(profile: Profile, fmt: str, name: str) -> Tuple[str, str, str]:
+    """Profile file contents, its content type and file name."""
+    if fmt == FORMAT_SPEEDSCOPE:
+        body = json.dumps(profile.speedscope(name))
+        return body, "application/json", f"{name}.speedscope.json"
+    return profile.collapsed(), "text/plain", f"{name}.collapsed.txt"
+
+
+class SamplingProfiler:
+    """
+    Runs one profile at a time, for a number of seconds or until `requests`
+    requests (bot updates or HTTP requests) were handled, whichever comes
+    first. The request count is fed by `record_request`.
+    """
+
+    def __init__(self, interval: float, max_seconds: float):
+        self.interval = interval
+        self.max_seconds = max_seconds
+        self._busy = threading.Lock()
+        self._stop = threading.Event()
+        self._requests = 0
+        self._max_requests = None
+
+    def record_request(self):
+        if self._max_requests is None:
+            return
+        self._requests += 1
+        if self._requests >= self._max_requests:
+            self._stop.set()
+
+    async def profile(
+        self, seconds: float | None = None, requests: int | None = None
+    ) -> Profile:
+        if not self._busy.acquire(blocking=False):
+            raise ProfilerBusy("A profile is already running")
+        try:
+            seconds = min(seconds or self.max_seconds, self.max_seconds)
+            self._stop.clear()
+            self._requests = 0
+            self._max_requests = requests
+            return await asyncio.to_thread(self._sample, seconds)
+        finally:
+            self._max_requests = None
+            self._busy.release()
+
+    def _sample(self, seconds: float) -> Profile:
+        own_id = threading.get_ident()
+        names: Dict[int, str] = {}
+        stacks = Counter()
+        started = time.monotonic()
+        deadline = started + seconds
+        while not self._stop.wait(self.interval) and time.monotonic() < deadline:
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if thread_id not in names:
+                    names = {
+                        thread.ident: thread.name for thread in threading.enumerate()
+                    }
+                thread = (names.get(thread_id, str(thread_id)), "", 0)
+                stacks[(thread,) + _stack(frame)] += 1
+        return Profile(
+            stacks, self.interval, time.monotonic() - started, self._requests
+        )
+
+
+class LoopLagMonitor:
+    """
+    A heartbeat on the event loop records when the loop last ran; a watchdog
+    thread notices when it has not run for `threshold` seconds and takes the
+    stack of the loop thread at that moment, i.e. of the blocking code. The
+    stall is logged to `logger` with that stack once the loop runs again.
+    """
+
+    def __init__(self, threshold: float, logger: logging.Logger = logger):
+        self.threshold = threshold
+        self.logger = logger
+        self.interval = threshold / 2
+        self.stalls = 0
+        self.max_lag = 0.0
+        self._loop = None
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        # (heartbeat the stall started after, stack of the loop thread)
+        self._captured: Tuple[float, str] | None = None
+        self._handle = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """Starts monitoring the running loop, call from a coroutine."""
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._handle = self._loop.call_later(self.interval, self._beat)
+        self._stopped.clear()
+        threading.Thread(target=self._watch, daemon=True).start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._handle is not None:
+            self._handle.cancel()
+
+    def _beat(self):
+        now = time.monotonic()
+        previous, self._last_beat = self._last_beat, now
+        lag = now - previous - self.interval
+        if lag >= self.threshold:
+            self.stalls += 1
+            self.max_lag = max(self.max_lag, lag)
+            captured, self._captured = self._captured, None
+            if captured is not None and captured[0] == previous:
+                self.logger.warning(
+                    f"Event loop blocked for {lag * 1000:.0f} ms in:\n{captured[1]}"
+                )
+            else:
+                self.logger.warning(f"Event loop blocked for {lag * 1000:.0f} ms")
+        self._handle = self._loop.call_later(self.interval, self._beat)
+
+    def _watch(self):
+        while not self._stopped.wait(self.interval / 2):
+            beat = self._last_beat
+            if self._captured is not None and self._captured[0] == beat:
+                continue
+            if time.monotonic() - beat - self.interval < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._captured = (beat, "".join(traceback.format_stack(frame)))
@@ -0,0 +1,186 @@
+"""
+Admin list pages for large tables.
+
+The row count comes from the planner estimate (`EXPLAIN`) when that is above
+`exact_count_limit`, otherwise it is counted exactly. The previous and next
+page links carry a keyset cursor (sort value and id of the first or last row
+shown, with the sort it was taken for), so stepping through pages costs the
+same on every page; jumps to other pages use OFFSET.
+"""
+
+import base64
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Any, Tuple
+
+from sqlalchemy import Column, Select, asc, desc, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from sqladmin.pagination import PageControl, Pagination
+from starlette.datastructures import URL
+from starlette.requests import Request
+
+EXACT_COUNT_LIMIT = 10_000
+
+
+def encode_cursor(page: int, column: Column, is_desc: bool, value: Any, pk: Any) -> str:
+    if isinstance(value, (date, datetime)):
+        value = value.isoformat()
+    raw = json.dumps([page, column.key, is_desc, value, pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: str | None, page: int, column: Column, is_desc: bool
+) -> Tuple | None:
+    """
+    (sort value, id) of a cursor leading to `page` in the order of `column`
+    and `is_desc`, None if there is no cursor or it is invalid or stale (the
+    sort changed: sort links keep the cursor of the page they are on).
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        cursor_page, sort_by, cursor_desc, value, pk = json.loads(raw)
+        python_type = column.type.python_type
+        if python_type in (date, datetime):
+            value = python_type.fromisoformat(value)
+        else:
+            value = python_type(value)
+    except (ValueError, TypeError, NotImplementedError):
+        return None
+    if (cursor_page, sort_by, cursor_desc) != (page, column.key, is_desc):
+        return None
+    return value, pk
+
+
+async def estimate_rows(session: AsyncSession, stmt: Select) -> int:
+    """Row count of `stmt` estimated by the planner, without running it."""
+    sql = stmt.compile(
+        dialect=session.get_bind().dialect, compile_kwargs={"literal_binds": True}
+    )
+    conn = await session.connection()
+    result = await conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}")
+    plan = result.scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return int(plan[0]["Plan"]["Plan Rows"])
+
+
+@dataclass
+class KeysetPagination(Pagination):
+    next_cursor: str | None = None
+    previous_cursor: str | None = None
+
+    def _add_page_control(self, base_url: URL, page: int) -> None:
+        self.max_page_controls -= 1
+        url = base_url.remove_query_params(["after", "before"])
+        if page == self.page + 1 and self.next_cursor:
+            url = url.include_query_params(page=page, after=self.next_cursor)
+        elif page == self.page - 1 and self.previous_cursor:
+            url = url.include_query_params(page=page, before=self.previous_cursor)
+        else:
+            url = url.include_query_params(page=page)
+        self.page_controls.append(PageControl(number=page, url=str(url)))
+
+
+class ScalableListMixin:
+    """
+    Replaces `ModelView.list` with estimated counts and keyset paging. Goes
+    before `ModelView` in the bases.
+    """
+
+    exact_count_limit = EXACT_COUNT_LIMIT
+
+    def _sort_column(self, request: Request) -> Tuple[Column | None, bool]:
+        sort_by = request.query_params.get("sortBy")
+        if sort_by:
+            is_desc = request.query_params.get("sort", "asc") == "desc"
+        else:
+            sort_by, is_desc = self._get_default_sort()[0]
+        # Keyset paging needs a plain non-null column, others fall back to OFFSET
+        column = self.model.__table__.c.get(self._get_prop_name(sort_by))
+        if column is None or column.nullable:
+            return None, is_desc
+        return column, is_desc
+
+    async def count_rows(self, stmt: Select) -> int:
+        async with self.session_maker(expire_on_commit=False) as session:
+            estimate = await estimate_rows(session, stmt)
+            if estimate > self.exact_count_limit:
+                return estimate
+            result = await session.execute(
+                select(func.count()).select_from(stmt.order_by(None).subquery())
+            )
+            return result.scalar_one()
+
+    async def list(self, request: Request) -> Pagination:
+        page = self.validate_page_number(request.query_params.get("page"), 1)
+        page_size = self.validate_page_number(request.query_params.get("pageSize"), 0)
+        page_size = min(page_size or self.page_size, max(self.page_size_options))
+        search = request.query_params.get("search")
+
+        stmt = self.list_query(request)
+        if search:
+            stmt = self.search_query(stmt=stmt, term=search)
+        count = await self.count_rows(stmt)
+
+        for relation in self._list_relations:
+            stmt = stmt.options(selectinload(relation))
+        pk = self.pk_columns[0]
+        column, is_desc = self._sort_column(request)
+        after = before = None
+        if column is None:
+            stmt = self.sort_query(stmt, request)
+        else:
+            after = decode_cursor(
+                request.query_params.get("after"), page, column, is_desc
+            )
+            before = decode_cursor(
+                request.query_params.get("before"), page, column, is_desc
+            )
+            # Previous page: walk backwards from the cursor, then flip the rows
+            backwards = before is not None and after is None
+            descending = is_desc != backwards
+            order = desc if descending else asc
+            stmt = stmt.order_by(order(column), order(pk))
+            cursor = after or before
+            if cursor is not None:
+                key, value = tuple_(column, pk), tuple_(*cursor)
+                stmt = stmt.where(key < value if descending else key > value)
+
+        if after is None and before is None:
+            stmt = stmt.offset((page - 1) * page_size)
+        rows = list(await self._run_query(stmt.limit(page_size + 1)))
+        has_next = len(rows) > page_size or before is not None
+        rows = rows[:page_size]
+        if before is not None and after is None:
+            rows.reverse()
+
+        # An estimate may be off, the rows actually found are exact
+        shown = (page - 1) * page_size + len(rows)
+        count = max(count, shown + 1) if has_next else shown
+
+        pagination = KeysetPagination(
+            rows=rows, page=page, page_size=page_size, count=count
+        )
+        if column is not None and rows:
+            last, first = rows[-1], rows[0]
+            pagination.next_cursor = encode_cursor(
+                page + 1,
+                column,
+                is_desc,
+                getattr(last, column.key),
+                getattr(last, pk.key),
+            )
+            if page > 1:
+                pagination.previous_cursor = encode_cursor(
+                    page - 1,
+                    column,
+                    is_desc,
+                    getattr(first, column.key),
+                    getattr(first, pk.key),
+                )
+        return pagination
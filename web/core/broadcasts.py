@@ -0,0 +1,79 @@
+"""
+Broadcast campaigns: created in the admin panel, sent by the bot.
+
+The bot polls `/broadcasts/active`, sends a campaign to its registered users
+and reports its counters to `/broadcasts/{id}/progress`. The reply carries
+the campaign status, which is how a campaign cancelled in the admin panel
+stops: progress of a cancelled campaign is not recorded any more.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from web.db.models import BroadcastModel
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_CANCELLED = "cancelled"
+ACTIVE_STATUSES = (STATUS_PENDING, STATUS_RUNNING)
+
+
+async def active(session: AsyncSession) -> List[Dict]:
+    """Campaigns to send (or to go on sending), oldest first."""
+    result = await session.execute(
+        select(BroadcastModel.id, BroadcastModel.text)
+        .where(BroadcastModel.status.in_(ACTIVE_STATUSES))
+        .order_by(BroadcastModel.id)
+    )
+    return [{"id": row.id, "text": row.text} for row in result]
+
+
+async def record_progress(
+    session: AsyncSession,
+    broadcast_id: int,
+    counters: Dict[str, int],
+    done: bool,
+) -> str | None:
+    """
+    Stores the counters of an active campaign, returns its status (None if
+    there is no such campaign). The caller commits the session.
+    """
+    now = datetime.utcnow()
+    result = await session.execute(
+        update(BroadcastModel)
+        .where(
+            BroadcastModel.id == broadcast_id,
+            BroadcastModel.status.in_(ACTIVE_STATUSES),
+        )
+        .values(
+            **counters,
+            status=STATUS_DONE if done else STATUS_RUNNING,
+            started_at=func.coalesce(BroadcastModel.started_at, now),
+            updated_at=now,
+            finished_at=now if done else None,
+        )
+        .returning(BroadcastModel.status)
+    )
+    status = result.scalar()
+    if status is None:
+        status = await session.scalar(
+            select(BroadcastModel.status).where(BroadcastModel.id == broadcast_id)
+        )
+    return status
+
+
+async def cancel(session: AsyncSession, ids: List[int]) -> int:
+    """Cancels the active campaigns among `ids`, returns how many."""
+    result = await session.execute(
+        update(BroadcastModel)
+        .where(
+            BroadcastModel.id.in_(ids),
+            BroadcastModel.status.in_(ACTIVE_STATUSES),
+        )
+        .values(status=STATUS_CANCELLED, finished_at=datetime.utcnow())
+    )
+    return result.rowcount
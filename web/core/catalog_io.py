@@ -0,0 +1,224 @@
+"""
+Bulk catalog import and export.
+
+Imports are read as a stream of records (CSV, JSON Lines or a JSON array),
+validated and upserted in chunks of multi-row `INSERT ... ON CONFLICT`, all
+in one transaction. The whole import is recorded as a single "reload"
+catalog change, so the bot swaps its catalog once instead of applying every
+item. Exports stream the catalog with a server-side cursor.
+"""
+
+import codecs
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List
+
+from pydantic import BaseModel, Field, ValidationError
+from sqlalchemy import select, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from web.core import events
+from web.db.models import ItemChangeModel, ItemModel
+
+IMPORT_CHUNK_SIZE = 1000
+EXPORT_CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 100
+EXPORT_FIELDS = ("id", "name", "description", "price")
+
+FORMAT_CSV = "csv"
+FORMAT_JSONL = "jsonl"
+FORMAT_JSON = "json"
+
+
+class ItemImportSchema(BaseModel):
+    id: int | None = Field(None, gt=0)
+    name: str = Field(min_length=1, max_length=100)
+    description: str | None = Field(None, max_length=255)
+    price: float = Field(ge=0)
+
+
+@dataclass
+class ImportReport:
+    imported: int = 0
+    failed: int = 0
+    errors: List[str] = field(default_factory=list)
+    change: ItemChangeModel | None = None
+
+    def add_error(self, row: int, message: str):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"row {row}: {message}")
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "imported": self.imported,
+            "failed": self.failed,
+            "errors": self.errors,
+            "seq": self.change.seq if self.change else None,
+        }
+
+
+def detect_format(content_type: str | None, filename: str | None = None) -> str:
+    """Import format from the upload content type or file extension."""
+    content_type = (content_type or "").split(";")[0].strip().lower()
+    filename = (filename or "").lower()
+    if content_type in ("text/csv", "application/csv") or filename.endswith(".csv"):
+        return FORMAT_CSV
+    if content_type in (
+        "application/x-ndjson",
+        "application/jsonl",
+    ) or filename.endswith((".jsonl", ".ndjson")):
+        return FORMAT_JSONL
+    if content_type == "application/json" or filename.endswith(".json"):
+        return FORMAT_JSON
+    raise ValueError(f"Unsupported import format: {content_type or filename}")
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def _iter_csv(chunks: AsyncIterator[bytes]) -> AsyncIterator[Dict[str, Any]]:
+    header = None
+    record = ""
+    async for line in _iter_lines(chunks):
+        # A quoted value may span lines: a record ends on an even quote count
+        record += line
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        record = ""
+        if not values:
+            continue
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        yield {
+            name: value if value != "" else None for name, value in zip(header, values)
+        }
+
+
+async def iter_records(
+    chunks: AsyncIterator[bytes], fmt: str
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Records of an import stream. CSV and JSON Lines are parsed as they
+    arrive; a JSON array has to be read whole.
+    """
+    if fmt == FORMAT_CSV:
+        async for record in _iter_csv(chunks):
+            yield record
+    elif fmt == FORMAT_JSONL:
+        async for line in _iter_lines(chunks):
+            if line.strip():
+                yield json.loads(line)
+    else:
+        body = b"".join([chunk async for chunk in chunks])
+        for record in json.loads(body):
+            yield record
+
+
+async def _upsert_chunk(session: AsyncSession, rows: List[Dict[str, Any]]):
+    # Last row wins for duplicate ids: ON CONFLICT can't touch a row twice
+    with_id = {row["id"]: row for row in rows if row["id"] is not None}
+    without_id = [
+        {key: value for key, value in row.items() if key != "id"}
+        for row in rows
+        if row["id"] is None
+    ]
+    if with_id:
+        stmt = pg_insert(ItemModel).values(list(with_id.values()))
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[ItemModel.id],
+            set_={
+                "name": stmt.excluded.name,
+                "description": stmt.excluded.description,
+                "price": stmt.excluded.price,
+            },
+        )
+        await session.execute(stmt)
+    if without_id:
+        await session.execute(pg_insert(ItemModel).values(without_id))
+
+
+async def import_items(
+    session: AsyncSession, records: AsyncIterator[Dict[str, Any]]
+) -> ImportReport:
+    """
+    Validates and upserts the records, invalid ones are skipped and reported.
+    Records the import as one "reload" change, the caller commits the session
+    and publishes `report.change`.
+    """
+    report = ImportReport()
+    chunk: List[Dict[str, Any]] = []
+    row = 0
+    try:
+        async for record in records:
+            row += 1
+            try:
+                chunk.append(ItemImportSchema.model_validate(record).model_dump())
+            except ValidationError as e:
+                report.add_error(row, "; ".join(err["msg"] for err in e.errors()))
+                continue
+            if len(chunk) >= IMPORT_CHUNK_SIZE:
+                await _upsert_chunk(session, chunk)
+                report.imported += len(chunk)
+                chunk = []
+    except (ValueError, csv.Error) as e:
+        # json.JSONDecodeError and UnicodeDecodeError are ValueErrors too
+        report.add_error(row + 1, f"unreadable input: {e}")
+    if chunk:
+        await _upsert_chunk(session, chunk)
+        report.imported += len(chunk)
+
+    if report.imported:
+        # Explicit ids bypass the id sequence, move it past them
+        await session.execute(
+            text(
+                "SELECT setval(pg_get_serial_sequence('item', 'id'), "
+                "(SELECT max(id) FROM item))"
+            )
+        )
+        report.change = await events.record_change(session, events.OP_RELOAD, None)
+    return report
+
+
+async def export_items(
+    session_maker: async_sessionmaker, fmt: str, ids: List[int] | None = None
+) -> AsyncIterator[str]:
+    """
+    Streams items as CSV or JSON Lines, `EXPORT_CHUNK_SIZE` rows per read.
+    Owns its session, so it can outlive the request handler that returns it.
+    """
+    query = select(ItemModel).order_by(ItemModel.id)
+    if ids:
+        query = query.where(ItemModel.id.in_(ids))
+    async with session_maker() as session:
+        result = await session.stream_scalars(
+            query.execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        if fmt == FORMAT_CSV:
+            yield ",".join(EXPORT_FIELDS) + "\n"
+        async for items in result.partitions():
+            buffer = io.StringIO()
+            if fmt == FORMAT_CSV:
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    [getattr(item, name) for name in EXPORT_FIELDS] for item in items
+                )
+            else:
+                for item in items:
+                    buffer.write(json.dumps(events.item_payload(item)) + "\n")
+            yield buffer.getvalue()
@@ -15,10 +15,62 @@ RABBITMQ_PORT = os.getenv("RABBITMQ_PORT")
 RABBITMQ_USER = os.getenv("RABBITMQ_USER", "guest")
 RABBITMQ_PASSWORD = os.getenv("RABBITMQ_PASSWORD", "guest")
 
+# Catalog changes are broadcast to every bot replica
+ITEM_EXCHANGE = "item_events"
+# "json" or "msgpack" (requires the msgpack package)
+CATALOG_EVENT_FORMAT = os.getenv("CATALOG_EVENT_FORMAT", "json")
 
-def get_db_url():
+# Orders are partitioned by month: partitions are created this many months
+# ahead, months older than the retention are archived to ORDER_ARCHIVE_DIR
+# (0 keeps everything). Lists show the last ORDERS_RECENT_DAYS by default.
+ORDER_PARTITIONS_AHEAD = int(os.getenv("ORDER_PARTITIONS_AHEAD", 3))
+ORDER_RETENTION_MONTHS = int(os.getenv("ORDER_RETENTION_MONTHS", 12))
+ORDER_ARCHIVE_DIR = os.getenv("ORDER_ARCHIVE_DIR", "archive")
+ORDERS_RECENT_DAYS = int(os.getenv("ORDERS_RECENT_DAYS", 30))
+PARTITION_MAINTENANCE_INTERVAL = 24 * 3600
+
+# Read replicas as "host:port,host:port" (same credentials and database as
+# the primary). Replicas lagging more than DB_REPLICA_MAX_LAG seconds are
+# skipped; after a write the client reads from the primary for
+# DB_REPLICA_PIN_SECONDS, long enough for any replica in use to catch up.
+DB_REPLICA_HOSTS = [
+    host.strip()
+    for host in os.getenv("DB_REPLICA_HOSTS", "").split(",")
+    if host.strip()
+]
+DB_REPLICA_MAX_LAG = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+DB_REPLICA_CHECK_INTERVAL = float(os.getenv("DB_REPLICA_CHECK_INTERVAL", 5))
+DB_REPLICA_PIN_SECONDS = float(
+    os.getenv("DB_REPLICA_PIN_SECONDS", DB_REPLICA_MAX_LAG + DB_REPLICA_CHECK_INTERVAL)
+)
+
+# Item popularity (distinct viewers + POPULARITY_ADD_WEIGHT per add to a
+# cart) is recomputed from the item stats every POPULARITY_REFRESH_INTERVAL
+POPULARITY_REFRESH_INTERVAL = float(os.getenv("POPULARITY_REFRESH_INTERVAL", 300))
+POPULARITY_ADD_WEIGHT = int(os.getenv("POPULARITY_ADD_WEIGHT", 5))
+
+# "Frequently bought together" lists (RECS_TOP_K per item) are updated with
+# the orders placed every RECS_INTERVAL seconds (0 disables them, instances
+# without them answer 503 and the bot keeps its lists); orders younger than
+# RECS_GRACE_SECONDS wait for the next run. Needs numpy and scipy.
+RECS_INTERVAL = float(os.getenv("RECS_INTERVAL", 60))
+RECS_TOP_K = int(os.getenv("RECS_TOP_K", 10))
+RECS_GRACE_SECONDS = float(os.getenv("RECS_GRACE_SECONDS", 60))
+
+# Sampling profiler of the admin Profiler page, and logging of callbacks
+# blocking the event loop longer than the threshold (0 disables it)
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 10))
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 60))
+LOOP_LAG_THRESHOLD_MS = float(os.getenv("LOOP_LAG_THRESHOLD_MS", 100))
+
+
+def get_db_url(host: str | None = None):
+    """Primary database url, or the url of a replica at `host` ("host:port")."""
     db_host = os.getenv("DB_HOST", "localhost")
     db_port = os.getenv("DB_PORT")
+    if host:
+        db_host, _, port = host.partition(":")
+        db_port = port or db_port
     db_user = os.getenv("DB_USER", "postgres")
     db_password = os.getenv("DB_PASSWORD", "postgres")
     db_name = os.getenv("DB_NAME")
@@ -41,17 +93,11 @@ def setup_rabbitmq():
     _connection = get_rabbit_connection()
     _channel = _connection.channel()
     _channel.exchange_declare(exchange="reseller_exchange", exchange_type="direct")
+    _channel.exchange_declare(exchange=ITEM_EXCHANGE, exchange_type="fanout")
     _channel.queue_declare(queue="order_queue", durable=True)
-    _channel.queue_declare(queue="item_queue")
     _channel.queue_bind(
         queue="order_queue", exchange="reseller_exchange", routing_key="order_updates"
     )
-    _channel.queue_bind(
-        queue="item_queue", exchange="reseller_exchange", routing_key="item_updates"
-    )
-    _channel.queue_bind(
-        queue="item_queue", exchange="reseller_exchange", routing_key="item_deletes"
-    )
 
     return _connection, _channel
 
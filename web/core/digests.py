@@ -0,0 +1,37 @@
+"""
+Per-bucket digests of the catalog, compared by the bot with the digests it
+keeps in Redis to find drift (see `bot/db/digests.py` for the bot side).
+
+Items are put in `id % buckets` buckets. A row hash is the first 32 bits of
+the MD5 of `id, name, description, price in cents` joined by the unit
+separator, and a bucket digest is the number of items and the sum of their
+row hashes, computed in one aggregate query.
+"""
+
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from web.db.models import ItemModel
+
+DEFAULT_BUCKETS = 1024
+MAX_BUCKETS = 65536
+
+DIGEST_QUERY = text(
+    "SELECT id % :buckets AS bucket, count(*) AS items, sum(("
+    "'x' || lpad(substr(md5(concat_ws(chr(31), id, name, coalesce(description, ''), "
+    "round(price * 100)::bigint)), 1, 8), 16, '0'))::bit(64)::bigint) AS digest "
+    "FROM item GROUP BY 1"
+)
+
+
+async def bucket_digests(session: AsyncSession, buckets: int) -> Dict[int, List[int]]:
+    """[number of items, sum of row hashes] of every non-empty bucket."""
+    result = await session.execute(DIGEST_QUERY, {"buckets": buckets})
+    return {bucket: [items, int(digest)] for bucket, items, digest in result}
+
+
+def in_bucket(bucket: int, buckets: int):
+    """Filter of the items in a bucket."""
+    return ItemModel.id % buckets == bucket
@@ -0,0 +1,108 @@
+import json
+from typing import Any, Dict, List
+
+import pika
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from web.core import config
+from web.db.models import ItemChangeModel, ItemModel
+from web.tools.helpers import decimal_default
+
+try:
+    import msgpack
+except ImportError:  # msgpack is optional, events fall back to JSON
+    msgpack = None
+
+
+ENVELOPE_VERSION = 1
+# Advisory lock serializing the writers of the change log
+CHANGE_LOG_LOCK = 0x1C4A7A10
+
+OP_UPSERT = "upsert"
+OP_DELETE = "delete"
+# Many items changed at once (bulk import): consumers reload the whole catalog
+OP_RELOAD = "reload"
+
+
+def item_payload(item: ItemModel, stock_delta: int | None = None) -> Dict[str, Any]:
+    """
+    Item snapshot of a change. `stock_delta` is the stock change made by an
+    admin edit: the bot applies it to its own counters, which are ahead of
+    `stock` by the sales not written back yet.
+    """
+    payload = {
+        "id": item.id,
+        "name": item.name,
+        "description": item.description or "",
+        "price": item.price,
+        "stock": item.stock,
+    }
+    if stock_delta is not None:
+        payload["stock_delta"] = stock_delta
+    return payload
+
+
+def build_envelope(change: ItemChangeModel) -> Dict[str, Any]:
+    """
+    Versioned catalog event, the same shape for every operation:
+    {"v": 1, "seq": 42, "op": "upsert" | "delete" | "reload", "id": 7 | null,
+     "item": {...} | null}
+    """
+    return {
+        "v": ENVELOPE_VERSION,
+        "seq": change.seq,
+        "op": change.op,
+        "id": change.item_id,
+        "item": change.payload,
+    }
+
+
+async def record_change(
+    session: AsyncSession, op: str, item_id: int | None, payload: Dict | None = None
+) -> ItemChangeModel:
+    """
+    Appends a change to the log, the caller commits the session. Writers
+    take turns until they commit, so changes become visible in seq order:
+    a consumer that saw seq N+1 before N would skip N as stale for good.
+    """
+    await session.execute(select(func.pg_advisory_xact_lock(CHANGE_LOG_LOCK)))
+    change = ItemChangeModel(op=op, item_id=item_id, payload=payload)
+    session.add(change)
+    await session.flush()
+    return change
+
+
+async def get_catalog_seq(session: AsyncSession) -> int:
+    result = await session.execute(select(func.max(ItemChangeModel.seq)))
+    return result.scalar() or 0
+
+
+async def get_changes(
+    session: AsyncSession, since: int, limit: int
+) -> List[Dict[str, Any]]:
+    result = await session.execute(
+        select(ItemChangeModel)
+        .where(ItemChangeModel.seq > since)
+        .order_by(ItemChangeModel.seq)
+        .limit(limit)
+    )
+    return [build_envelope(change) for change in result.scalars()]
+
+
+def publish_change(change: ItemChangeModel):
+    """Broadcasts the change to every bot replica."""
+    envelope = build_envelope(change)
+    if config.CATALOG_EVENT_FORMAT == "msgpack" and msgpack is not None:
+        body = msgpack.packb(envelope)
+        content_type = "application/msgpack"
+    else:
+        body = json.dumps(envelope, default=decimal_default)
+        content_type = "application/json"
+
+    config.rabbit_channel.basic_publish(
+        exchange=config.ITEM_EXCHANGE,
+        routing_key="",
+        body=body,
+        properties=pika.BasicProperties(content_type=content_type),
+    )
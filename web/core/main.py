@@ -1,22 +1,51 @@
+import asyncio
 import json
 import logging
+import os
 from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
 
-from typing import Any, AsyncGenerator, Dict
-from web.tools.helpers import generate_items, decimal_default
+from typing import Any, AsyncGenerator, AsyncIterator, Dict
+from web.tools.helpers import generate_items
 
-from fastapi import FastAPI, Header, Depends, Response
+from fastapi import FastAPI, Header, Depends, Query, Response
+from fastapi.responses import RedirectResponse, StreamingResponse
 from web.core.admin_auth import authentication_backend
 from fastapi.exceptions import HTTPException
-from sqladmin import Admin, ModelView
-from sqlalchemy import select
+from sqladmin import Admin, BaseView, ModelView, action, expose
+from sqlalchemy import Select, delete, select, text
+from starlette.middleware import Middleware
 from starlette.requests import Request
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from web.db.models import Base, OrderItemModel, OrderModel, ItemModel
-from web.core import config
-from web.schemas.schemas import ItemSchema
+from web.db import partitions, replicas
+from web.db.models import (
+    Base,
+    BroadcastModel,
+    OrderItemModel,
+    OrderModel,
+    ItemModel,
+)
+from web.core import (
+    broadcasts,
+    catalog_io,
+    config,
+    digests,
+    events,
+    orders_io,
+    profiler,
+    recommendations,
+    stats,
+    stock,
+)
+from web.core.admin_lists import ScalableListMixin
+from web.schemas.schemas import (
+    BroadcastProgressSchema,
+    ItemSchema,
+    ItemStatsSchema,
+    StockSalesSchema,
+)
 
 
 logging.basicConfig(
@@ -26,7 +55,18 @@ logger = logging.getLogger("reseller")
 
 engine = create_async_engine(config.get_db_url(), echo=True)
 SessionLocal = async_sessionmaker(
-    bind=engine, class_=AsyncSession, expire_on_commit=False
+    bind=engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    sync_session_class=replicas.RoutingSession,
+)
+replica_pool = replicas.ReplicaPool(
+    engine,
+    [
+        create_async_engine(config.get_db_url(host), echo=True)
+        for host in config.DB_REPLICA_HOSTS
+    ],
+    config.DB_REPLICA_MAX_LAG,
 )
 
 
@@ -40,6 +80,28 @@ async def create_tables():
             _logger = logging.getLogger("sqlalchemy.engine")
             _logger.setLevel(logging.DEBUG)
             await conn.run_sync(Base.metadata.create_all, checkfirst=True)
+            # Added after the item table, create_all does not alter tables
+            await conn.execute(
+                text(
+                    "ALTER TABLE order_item ADD COLUMN IF NOT EXISTS "
+                    "quantity INTEGER NOT NULL DEFAULT 1"
+                )
+            )
+            await conn.execute(
+                text("ALTER TABLE item ADD COLUMN IF NOT EXISTS stock INTEGER")
+            )
+            await conn.execute(
+                text(
+                    "ALTER TABLE item ADD COLUMN IF NOT EXISTS "
+                    "popularity INTEGER NOT NULL DEFAULT 0"
+                )
+            )
+            await conn.execute(
+                text(
+                    "CREATE INDEX IF NOT EXISTS ix_item_popularity_id "
+                    "ON item (popularity, id)"
+                )
+            )
             logger.info("DB tables created")
         except SQLAlchemyError as e:
             logger.error(f"Error creating tables: {e}")
@@ -68,6 +130,74 @@ async def get_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+async def get_read_session(request: Request) -> AsyncGenerator[AsyncSession, None]:
+    """
+    Dependency for read-only endpoints: a session on a replica, or on the
+    primary for clients that wrote recently and when no replica is in sync.
+    """
+    read_engine = replica_pool.read_engine(replicas.is_pinned(request))
+    async with SessionLocal(bind=read_engine) as session:
+        yield session
+
+
+def recent_orders_since(days: int) -> datetime:
+    return datetime.utcnow() - timedelta(days=days)
+
+
+async def maintain_partitions():
+    """
+    Creates the upcoming order partitions and archives the expired ones,
+    then repeats daily. Startup creates the partitions before serving, so a
+    failure here only delays the rollover.
+    """
+    while True:
+        try:
+            async with engine.begin() as conn:
+                await partitions.ensure_partitions(conn, config.ORDER_PARTITIONS_AHEAD)
+            if config.ORDER_RETENTION_MONTHS:
+                await partitions.archive_partitions(
+                    engine, config.ORDER_RETENTION_MONTHS, config.ORDER_ARCHIVE_DIR
+                )
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Order partition maintenance failed: {e}")
+        await asyncio.sleep(config.PARTITION_MAINTENANCE_INTERVAL)
+
+
+async def refresh_popularity():
+    """Recomputes the popularity of items from their stats, periodically."""
+    while True:
+        try:
+            async with SessionLocal() as session:
+                async with session.begin():
+                    updated = await stats.refresh_popularity(
+                        session, config.POPULARITY_ADD_WEIGHT
+                    )
+            if updated:
+                logger.info(f"Popularity of {updated} items updated")
+        except SQLAlchemyError as e:
+            logger.error(f"Popularity refresh failed: {e}")
+        await asyncio.sleep(config.POPULARITY_REFRESH_INTERVAL)
+
+
+async def update_recommendations(
+    co_occurrence: recommendations.CoOccurrence,
+    history: recommendations.OrderHistory,
+):
+    """Folds the orders placed since the last run into the recommendations."""
+    while True:
+        try:
+            order_ids, item_ids = await history.read_new_lines(engine)
+            changed = await asyncio.to_thread(co_occurrence.update, order_ids, item_ids)
+            if changed:
+                logger.info(
+                    f"Recommendations of {changed} items updated "
+                    f"from {len(order_ids)} order lines"
+                )
+        except (SQLAlchemyError, OSError) as e:
+            logger.error(f"Recommendations update failed: {e}")
+        await asyncio.sleep(config.RECS_INTERVAL)
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -76,21 +206,115 @@ async def lifespan(app: FastAPI):
     await create_tables()
     await seed_data()
 
+    maintenance = None
+    async with engine.begin() as conn:
+        partitioned = await partitions.is_partitioned(conn)
+        if partitioned:
+            # Orders can't be taken until their partition exists
+            await partitions.ensure_partitions(conn, config.ORDER_PARTITIONS_AHEAD)
+    if partitioned:
+        maintenance = asyncio.create_task(maintain_partitions())
+    else:
+        logger.warning(
+            "Order tables are not partitioned, run "
+            "`python -m web.tools.orders_archive migrate` to convert them"
+        )
+
+    replica_monitor = None
+    if replica_pool.replicas:
+        await replica_pool.check()
+        replica_monitor = asyncio.create_task(
+            replica_pool.monitor(config.DB_REPLICA_CHECK_INTERVAL)
+        )
+
+    popularity = asyncio.create_task(refresh_popularity())
+
+    recs_updater = None
+    if co_occurrence is not None:
+        recs_updater = asyncio.create_task(
+            update_recommendations(
+                co_occurrence,
+                recommendations.OrderHistory(config.RECS_GRACE_SECONDS),
+            )
+        )
+    elif config.RECS_INTERVAL:
+        logger.warning("numpy and scipy are not installed, recommendations are off")
+
+    if loop_monitor is not None:
+        loop_monitor.start()
+
     yield
+    if loop_monitor is not None:
+        loop_monitor.stop()
+    for task in (maintenance, replica_monitor, popularity, recs_updater):
+        if task is not None:
+            task.cancel()
+    await replica_pool.dispose()
     await engine.dispose()
 
 
+sampling_profiler = profiler.SamplingProfiler(
+    config.PROFILE_INTERVAL_MS / 1000, config.PROFILE_MAX_SECONDS
+)
+co_occurrence = (
+    recommendations.CoOccurrence(config.RECS_TOP_K)
+    if config.RECS_INTERVAL and recommendations.available()
+    else None
+)
+loop_monitor = (
+    profiler.LoopLagMonitor(config.LOOP_LAG_THRESHOLD_MS / 1000)
+    if config.LOOP_LAG_THRESHOLD_MS
+    else None
+)
+
 app = FastAPI(lifespan=lifespan)
+app.add_middleware(profiler.RequestCounter, profiler=sampling_profiler)
 admin = Admin(
     app,
     engine,
     session_maker=SessionLocal,
     authentication_backend=authentication_backend,
+    middlewares=[
+        Middleware(
+            replicas.AdminReadRouting,
+            pool=replica_pool,
+            pin_seconds=config.DB_REPLICA_PIN_SECONDS,
+        )
+    ],
+    templates_dir=os.path.join(os.path.dirname(__file__), "..", "templates"),
 )
 
 
+async def run_import(chunks: AsyncIterator[bytes], fmt: str) -> catalog_io.ImportReport:
+    """Imports a catalog stream in one transaction and broadcasts it once."""
+    async with SessionLocal() as session:
+        async with session.begin():
+            report = await catalog_io.import_items(
+                session, catalog_io.iter_records(chunks, fmt)
+            )
+    if report.change is not None:
+        events.publish_change(report.change)
+    logger.info(f"Catalog import: {report.imported} items, {report.failed} failed")
+    return report
+
+
+def export_response(fmt: str, ids: list[int] | None = None) -> StreamingResponse:
+    media_type = "text/csv" if fmt == catalog_io.FORMAT_CSV else "application/x-ndjson"
+    return StreamingResponse(
+        catalog_io.export_items(SessionLocal, fmt, ids),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="items.{fmt}"'},
+    )
+
+
+def selected_ids(request: Request) -> list[int]:
+    """Ids of the rows selected for an admin action, empty if none are"""
+    pks = request.query_params.get("pks", "")
+    return [int(pk) for pk in pks.split(",") if pk]
+
+
 # Init admin views in main module to avoid circular imports
-class OrderAdmin(ModelView, model=OrderModel):
+class OrderAdmin(ScalableListMixin, ModelView, model=OrderModel):
     is_async = True
     name_plural = "Orders"
     can_edit = True
@@ -99,6 +323,7 @@ class OrderAdmin(ModelView, model=OrderModel):
     column_list = [OrderModel.id, OrderModel.created_at, OrderModel.user_id]
     column_searchable_list = [OrderModel.user_id]
     column_filters = [OrderModel.user_id]
+    column_default_sort = [(OrderModel.created_at, True)]
 
     column_details_list = [
         OrderModel.created_at,
@@ -114,59 +339,275 @@ class OrderAdmin(ModelView, model=OrderModel):
         OrderModel.username: "Telegram Username",
     }
 
+    def list_query(self, request: Request) -> Select:
+        # Recent orders only, so the list doesn't scan every partition
+        return select(OrderModel).where(
+            OrderModel.created_at >= recent_orders_since(config.ORDERS_RECENT_DAYS)
+        )
+
+    @action(
+        name="delete_selected",
+        label="Delete selected",
+        confirmation_message="Delete the selected orders?",
+        add_in_detail=False,
+    )
+    async def delete_selected(self, request: Request) -> RedirectResponse:
+        """Deletes the selected orders (and their lines) in one statement"""
+        ids = selected_ids(request)
+        if ids:
+            async with SessionLocal() as session:
+                async with session.begin():
+                    result = await session.execute(
+                        delete(OrderModel).where(OrderModel.id.in_(ids))
+                    )
+            logger.info(f"Deleted {result.rowcount} orders from admin")
+        response = RedirectResponse(
+            request.url_for("admin:list", identity=self.identity), status_code=302
+        )
+        replicas.pin(response, config.DB_REPLICA_PIN_SECONDS)
+        return response
+
+    @action(name="export", label="Export CSV", add_in_detail=False)
+    async def export_orders(self, request: Request) -> StreamingResponse:
+        """Exports the selected orders, or all listed (recent) orders if none selected"""
+        ids = selected_ids(request)
+        since = None if ids else recent_orders_since(config.ORDERS_RECENT_DAYS)
+        return StreamingResponse(
+            orders_io.export_orders(SessionLocal, ids, since),
+            media_type="text/csv",
+            headers={"Content-Disposition": 'attachment; filename="orders.csv"'},
+        )
 
-class ItemAdmin(ModelView, model=ItemModel):
+
+class ItemAdmin(ScalableListMixin, ModelView, model=ItemModel):
     is_async = True
     name_plural = "Items"
-    column_list = [ItemModel.id, ItemModel.name, ItemModel.price]
+    column_list = [
+        ItemModel.id,
+        ItemModel.name,
+        ItemModel.price,
+        ItemModel.stock,
+        ItemModel.popularity,
+    ]
     column_searchable_list = [ItemModel.name]
     column_filters = [ItemModel.name]
+    # Popularity is precomputed and indexed, sorting by it pages by keyset
+    column_sortable_list = [ItemModel.id, ItemModel.popularity]
+    form_excluded_columns = [ItemModel.popularity, ItemModel.order_items]
 
-    column_details_list = [ItemModel.name, ItemModel.description, ItemModel.price]
+    column_details_list = [
+        ItemModel.name,
+        ItemModel.description,
+        ItemModel.price,
+        ItemModel.stock,
+        ItemModel.popularity,
+    ]
 
     column_labels = {
         ItemModel.name: "Name",
         ItemModel.description: "Description",
         ItemModel.price: "Price",
+        ItemModel.stock: "Stock",
+        ItemModel.popularity: "Popularity",
+    }
+
+    async def insert_model(self, request: Request, data: dict) -> Any:
+        return await self.save_item(data)
+
+    async def update_model(self, request: Request, pk: str, data: dict) -> Any:
+        return await self.save_item(data, int(pk))
+
+    async def save_item(self, data: dict, item_id: int | None = None) -> ItemModel:
+        """
+        Saves the item and logs the change in one transaction, so no edit is
+        committed without its event, then publishes it to RabbitMQ. A new
+        stock of a limited item is also sent as the change made to it, so the
+        bot can apply it to its counters, which are ahead by unsent sales
+        """
+        stock_delta = None
+        async with SessionLocal() as session:
+            async with session.begin():
+                if item_id is None:
+                    item = ItemModel()
+                    session.add(item)
+                else:
+                    # Locked, so sales written back meanwhile are not overwritten
+                    item = await session.get(ItemModel, item_id, with_for_update=True)
+                    new_stock = data.get("stock")
+                    if item.stock is not None and new_stock is not None:
+                        stock_delta = new_stock - item.stock
+                for name, value in data.items():
+                    setattr(item, name, value)
+                await session.flush()
+                change = await events.record_change(
+                    session,
+                    events.OP_UPSERT,
+                    item.id,
+                    events.item_payload(item, stock_delta),
+                )
+        events.publish_change(change)
+        return item
+
+    async def delete_model(self, request: Request, pk: Any) -> None:
+        """Deletes the item and logs the deletion in one transaction"""
+        async with SessionLocal() as session:
+            async with session.begin():
+                item = await session.get(ItemModel, int(pk))
+                await session.delete(item)
+                change = await events.record_change(session, events.OP_DELETE, item.id)
+        events.publish_change(change)
+
+    @action(name="export", label="Export CSV", add_in_detail=False)
+    async def export_items(self, request: Request) -> StreamingResponse:
+        """Exports the selected items, or the whole catalog if none selected"""
+        return export_response(catalog_io.FORMAT_CSV, selected_ids(request))
+
+
+class BroadcastAdmin(ModelView, model=BroadcastModel):
+    is_async = True
+    name_plural = "Broadcasts"
+    can_edit = False
+    can_delete = False
+    # A campaign is created with its text, the bot fills in the rest
+    form_columns = [BroadcastModel.text]
+    column_list = [
+        BroadcastModel.id,
+        BroadcastModel.status,
+        BroadcastModel.created_at,
+        BroadcastModel.total,
+        BroadcastModel.sent,
+        BroadcastModel.failed,
+        BroadcastModel.blocked,
+        "rate",
+        "eta",
+    ]
+    column_default_sort = [(BroadcastModel.id, True)]
+
+    column_details_list = [
+        BroadcastModel.text,
+        BroadcastModel.status,
+        BroadcastModel.created_at,
+        BroadcastModel.started_at,
+        BroadcastModel.updated_at,
+        BroadcastModel.finished_at,
+        BroadcastModel.total,
+        BroadcastModel.sent,
+        BroadcastModel.failed,
+        BroadcastModel.blocked,
+        "rate",
+        "eta",
+    ]
+
+    column_labels = {
+        BroadcastModel.text: "Text",
+        BroadcastModel.status: "Status",
+        BroadcastModel.created_at: "Created At",
+        BroadcastModel.started_at: "Started At",
+        BroadcastModel.updated_at: "Updated At",
+        BroadcastModel.finished_at: "Finished At",
+        BroadcastModel.total: "Users",
+        BroadcastModel.sent: "Sent",
+        BroadcastModel.failed: "Failed",
+        BroadcastModel.blocked: "Blocked",
+        "rate": "Messages/s",
+        "eta": "ETA",
     }
 
-    async def after_model_change(
-        self, data: dict, model: Any, is_created: bool, request: Request
-    ) -> None:
-        """Publish item updates to RabbitMQ"""
-        message = {
-            "id": model.id,
-            "name": model.name,
-            "description": model.description or "",
-            "price": model.price,
-        }
-
-        config.rabbit_channel.basic_publish(
-            exchange="reseller_exchange",
-            routing_key="item_updates",
-            body=json.dumps(message, default=decimal_default),
+    @action(
+        name="cancel",
+        label="Cancel",
+        confirmation_message="Stop sending the selected broadcasts?",
+    )
+    async def cancel_selected(self, request: Request) -> RedirectResponse:
+        """Cancels the selected campaigns, the bot stops at its next report"""
+        ids = selected_ids(request)
+        if ids:
+            async with SessionLocal() as session:
+                async with session.begin():
+                    cancelled = await broadcasts.cancel(session, ids)
+            logger.info(f"Cancelled {cancelled} broadcasts from admin")
+        response = RedirectResponse(
+            request.url_for("admin:list", identity=self.identity), status_code=302
         )
+        replicas.pin(response, config.DB_REPLICA_PIN_SECONDS)
+        return response
+
+
+async def iter_upload(upload, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+    while chunk := await upload.read(chunk_size):
+        yield chunk
+
+
+class CatalogImportView(BaseView):
+    name = "Import Items"
+    icon = "fa-solid fa-file-import"
+
+    @expose("/items/import", methods=["GET", "POST"])
+    async def import_page(self, request: Request):
+        report, error = None, None
+        if request.method == "POST":
+            form = await request.form()
+            upload = form["file"]
+            try:
+                fmt = catalog_io.detect_format(upload.content_type, upload.filename)
+            except ValueError as e:
+                error = str(e)
+            else:
+                report = await run_import(iter_upload(upload), fmt)
+        return await self.templates.TemplateResponse(
+            request, "catalog_import.html", {"report": report, "error": error}
+        )
+
 
-    async def after_model_delete(self, model: Any, request: Request) -> None:
-        """Publish item deletion to RabbitMQ"""
-        message = {
-            "channel": "item_deletes",
-            "id": model.id,
-            "name": model.name,
-            "description": model.description or "",
-            "price": model.price,
-            "deleted": True,
-        }
-
-        config.rabbit_channel.basic_publish(
-            exchange="reseller_exchange",
-            routing_key="item_deletes",
-            body=json.dumps(message),
+class ProfilerView(BaseView):
+    name = "Profiler"
+    icon = "fa-solid fa-gauge-high"
+
+    @expose("/profile", methods=["GET"])
+    async def profile_page(self, request: Request):
+        """
+        Samples the stacks of the web process for `seconds` or until
+        `requests` requests were handled, and downloads the profile.
+        """
+        query = request.query_params
+        error = None
+        if "seconds" in query or "requests" in query:
+            fmt = query.get("format", profiler.FORMAT_COLLAPSED)
+            try:
+                requests = int(query["requests"]) if query.get("requests") else None
+                seconds = float(query.get("seconds") or 0)
+                if fmt not in (profiler.FORMAT_COLLAPSED, profiler.FORMAT_SPEEDSCOPE):
+                    raise ValueError(f"Unknown format: {fmt}")
+                profile = await sampling_profiler.profile(seconds, requests)
+            except (ValueError, profiler.ProfilerBusy) as e:
+                error = str(e)
+            else:
+                body, content_type, filename = profiler.render_profile(
+                    profile, fmt, "web"
+                )
+                logger.info(
+                    f"Profiled {profile.duration:.1f}s, {profile.requests} requests, "
+                    f"{sum(profile.stacks.values())} samples"
+                )
+                return Response(
+                    body,
+                    media_type=content_type,
+                    headers={
+                        "Content-Disposition": f'attachment; filename="{filename}"'
+                    },
+                )
+        return await self.templates.TemplateResponse(
+            request,
+            "profiler.html",
+            {"error": error, "max_seconds": sampling_profiler.max_seconds},
         )
 
 
 admin.add_view(ItemAdmin)
 admin.add_view(OrderAdmin)
+admin.add_view(BroadcastAdmin)
+admin.add_view(CatalogImportView)
+admin.add_view(ProfilerView)
 
 
 # Middleware
@@ -177,15 +618,164 @@ async def verify_api_key(x_api_key: str = Header(...)):
 
 
 @app.get("/items/", dependencies=[Depends(verify_api_key)])
-async def get_items(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(ItemModel))
+async def get_items(
+    response: Response,
+    bucket: int | None = Query(None, ge=0),
+    buckets: int = Query(digests.DEFAULT_BUCKETS, gt=0, le=digests.MAX_BUCKETS),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """All items, or the items of one digest bucket (see `/items/digests`)."""
+    # Read the sequence first: changes that land in between are replayed by
+    # the client later, and applying a change twice is harmless
+    response.headers["X-Catalog-Seq"] = str(await events.get_catalog_seq(session))
+    query = select(ItemModel)
+    if bucket is not None:
+        query = query.where(digests.in_bucket(bucket, buckets))
+    result = await session.execute(query)
     items = result.fetchall()
     return [ItemSchema.model_validate(item[0]) for item in items]
 
 
+@app.post("/items/import", dependencies=[Depends(verify_api_key)])
+async def import_items(request: Request, response: Response):
+    """
+    Bulk upsert of items from the request body: CSV (text/csv), JSON Lines
+    (application/x-ndjson) or a JSON array (application/json). Items with an
+    id are updated or created with that id, items without one are created.
+    """
+    try:
+        fmt = catalog_io.detect_format(request.headers.get("content-type"))
+    except ValueError as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    report = await run_import(request.stream(), fmt)
+    replicas.pin(response, config.DB_REPLICA_PIN_SECONDS)
+    return report.as_dict()
+
+
+@app.post("/items/stock", dependencies=[Depends(verify_api_key)])
+async def write_back_sales(
+    sales: StockSalesSchema, session: AsyncSession = Depends(get_session)
+):
+    """Subtracts a batch of units sold by the bot from item stock, once."""
+    async with session.begin():
+        applied = await stock.apply_sales(session, sales.batch, sales.sold)
+    if applied:
+        logger.info(f"Applied sales batch {sales.batch} of {len(sales.sold)} items")
+    return {"applied": applied}
+
+
+@app.post("/items/stats", dependencies=[Depends(verify_api_key)])
+async def roll_up_item_stats(
+    batch: ItemStatsSchema, session: AsyncSession = Depends(get_session)
+):
+    """Adds a batch of item view and add-to-cart counters from the bot, once."""
+    async with session.begin():
+        applied = await stats.apply_rollup(
+            session, batch.batch, batch.views, batch.adds, batch.viewers
+        )
+    return {"applied": applied}
+
+
+@app.get("/items/popular", dependencies=[Depends(verify_api_key)])
+async def get_popular_items(
+    limit: int = Query(1000, gt=0, le=10000),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Ids of the most popular items by the last popularity refresh."""
+    return {"ids": await stats.ranking(session, limit)}
+
+
+@app.get("/items/recommendations", dependencies=[Depends(verify_api_key)])
+async def get_recommendations(
+    generation: str | None = None, since: int = Query(0, ge=0)
+):
+    """
+    Items most often bought together with each item, for the lists changed
+    after version `since` of `generation`; all lists for another generation.
+    """
+    if co_occurrence is None or not co_occurrence.built:
+        # Not computed here (yet), the bot keeps the lists it has
+        raise HTTPException(status_code=503, detail="Recommendations not available")
+    return co_occurrence.changes(generation, since)
+
+
+@app.get("/items/export", dependencies=[Depends(verify_api_key)])
+async def export_items(
+    format: str = Query(catalog_io.FORMAT_CSV, pattern="^(csv|jsonl)$"),
+):
+    return export_response(format)
+
+
+@app.get("/items/version", dependencies=[Depends(verify_api_key)])
+async def get_items_version(session: AsyncSession = Depends(get_session)):
+    return {"seq": await events.get_catalog_seq(session)}
+
+
+@app.get("/items/digests", dependencies=[Depends(verify_api_key)])
+async def get_item_digests(
+    buckets: int = Query(digests.DEFAULT_BUCKETS, gt=0, le=digests.MAX_BUCKETS),
+    session: AsyncSession = Depends(get_session),
+):
+    """Digests of the catalog buckets and the catalog sequence they are at."""
+    # One snapshot for both, so the digests are exactly those of `seq`
+    await session.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    return {
+        "seq": await events.get_catalog_seq(session),
+        "buckets": await digests.bucket_digests(session, buckets),
+    }
+
+
+@app.get("/items/changes", dependencies=[Depends(verify_api_key)])
+async def get_item_changes(
+    since: int = 0,
+    limit: int = Query(1000, gt=0, le=10000),
+    session: AsyncSession = Depends(get_session),
+):
+    """Catalog changes with seq greater than `since`, oldest first."""
+    return {
+        "seq": await events.get_catalog_seq(session),
+        "changes": await events.get_changes(session, since, limit),
+    }
+
+
+@app.get("/broadcasts/active", dependencies=[Depends(verify_api_key)])
+async def get_active_broadcasts(session: AsyncSession = Depends(get_session)):
+    """Broadcast campaigns pending or being sent."""
+    return await broadcasts.active(session)
+
+
+@app.post("/broadcasts/{broadcast_id}/progress", dependencies=[Depends(verify_api_key)])
+async def report_broadcast_progress(
+    broadcast_id: int,
+    progress: BroadcastProgressSchema,
+    session: AsyncSession = Depends(get_session),
+):
+    """Stores the counters of a campaign, returns its status to the bot."""
+    async with session.begin():
+        status = await broadcasts.record_progress(
+            session,
+            broadcast_id,
+            progress.model_dump(exclude={"done"}),
+            progress.done,
+        )
+    if status is None:
+        raise HTTPException(status_code=404, detail="Broadcast not found")
+    if progress.done and status == broadcasts.STATUS_DONE:
+        logger.info(f"Broadcast {broadcast_id} finished: {progress.sent} sent")
+    return {"status": status}
+
+
 @app.get("/orders/", dependencies=[Depends(verify_api_key)])
-async def get_orders(session: AsyncSession = Depends(get_session)):
-    result = await session.execute(select(OrderModel))
+async def get_orders(
+    days: int = Query(config.ORDERS_RECENT_DAYS, ge=1),
+    session: AsyncSession = Depends(get_read_session),
+):
+    """Orders of the last `days` days, only their partitions are scanned."""
+    result = await session.execute(
+        select(OrderModel)
+        .where(OrderModel.created_at >= recent_orders_since(days))
+        .order_by(OrderModel.created_at.desc())
+    )
     orders = result.fetchall()
     return [order[0] for order in orders]
 
@@ -200,17 +790,19 @@ async def create_order(
 
     try:
         async with session.begin():
-            new_order = OrderModel(**order_data)
+            # Lines are added through the relationship, which fills in both
+            # columns of their order key (order_id, created_at)
+            new_order = OrderModel(
+                **order_data,
+                order_items=[
+                    OrderItemModel(
+                        item_id=item_data["id"], quantity=item_data.get("qty", 1)
+                    )
+                    for item_data in order_items_data
+                ],
+            )
             session.add(new_order)
             await session.flush()
-
-            for item_data in order_items_data:
-                order_item = OrderItemModel(
-                    order_id=new_order.id, item_id=item_data["id"]
-                )
-                session.add(order_item)
-
-            await session.flush()
         await session.refresh(new_order)
 
     except SQLAlchemyError as e:
@@ -221,7 +813,9 @@ async def create_order(
         logger.error(f"Error creating order: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error creating order: {str(e)}")
     logger.info(f"Order created: {new_order}")
-    return Response(status_code=201, content=json.dumps({"order_id": new_order.id}))
+    response = Response(status_code=201, content=json.dumps({"order_id": new_order.id}))
+    replicas.pin(response, config.DB_REPLICA_PIN_SECONDS)
+    return response
 
 
 if __name__ == "__main__":
@@ -0,0 +1,65 @@
+"""
+Order export for the admin panel, one set-based query streamed as CSV.
+"""
+
+import csv
+import io
+from datetime import datetime
+from typing import AsyncIterator, List
+
+from sqlalchemy import String, cast, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from web.db.models import ItemModel, OrderItemModel, OrderModel
+
+EXPORT_CHUNK_SIZE = 1000
+EXPORT_FIELDS = ("id", "created_at", "user_id", "username", "total_price", "items")
+
+
+def export_query(ids: List[int] | None = None, since: datetime | None = None):
+    items = (
+        select(
+            func.string_agg(
+                ItemModel.name + " x" + cast(OrderItemModel.quantity, String), "; "
+            )
+        )
+        .join(ItemModel, OrderItemModel.item_id == ItemModel.id)
+        .where(
+            OrderItemModel.order_id == OrderModel.id,
+            OrderItemModel.created_at == OrderModel.created_at,
+        )
+        .scalar_subquery()
+    )
+    query = select(
+        OrderModel.id,
+        OrderModel.created_at,
+        OrderModel.user_id,
+        OrderModel.username,
+        OrderModel.total_price,
+        items.label("items"),
+    ).order_by(OrderModel.created_at.desc(), OrderModel.id.desc())
+    if ids:
+        query = query.where(OrderModel.id.in_(ids))
+    if since is not None:
+        query = query.where(OrderModel.created_at >= since)
+    return query
+
+
+async def export_orders(
+    session_maker: async_sessionmaker,
+    ids: List[int] | None = None,
+    since: datetime | None = None,
+) -> AsyncIterator[str]:
+    """
+    Streams orders with their items as CSV, newest first. Owns its session,
+    so it can outlive the request handler that returns it.
+    """
+    async with session_maker() as session:
+        result = await session.stream(
+            export_query(ids, since).execution_options(yield_per=EXPORT_CHUNK_SIZE)
+        )
+        yield ",".join(EXPORT_FIELDS) + "\n"
+        async for rows in result.partitions():
+            buffer = io.StringIO()
+            csv.writer(buffer).writerows(rows)
+            yield buffer.getvalue()
@@ -0,0 +1,57 @@
+"""
+Profiling of the backend.
+
+The sampler and the event loop lag monitor are shared with the bot
+(`common.profiling`); this module adds the middleware counting requests for
+profiles that stop after a number of requests. The admin page that runs
+profiles is `ProfilerView` in `web.core.main`.
+"""
+
+import logging
+
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from common import profiling
+from common.profiling import (
+    FORMAT_COLLAPSED,
+    FORMAT_SPEEDSCOPE,
+    Profile,
+    ProfilerBusy,
+    SamplingProfiler,
+    render_profile,
+)
+
+logger = logging.getLogger("reseller")
+
+__all__ = [
+    "FORMAT_COLLAPSED",
+    "FORMAT_SPEEDSCOPE",
+    "LoopLagMonitor",
+    "Profile",
+    "ProfilerBusy",
+    "RequestCounter",
+    "SamplingProfiler",
+    "render_profile",
+]
+
+
+class LoopLagMonitor(profiling.LoopLagMonitor):
+    """Loop lag monitor logging to the backend log."""
+
+    def __init__(self, threshold: float):
+        super().__init__(threshold, logger)
+
+
+class RequestCounter:
+    """ASGI middleware feeding finished HTTP requests to the profiler."""
+
+    def __init__(self, app: ASGIApp, profiler: SamplingProfiler):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            if scope["type"] == "http":
+                self.profiler.record_request()
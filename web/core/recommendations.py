@@ -0,0 +1,160 @@
+"""
+"Frequently bought together" recommendations from the order history.
+
+`CoOccurrence` keeps an item x item matrix counting the orders that contain
+both items, as a SciPy sparse (CSR) matrix. New orders are folded in as the
+product of their basket matrix with itself (B.T @ B), so the history is read
+once and later runs only read the orders placed since. The top-K lists are
+recomputed only for items whose row changed, with one sort over all nonzeros
+of those rows instead of a loop per item.
+
+Lists are versioned by the last order folded in: the bot asks for the lists
+changed since the version it has (`GET /items/recommendations`) and keeps
+them in Redis. The lists at a version depend only on the orders, so every
+backend process (or a restarted one) answers alike, at worst resending lists
+it folded in a later batch. `generation` names the build settings, the bot
+gets all lists again when they change.
+"""
+
+import threading
+from datetime import datetime, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from web.db.models import OrderItemModel
+
+try:
+    import numpy as np
+    from scipy import sparse
+except ImportError:  # optional, recommendations are disabled without them
+    np = sparse = None
+
+
+def available() -> bool:
+    return sparse is not None
+
+
+class CoOccurrence:
+    """Co-occurrence counts of items and the top-K co-bought items of each."""
+
+    def __init__(self, top_k: int = 10):
+        self.top_k = top_k
+        self.matrix = sparse.csr_matrix((0, 0), dtype=np.int32)
+        self.generation = f"top{top_k}"
+        self.version = 0
+        # Whether the order history was read, before that there are no lists
+        self.built = False
+        self.top: Dict[int, List[int]] = {}
+        # Version at which the list of an item last changed
+        self._changed: Dict[int, int] = {}
+        self._lock = threading.Lock()
+
+    def add_orders(self, order_ids: "np.ndarray", item_ids: "np.ndarray"):
+        """
+        Adds order lines (order id and item id pairs) of orders not seen
+        before, returns the ids of items whose counts changed.
+        """
+        if not len(order_ids):
+            return np.empty(0, dtype=np.int64)
+        _, baskets = np.unique(order_ids, return_inverse=True)
+        size = max(self.matrix.shape[0], int(item_ids.max()) + 1)
+        lines = sparse.csr_matrix(
+            (np.ones(len(item_ids), dtype=np.int32), (baskets, item_ids)),
+            shape=(int(baskets.max()) + 1, size),
+        )
+        # An item on several lines of one order is bought together once
+        lines.data[:] = 1
+        delta = (lines.T @ lines).tocsr()
+        delta.setdiag(0)
+        delta.eliminate_zeros()
+        if size > self.matrix.shape[0]:
+            self.matrix.resize((size, size))
+        self.matrix = self.matrix + delta
+        return np.flatnonzero(np.diff(delta.indptr))
+
+    def top_neighbours(self, item_ids: "np.ndarray") -> Dict[int, List[int]]:
+        """
+        The `top_k` items bought most often together with each of `item_ids`,
+        most often first (ties by item id).
+        """
+        rows = self.matrix[item_ids]
+        row_of = np.repeat(np.arange(len(item_ids)), np.diff(rows.indptr))
+        # Sorted by row first, so each row keeps its place in `indices`
+        order = np.lexsort((rows.indices, -rows.data, row_of))
+        position = np.arange(len(order)) - rows.indptr[row_of[order]]
+        kept = order[position < self.top_k]
+        neighbours = rows.indices[kept]
+        bounds = np.searchsorted(row_of[kept], np.arange(len(item_ids) + 1))
+        return {
+            int(item_id): neighbours[start:end].tolist()
+            for item_id, start, end in zip(item_ids, bounds[:-1], bounds[1:])
+        }
+
+    def update(self, order_ids: "np.ndarray", item_ids: "np.ndarray") -> int:
+        """Adds new order lines and refreshes the lists they change, returns how many."""
+        top = self.top_neighbours(self.add_orders(order_ids, item_ids))
+        changed = {
+            item_id: neighbours
+            for item_id, neighbours in top.items()
+            if self.top.get(item_id) != neighbours
+        }
+        with self._lock:
+            if len(order_ids):
+                self.version = max(self.version, int(order_ids.max()))
+            self.top.update(changed)
+            self._changed.update(dict.fromkeys(changed, self.version))
+            self.built = True
+        return len(changed)
+
+    def changes(self, generation: str | None, since: int) -> Dict:
+        """Lists changed after version `since`, all of them for another generation."""
+        full = generation != self.generation
+        with self._lock:
+            items = {
+                item_id: neighbours
+                for item_id, neighbours in self.top.items()
+                if full or self._changed[item_id] > since
+            }
+            return {
+                "generation": self.generation,
+                "version": self.version,
+                "full": full,
+                "items": items,
+            }
+
+
+class OrderHistory:
+    """
+    Reads the order lines not folded into the matrix yet. Lines of orders
+    newer than `grace` seconds are left for the next run, so orders still
+    being committed (with lower ids than ones already read) are not skipped.
+    """
+
+    def __init__(self, grace: float = 60):
+        self.grace = timedelta(seconds=grace)
+        self.last_order_id = 0
+        self._read_until: datetime | None = None
+
+    async def read_new_lines(
+        self, engine: AsyncEngine
+    ) -> Tuple["np.ndarray", "np.ndarray"]:
+        until = datetime.utcnow() - self.grace
+        query = select(OrderItemModel.order_id, OrderItemModel.item_id).where(
+            OrderItemModel.order_id > self.last_order_id,
+            OrderItemModel.created_at < until,
+        )
+        if self._read_until is not None:
+            # Lets the planner skip the partitions read before
+            query = query.where(
+                OrderItemModel.created_at >= self._read_until - self.grace
+            )
+        async with engine.connect() as conn:
+            result = await conn.execute(query)
+            lines = np.array([tuple(row) for row in result], dtype=np.int64)
+        lines = lines.reshape(-1, 2)
+        if len(lines):
+            self.last_order_id = int(lines[:, 0].max())
+        self._read_until = until
+        return lines[:, 0], lines[:, 1]
@@ -0,0 +1,103 @@
+"""
+Item view and add-to-cart counters collected by the bot, and the popularity
+ranking of the catalog computed from them.
+
+The bot counts events in memory and in Redis and sends them here in batches,
+each applied at most once (like sales, see `web.core.stock`). The ranking is
+not computed per request: `refresh_popularity` stores a score on every item
+on a schedule, and both the admin list and `/items/popular` read it through
+the `(popularity, id)` index.
+"""
+
+from datetime import datetime
+from typing import Dict, List
+
+from sqlalchemy import func, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from web.db.models import ItemModel, ItemStatsModel, StatsBatchModel
+
+
+def popularity_score(add_weight: int):
+    """Distinct viewers, plus `add_weight` for every add to a cart."""
+    return ItemStatsModel.unique_viewers + add_weight * ItemStatsModel.adds
+
+
+async def apply_rollup(
+    session: AsyncSession,
+    batch_id: str,
+    views: Dict[int, int],
+    adds: Dict[int, int],
+    viewers: Dict[int, int],
+) -> bool:
+    """
+    Adds a batch of counters to the item stats, False if the batch was
+    applied before. `viewers` are estimates of all time, not increments.
+    The caller commits the session.
+    """
+    result = await session.execute(
+        pg_insert(StatsBatchModel)
+        .values(id=batch_id)
+        .on_conflict_do_nothing()
+        .returning(StatsBatchModel.id)
+    )
+    if result.scalar() is None:
+        return False
+    item_ids = sorted(views.keys() | adds.keys())
+    if item_ids:
+        now = datetime.utcnow()
+        stmt = pg_insert(ItemStatsModel).values(
+            [
+                {
+                    "item_id": item_id,
+                    "views": views.get(item_id, 0),
+                    "adds": adds.get(item_id, 0),
+                    "unique_viewers": viewers.get(item_id, 0),
+                    "updated_at": now,
+                }
+                for item_id in item_ids
+            ]
+        )
+        stats = ItemStatsModel.__table__.c
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=[ItemStatsModel.item_id],
+                set_={
+                    "views": stats.views + stmt.excluded.views,
+                    "adds": stats.adds + stmt.excluded.adds,
+                    # Batches may arrive out of order, estimates only grow
+                    "unique_viewers": func.greatest(
+                        stats.unique_viewers, stmt.excluded.unique_viewers
+                    ),
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            )
+        )
+    return True
+
+
+async def refresh_popularity(session: AsyncSession, add_weight: int) -> int:
+    """
+    Stores the current popularity score on the items whose score changed,
+    returns how many. The caller commits the session.
+    """
+    score = popularity_score(add_weight)
+    result = await session.execute(
+        update(ItemModel)
+        .where(ItemModel.id == ItemStatsModel.item_id, ItemModel.popularity != score)
+        .values(popularity=score)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+
+async def ranking(session: AsyncSession, limit: int) -> List[int]:
+    """Ids of the `limit` most popular items, most popular first."""
+    result = await session.execute(
+        select(ItemModel.id)
+        .where(ItemModel.popularity > 0)
+        .order_by(ItemModel.popularity.desc(), ItemModel.id.desc())
+        .limit(limit)
+    )
+    return list(result.scalars())
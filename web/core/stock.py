@@ -0,0 +1,43 @@
+"""
+Write-back of item sales made by the bot.
+
+The bot reserves and sells limited items in Redis and sends the units sold
+here in batches, so checkouts never lock item rows. Each batch has an id and
+is applied at most once, the bot resends a batch until it is acknowledged.
+"""
+
+from typing import Dict
+
+from sqlalchemy import bindparam, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from web.db.models import ItemModel, StockBatchModel
+
+
+async def apply_sales(
+    session: AsyncSession, batch_id: str, sold: Dict[int, int]
+) -> bool:
+    """
+    Subtracts the units sold from the stock of limited items, False if the
+    batch was applied before. The caller commits the session.
+    """
+    result = await session.execute(
+        pg_insert(StockBatchModel)
+        .values(id=batch_id)
+        .on_conflict_do_nothing()
+        .returning(StockBatchModel.id)
+    )
+    if result.scalar() is None:
+        return False
+    if sold:
+        # One statement executed for every item, in a single round trip
+        item = ItemModel.__table__
+        conn = await session.connection()
+        await conn.execute(
+            update(item)
+            .where(item.c.id == bindparam("item_id"), item.c.stock.is_not(None))
+            .values(stock=item.c.stock - bindparam("qty")),
+            [{"item_id": item_id, "qty": qty} for item_id, qty in sold.items()],
+        )
+    return True
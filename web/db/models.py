@@ -1,12 +1,17 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from sqlalchemy import (
+    BigInteger,
     Column,
     Integer,
     String,
     Float,
     ForeignKey,
+    ForeignKeyConstraint,
+    Index,
+    PrimaryKeyConstraint,
     DateTime,
+    JSON,
     select,
     func,
 )
@@ -18,9 +23,23 @@ Base = declarative_base()
 
 
 class OrderModel(Base):
+    """
+    Orders, range partitioned by `created_at` into monthly partitions (see
+    `web.db.partitions`). The partition key has to be part of the primary
+    key; the mapper still identifies orders by `id` alone.
+    """
+
     __tablename__ = "order"
-    created_at = Column(DateTime, default=datetime.utcnow)
-    id = Column(Integer, primary_key=True, index=True)
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at"),
+        # Newest-first listing and keyset paging of the admin order list
+        Index("ix_order_created_at_id", "created_at", "id"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
+
+    created_at = Column(DateTime, nullable=False, default=datetime.utcnow)
+    id = Column(Integer, autoincrement=True)
     user_id = Column(Integer, nullable=False)
     username = Column(String(255), nullable=True)
     total_price = Column(Float, nullable=False)
@@ -28,7 +47,7 @@ class OrderModel(Base):
         "OrderItemModel",
         back_populates="order",
         cascade="all, delete-orphan",
-        lazy="joined",
+        lazy="selectin",
     )
 
     @hybrid_property
@@ -50,19 +69,133 @@ class OrderModel(Base):
 
 class ItemModel(Base):
     __tablename__ = "item"
+    __table_args__ = (
+        # Most popular first listing and keyset paging of the admin item list
+        Index("ix_item_popularity_id", "popularity", "id"),
+    )
     id = Column(Integer, primary_key=True, index=True, autoincrement=True)
     name = Column(String(100), nullable=False)
     description = Column(String(255), nullable=True)
     price = Column(Float, nullable=False)
+    # Units on hand, None for items that are not limited. Reservations are
+    # made by the bot in Redis, sales are subtracted in batches (`StockBatchModel`)
+    stock = Column(Integer, nullable=True)
+    # Popularity score, recomputed on schedule from `ItemStatsModel`
+    popularity = Column(Integer, nullable=False, default=0, server_default="0")
     order_items = relationship("OrderItemModel", back_populates="item")
 
 
 class OrderItemModel(Base):
+    """Order lines, partitioned like (and together with) their orders."""
+
     __tablename__ = "order_item"
-    id = Column(Integer, primary_key=True, index=True)
-    order_id = Column(
-        Integer, ForeignKey("order.id", ondelete="CASCADE"), nullable=False
+    __table_args__ = (
+        PrimaryKeyConstraint("id", "created_at"),
+        ForeignKeyConstraint(
+            ["order_id", "created_at"],
+            ["order.id", "order.created_at"],
+            ondelete="CASCADE",
+        ),
+        {"postgresql_partition_by": "RANGE (created_at)"},
     )
+    __mapper_args__ = {"primary_key": ["id"]}
+
+    id = Column(Integer, autoincrement=True)
+    order_id = Column(Integer, nullable=False, index=True)
+    # Copied from the order by the relationship, it is the partition key
+    created_at = Column(DateTime, nullable=False)
     item_id = Column(Integer, ForeignKey("item.id"), nullable=False)
+    quantity = Column(Integer, nullable=False, default=1)
     order = relationship("OrderModel", back_populates="order_items")
     item = relationship("ItemModel")
+
+
+class StockBatchModel(Base):
+    """Sales batches applied to item stock, so a retried batch is applied once."""
+
+    __tablename__ = "stock_batch"
+    id = Column(String(64), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ItemStatsModel(Base):
+    """
+    View and add-to-cart counters of items, rolled up from the bot in
+    batches (`StatsBatchModel`). Kept apart from `item` so roll-ups never
+    lock catalog rows; rows of deleted items are left behind harmlessly.
+    """
+
+    __tablename__ = "item_stats"
+    item_id = Column(Integer, primary_key=True)
+    views = Column(BigInteger, nullable=False, default=0)
+    adds = Column(BigInteger, nullable=False, default=0)
+    # HyperLogLog estimate of distinct users who viewed the item
+    unique_viewers = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+class StatsBatchModel(Base):
+    """Item stats batches applied, so a retried batch is counted once."""
+
+    __tablename__ = "stats_batch"
+    id = Column(String(64), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
+
+
+class ItemChangeModel(Base):
+    """
+    Append-only log of catalog changes.
+
+    `seq` is the catalog sequence number: it grows by one with every change
+    and lets consumers detect missed events and fetch only what they missed.
+    """
+
+    __tablename__ = "item_change"
+    seq = Column(Integer, primary_key=True, autoincrement=True)
+    item_id = Column(Integer, nullable=True, index=True)
+    op = Column(String(16), nullable=False)
+    payload = Column(JSON, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class BroadcastModel(Base):
+    """
+    Broadcast campaigns created in the admin panel. The bot sends them to
+    its users and reports the counters below as it goes.
+    """
+
+    __tablename__ = "broadcast"
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    # Telegram's limit for the text of a message
+    text = Column(String(4096), nullable=False)
+    status = Column(String(16), nullable=False, default="pending", index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    updated_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Users registered when the campaign started
+    total = Column(Integer, nullable=False, default=0)
+    sent = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # Users who blocked the bot, removed from the bot's registry
+    blocked = Column(Integer, nullable=False, default=0)
+
+    @property
+    def processed(self) -> int:
+        return (self.sent or 0) + (self.failed or 0) + (self.blocked or 0)
+
+    @property
+    def rate(self) -> float | None:
+        """Messages per second since the campaign started."""
+        if self.started_at is None or self.updated_at is None:
+            return None
+        seconds = (self.updated_at - self.started_at).total_seconds()
+        return round(self.processed / seconds, 1) if seconds > 0 else None
+
+    @property
+    def eta(self) -> timedelta | None:
+        """Time left at the current rate, while the campaign is running."""
+        if self.status != "running" or not self.rate:
+            return None
+        left = max((self.total or 0) - self.processed, 0)
+        return timedelta(seconds=round(left / self.rate))
@@ -0,0 +1,287 @@
+"""
+Monthly partitions of the `order` and `order_item` tables.
+
+Partitions are created ahead of time by `ensure_partitions`. The retention
+job (`archive_partitions`) detaches partitions older than the retention
+window, writes their orders with the order lines to a gzipped JSON Lines
+file per month and drops them. `restore_archive` loads such a file back
+into its month partition.
+
+Partition and archive names carry the month: `order_y2025m01`,
+`order_item_y2025m01`, `orders_2025_01.jsonl.gz`.
+"""
+
+import asyncio
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import date, datetime
+from typing import Dict, List
+
+from sqlalchemy import insert, text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from web.db.models import Base, OrderItemModel, OrderModel
+
+logger = logging.getLogger("reseller")
+
+ORDER_TABLE = OrderModel.__tablename__
+ORDER_ITEM_TABLE = OrderItemModel.__tablename__
+ARCHIVE_BATCH_SIZE = 1000
+RESTORE_BATCH_SIZE = 1000
+
+_PARTITION_RE = re.compile(r"_y(\d{4})m(\d{2})$")
+_ARCHIVE_RE = re.compile(r"orders_(\d{4})_(\d{2})\.jsonl\.gz$")
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_y{month.year}m{month.month:02}"
+
+
+def archive_name(month: date) -> str:
+    return f"orders_{month.year}_{month.month:02}.jsonl.gz"
+
+
+def archive_month(path: str) -> date:
+    match = _ARCHIVE_RE.search(path)
+    if match is None:
+        raise ValueError(f"Not an order archive: {path}")
+    return date(int(match.group(1)), int(match.group(2)), 1)
+
+
+async def is_partitioned(conn: AsyncConnection) -> bool:
+    result = await conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": f'"{ORDER_TABLE}"'},
+    )
+    return result.scalar() == "p"
+
+
+async def create_partition(conn: AsyncConnection, month: date):
+    """Creates the month partitions of both tables if they don't exist."""
+    for table in (ORDER_TABLE, ORDER_ITEM_TABLE):
+        await conn.execute(
+            text(
+                f'CREATE TABLE IF NOT EXISTS "{partition_name(table, month)}" '
+                f'PARTITION OF "{table}" '
+                f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"
+            )
+        )
+
+
+async def ensure_partitions(
+    conn: AsyncConnection, ahead: int, today: date | None = None
+):
+    """Partitions for the current month and `ahead` months after it."""
+    current = month_start(today or datetime.utcnow().date())
+    for offset in range(ahead + 1):
+        await create_partition(conn, add_months(current, offset))
+
+
+async def list_partition_months(conn: AsyncConnection) -> List[date]:
+    """Months with an attached order partition, oldest first."""
+    result = await conn.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = to_regclass(:table)"
+        ),
+        {"table": f'"{ORDER_TABLE}"'},
+    )
+    months = []
+    for (name,) in result:
+        match = _PARTITION_RE.search(name)
+        if match:
+            months.append(date(int(match.group(1)), int(match.group(2)), 1))
+    return sorted(months)
+
+
+async def _write_archive(
+    conn: AsyncConnection, path: str, order_table: str, item_table: str, where: str = ""
+) -> int:
+    # One line per order, with its order lines nested
+    result = await conn.stream(
+        text(
+            "SELECT row_to_json(o)::jsonb || jsonb_build_object('items', "
+            "COALESCE((SELECT jsonb_agg(row_to_json(oi)) "
+            f"FROM \"{item_table}\" oi WHERE oi.order_id = o.id), '[]'::jsonb)) "
+            f'FROM "{order_table}" o {where} ORDER BY o.id'
+        )
+    )
+    count = 0
+    tmp_path = f"{path}.tmp"
+    archive = await asyncio.to_thread(gzip.open, tmp_path, "wt", encoding="utf-8")
+    try:
+        async for rows in result.partitions(ARCHIVE_BATCH_SIZE):
+            lines = "".join(
+                json.dumps(row[0], ensure_ascii=False) + "\n" for row in rows
+            )
+            await asyncio.to_thread(archive.write, lines)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(archive.close)
+    os.replace(tmp_path, path)
+    return count
+
+
+async def archive_partitions(
+    engine: AsyncEngine, keep_months: int, archive_dir: str, today: date | None = None
+) -> List[str]:
+    """
+    Detaches the partitions older than `keep_months` months, archives them
+    and drops them. The archive is fully written before anything is dropped.
+    """
+    cutoff = add_months(month_start(today or datetime.utcnow().date()), -keep_months)
+    os.makedirs(archive_dir, exist_ok=True)
+    async with engine.connect() as conn:
+        months = [
+            month for month in await list_partition_months(conn) if month < cutoff
+        ]
+
+    archived = []
+    for month in months:
+        async with engine.begin() as conn:
+            # Order lines first: they reference the order partition
+            for table in (ORDER_ITEM_TABLE, ORDER_TABLE):
+                await conn.execute(
+                    text(
+                        f'ALTER TABLE "{table}" DETACH PARTITION '
+                        f'"{partition_name(table, month)}"'
+                    )
+                )
+        path = os.path.join(archive_dir, archive_name(month))
+        async with engine.connect() as conn:
+            count = await _write_archive(
+                conn,
+                path,
+                partition_name(ORDER_TABLE, month),
+                partition_name(ORDER_ITEM_TABLE, month),
+            )
+        async with engine.begin() as conn:
+            for table in (ORDER_ITEM_TABLE, ORDER_TABLE):
+                await conn.execute(text(f'DROP TABLE "{partition_name(table, month)}"'))
+        logger.info(f"Archived {count} orders of {month:%Y-%m} to {path}")
+        archived.append(path)
+    return archived
+
+
+def _parse_row(row: Dict, columns, created_at: str | None = None) -> Dict:
+    # Columns missing in older archives get their defaults
+    values = {column.name: row[column.name] for column in columns if column.name in row}
+    # Order lines archived before partitioning have no created_at of their own
+    values["created_at"] = datetime.fromisoformat(
+        values.get("created_at") or created_at
+    )
+    return values
+
+
+async def restore_archive(engine: AsyncEngine, path: str) -> int:
+    """
+    Loads an archived month back into its partition (created if needed).
+    The retention job archives it again on its next run if it is still
+    outside the retention window.
+    """
+    async with engine.begin() as conn:
+        return await _load_archive(conn, path)
+
+
+async def _load_archive(conn: AsyncConnection, path: str) -> int:
+    month = archive_month(path)
+    archive = await asyncio.to_thread(gzip.open, path, "rt", encoding="utf-8")
+    count = 0
+    try:
+        await create_partition(conn, month)
+        while True:
+            lines = await asyncio.to_thread(archive.readlines, 1 << 20)
+            if not lines:
+                break
+            rows = [json.loads(line) for line in lines]
+            for start in range(0, len(rows), RESTORE_BATCH_SIZE):
+                batch = rows[start : start + RESTORE_BATCH_SIZE]
+                orders = [_parse_row(row, OrderModel.__table__.c) for row in batch]
+                order_items = [
+                    _parse_row(item, OrderItemModel.__table__.c, row["created_at"])
+                    for row in batch
+                    for item in row["items"]
+                ]
+                await conn.execute(insert(OrderModel.__table__), orders)
+                if order_items:
+                    await conn.execute(insert(OrderItemModel.__table__), order_items)
+            count += len(rows)
+    finally:
+        await asyncio.to_thread(archive.close)
+    logger.info(f"Restored {count} orders of {month:%Y-%m} from {path}")
+    return count
+
+
+async def migrate_to_partitions(engine: AsyncEngine, archive_dir: str) -> List[str]:
+    """
+    One-off conversion of plain (pre-partitioning) order tables: every month
+    is archived, the tables are recreated partitioned and the archives are
+    loaded back. The archives are kept as a backup.
+
+    Runs in one transaction holding the order tables locked against writes,
+    so no order placed meanwhile is dropped with the old tables and a failed
+    run changes nothing. Meant to run with the backend stopped: its orders
+    would wait for the lock until the migration ends.
+    """
+    async with engine.begin() as conn:
+        if await is_partitioned(conn):
+            return []
+        await conn.execute(
+            text(f'LOCK TABLE "{ORDER_TABLE}", "{ORDER_ITEM_TABLE}" IN EXCLUSIVE MODE')
+        )
+        await conn.execute(
+            text(
+                f'UPDATE "{ORDER_TABLE}" SET created_at = now() WHERE created_at IS NULL'
+            )
+        )
+        result = await conn.execute(
+            text(
+                f"SELECT DISTINCT date_trunc('month', created_at)::date FROM \"{ORDER_TABLE}\""
+            )
+        )
+        months = sorted(row[0] for row in result)
+
+        os.makedirs(archive_dir, exist_ok=True)
+        paths = []
+        for month in months:
+            path = os.path.join(archive_dir, archive_name(month))
+            await _write_archive(
+                conn,
+                path,
+                ORDER_TABLE,
+                ORDER_ITEM_TABLE,
+                where=(
+                    f"WHERE o.created_at >= '{month}' "
+                    f"AND o.created_at < '{add_months(month, 1)}'"
+                ),
+            )
+            paths.append(path)
+
+        tables = [OrderItemModel.__table__, OrderModel.__table__]
+        await conn.run_sync(Base.metadata.drop_all, tables=tables)
+        await conn.run_sync(Base.metadata.create_all, tables=tables)
+        for path in paths:
+            await _load_archive(conn, path)
+        # Restored rows keep their ids, move the new id sequences past them
+        for table in (ORDER_TABLE, ORDER_ITEM_TABLE):
+            await conn.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{table}\"', 'id'), "
+                    f'COALESCE((SELECT max(id) FROM "{table}"), 0) + 1, false)'
+                )
+            )
+    logger.info(f"Migrated {len(paths)} months of orders to partitioned tables")
+    return paths
@@ -0,0 +1,165 @@
+"""
+Routing of read-only queries to Postgres read replicas.
+
+`ReplicaPool` measures the replay lag of every replica and hands out the
+replicas within `max_lag` round-robin, the primary when none is. A client
+that wrote something is pinned to the primary for a few seconds with a
+cookie, so it reads its own writes even from a lagging setup.
+
+API endpoints take a session bound to `ReplicaPool.read_engine()`. The admin
+sessions are `RoutingSession`s, `AdminReadRouting` binds them to a replica
+for the list, details and export pages.
+"""
+
+import asyncio
+import itertools
+import logging
+import math
+import re
+import time
+from contextvars import ContextVar
+from typing import Dict, List
+
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlalchemy.orm import Session
+from starlette.datastructures import MutableHeaders
+from starlette.requests import HTTPConnection
+from starlette.responses import Response
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger("reseller")
+
+PIN_COOKIE = "db_primary_until"
+
+# Seconds since the last replayed transaction, 0 when the replica has
+# replayed everything it received, NULL on a server that is not a replica
+LAG_QUERY = text(
+    "SELECT CASE WHEN NOT pg_is_in_recovery() THEN NULL "
+    "WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+_read_engine: ContextVar[AsyncEngine | None] = ContextVar("read_engine", default=None)
+
+
+class ReplicaPool:
+    def __init__(
+        self, primary: AsyncEngine, replicas: List[AsyncEngine], max_lag: float
+    ):
+        self.primary = primary
+        self.replicas = replicas
+        self.max_lag = max_lag
+        # Replicas are unused until their first lag check
+        self.lag: Dict[AsyncEngine, float] = {replica: math.inf for replica in replicas}
+        self._turn = itertools.count()
+
+    def read_engine(self, pinned: bool = False) -> AsyncEngine:
+        """Next replica within the allowed lag, the primary if there is none."""
+        if pinned:
+            return self.primary
+        healthy = [r for r in self.replicas if self.lag[r] <= self.max_lag]
+        if not healthy:
+            return self.primary
+        return healthy[next(self._turn) % len(healthy)]
+
+    async def check(self):
+        """Measures the lag of every replica, logs the ones put in or out of use."""
+        for replica in self.replicas:
+            host = replica.url.host
+            try:
+                async with replica.connect() as conn:
+                    lag = (await conn.execute(LAG_QUERY)).scalar()
+                reason = "not a replica" if lag is None else f"lags {lag:.1f}s"
+                lag = math.inf if lag is None else float(lag)
+            except (SQLAlchemyError, OSError) as e:
+                reason = f"unavailable: {e}"
+                lag = math.inf
+            was_used = self.lag[replica] <= self.max_lag
+            self.lag[replica] = lag
+            if lag <= self.max_lag and not was_used:
+                logger.info(f"Reading from replica {host}")
+            elif lag > self.max_lag and was_used:
+                logger.warning(f"Replica {host} {reason}, reading from the primary")
+
+    async def monitor(self, interval: float):
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.dispose()
+
+
+class RoutingSession(Session):
+    """Session bound to the replica chosen for the current request, if any."""
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        engine = _read_engine.get()
+        if engine is not None and not self._flushing:
+            return engine.sync_engine
+        return super().get_bind(mapper, clause, **kw)
+
+
+def is_pinned(conn: HTTPConnection) -> bool:
+    """Whether the client wrote recently and has to read from the primary."""
+    try:
+        return float(conn.cookies.get(PIN_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def pin_cookie(seconds: float) -> str:
+    response = Response()
+    response.set_cookie(
+        PIN_COOKIE,
+        f"{time.time() + seconds:.3f}",
+        max_age=math.ceil(seconds),
+        httponly=True,
+        samesite="lax",
+    )
+    return response.headers["set-cookie"]
+
+
+def pin(response: Response, seconds: float):
+    """Pins the client to the primary after a write."""
+    response.headers.append("set-cookie", pin_cookie(seconds))
+
+
+class AdminReadRouting:
+    """
+    ASGI middleware of the admin app. List, details and export pages read
+    from a replica; any other request method is a write and pins the
+    browser to the primary.
+    """
+
+    READ_PATH = re.compile(r"/[^/]+/(list|details/.+|export/[^/]+)$")
+
+    def __init__(self, app: ASGIApp, pool: ReplicaPool, pin_seconds: float):
+        self.app = app
+        self.pool = pool
+        self.pin_seconds = pin_seconds
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if scope["method"] in ("GET", "HEAD"):
+            if not self.READ_PATH.search(scope["path"]):
+                return await self.app(scope, receive, send)
+            pinned = is_pinned(HTTPConnection(scope))
+            token = _read_engine.set(self.pool.read_engine(pinned))
+            try:
+                return await self.app(scope, receive, send)
+            finally:
+                _read_engine.reset(token)
+
+        async def send_pinned(message: Message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                headers = MutableHeaders(scope=message)
+                headers.append("set-cookie", pin_cookie(self.pin_seconds))
+            await send(message)
+
+        await self.app(scope, receive, send_pinned)
@@ -1,5 +1,5 @@
-from typing import List
-from pydantic import BaseModel
+from typing import Dict, List
+from pydantic import BaseModel, Field
 
 
 class ItemSchema(BaseModel):
@@ -7,15 +7,44 @@ class ItemSchema(BaseModel):
     name: str
     description: str | None = None
     price: float
+    stock: int | None = None
 
     class Config:
         from_attributes = True
 
 
+class StockSalesSchema(BaseModel):
+    """A batch of units sold by the bot, per item id."""
+
+    batch: str = Field(min_length=1, max_length=64)
+    sold: Dict[int, int]
+
+
+class ItemStatsSchema(BaseModel):
+    """A batch of item counters from the bot, per item id."""
+
+    batch: str = Field(min_length=1, max_length=64)
+    views: Dict[int, int] = {}
+    adds: Dict[int, int] = {}
+    # Distinct viewers of all time, not increments
+    viewers: Dict[int, int] = {}
+
+
+class BroadcastProgressSchema(BaseModel):
+    """Counters of a broadcast campaign reported by the bot."""
+
+    total: int = Field(ge=0)
+    sent: int = Field(ge=0)
+    failed: int = Field(ge=0)
+    blocked: int = Field(ge=0)
+    done: bool = False
+
+
 class OrderItemSchema(BaseModel):
     id: int | None = None
     order_id: int
     item_id: int
+    quantity: int = 1
 
     class Config:
         from_attributes = True
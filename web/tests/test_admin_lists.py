@@ -0,0 +1,67 @@
+from datetime import datetime
+
+from sqladmin import ModelView
+from starlette.datastructures import URL
+
+from web.core.admin_lists import (
+    KeysetPagination,
+    ScalableListMixin,
+    decode_cursor,
+    encode_cursor,
+)
+from web.db.models import ItemModel, OrderModel
+
+CREATED_AT = OrderModel.__table__.c.created_at
+
+
+class OrderView(ScalableListMixin, ModelView, model=OrderModel):
+    column_default_sort = [(OrderModel.created_at, True)]
+
+
+class FakeRequest:
+    def __init__(self, **params):
+        self.query_params = params
+
+
+def test_cursor_round_trip():
+    created_at = datetime(2025, 3, 17, 10, 30)
+    cursor = encode_cursor(3, CREATED_AT, True, created_at, 42)
+    assert decode_cursor(cursor, 3, CREATED_AT, True) == (created_at, 42)
+
+
+def test_stale_or_broken_cursor_is_ignored():
+    cursor = encode_cursor(3, CREATED_AT, True, datetime(2025, 3, 17), 42)
+    assert decode_cursor(cursor, 2, CREATED_AT, True) is None
+    assert decode_cursor("not-a-cursor", 3, CREATED_AT, True) is None
+    assert decode_cursor(None, 3, CREATED_AT, True) is None
+
+
+def test_cursor_of_another_sort_is_ignored():
+    popularity = ItemModel.__table__.c.popularity
+    cursor = encode_cursor(2, ItemModel.__table__.c.id, False, 40, 40)
+    assert decode_cursor(cursor, 2, popularity, False) is None
+    cursor = encode_cursor(2, popularity, False, 7, 40)
+    assert decode_cursor(cursor, 2, popularity, True) is None
+
+
+def test_keyset_only_on_non_null_columns():
+    view = OrderView()
+    assert view._sort_column(FakeRequest()) == (CREATED_AT, True)
+    assert view._sort_column(FakeRequest(sortBy="username")) == (None, False)
+    assert view._sort_column(FakeRequest(sortBy="item_names")) == (None, False)
+
+
+def test_neighbour_pages_link_with_cursors():
+    pagination = KeysetPagination(
+        rows=[ItemModel()] * 10,
+        page=5,
+        page_size=10,
+        count=1_000_000,
+        next_cursor="next",
+        previous_cursor="prev",
+    )
+    pagination.add_pagination_urls(URL("/admin/item-model/list?page=5&after=old"))
+    urls = {control.number: URL(control.url) for control in pagination.page_controls}
+    assert urls[6].query == "page=6&after=next"
+    assert urls[4].query == "page=4&before=prev"
+    assert urls[7].query == "page=7"
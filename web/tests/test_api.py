@@ -1,3 +1,6 @@
+import json
+import uuid
+
 from web.core.config import ADMIN_SECRET
 from fastapi.testclient import TestClient
 from web.core.main import app
@@ -19,6 +22,91 @@ def test_read_items():
     assert isinstance(response.json(), list)
 
 
+def test_read_items_returns_catalog_seq():
+    response = client.get("/items/")
+    check_status_code(response, 200)
+    assert int(response.headers["X-Catalog-Seq"]) >= 0
+
+
+def test_read_item_changes():
+    seq = client.get("/items/version").json()["seq"]
+    response = client.get("/items/changes", params={"since": 0})
+    check_status_code(response, 200)
+    data = response.json()
+    assert data["seq"] == seq
+    assert all(change["seq"] > 0 for change in data["changes"])
+    assert [change["seq"] for change in data["changes"]] == sorted(
+        change["seq"] for change in data["changes"]
+    )
+
+
+def test_import_items_csv():
+    seq = client.get("/items/version").json()["seq"]
+    body = 'id,name,description,price\n,"Баннер, A1",Печать,150\n,,Без имени,10\n'
+    response = client.post(
+        "/items/import", content=body.encode(), headers={"content-type": "text/csv"}
+    )
+    check_status_code(response, 200)
+    report = response.json()
+    assert report["imported"] == 1
+    assert report["failed"] == 1
+    assert report["seq"] == seq + 1
+
+
+def test_import_items_unsupported_format():
+    response = client.post(
+        "/items/import", content=b"<items/>", headers={"content-type": "text/xml"}
+    )
+    check_status_code(response, 415)
+
+
+def test_export_items():
+    response = client.get("/items/export", params={"format": "jsonl"})
+    check_status_code(response, 200)
+    lines = response.text.splitlines()
+    assert len(lines) == len(client.get("/items/").json())
+    assert {"id", "name", "description", "price"} <= json.loads(lines[0]).keys()
+
+
+def test_write_back_sales_once_per_batch():
+    batch = {"batch": f"test-{uuid.uuid4().hex}", "sold": {"1": 1}}
+    response = client.post("/items/stock", json=batch)
+    check_status_code(response, 200)
+    assert response.json() == {"applied": True}
+    assert client.post("/items/stock", json=batch).json() == {"applied": False}
+
+
+def test_roll_up_item_stats_once_per_batch():
+    batch = {
+        "batch": f"test-{uuid.uuid4().hex}",
+        "views": {"1": 3},
+        "adds": {"1": 1},
+        "viewers": {"1": 2},
+    }
+    response = client.post("/items/stats", json=batch)
+    check_status_code(response, 200)
+    assert response.json() == {"applied": True}
+    assert client.post("/items/stats", json=batch).json() == {"applied": False}
+
+
+def test_read_popular_items():
+    response = client.get("/items/popular", params={"limit": 10})
+    check_status_code(response, 200)
+    assert len(response.json()["ids"]) <= 10
+
+
+def test_read_active_broadcasts():
+    response = client.get("/broadcasts/active")
+    check_status_code(response, 200)
+    assert isinstance(response.json(), list)
+
+
+def test_report_progress_of_unknown_broadcast():
+    progress = {"total": 10, "sent": 5, "failed": 0, "blocked": 1}
+    response = client.post("/broadcasts/999999/progress", json=progress)
+    check_status_code(response, 404)
+
+
 def test_create_order():
     order_data = {"order_items": [{"id": 1}], "user_id": 123, "total_price": 100.0}
     response = client.post("/order/", json=order_data)
@@ -27,6 +115,17 @@ def test_create_order():
     assert isinstance(response.json()["order_id"], int)
 
 
+def test_create_order_with_quantity():
+    order_data = {
+        "order_items": [{"id": 1, "qty": 2}],
+        "user_id": 123,
+        "total_price": 200.0,
+    }
+    response = client.post("/order/", json=order_data)
+    check_status_code(response, 201)
+    assert isinstance(response.json()["order_id"], int)
+
+
 def test_read_orders():
     response = client.get("/orders/")
     check_status_code(response, 200)
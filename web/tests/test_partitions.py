@@ -0,0 +1,34 @@
+from datetime import date
+
+import pytest
+
+from web.db import partitions
+
+
+def test_add_months_crosses_years():
+    assert partitions.add_months(date(2024, 11, 1), 3) == date(2025, 2, 1)
+    assert partitions.add_months(date(2025, 1, 1), -1) == date(2024, 12, 1)
+    assert partitions.add_months(date(2025, 1, 1), -12) == date(2024, 1, 1)
+
+
+def test_partition_and_archive_names():
+    month = partitions.month_start(date(2025, 3, 17))
+    assert partitions.partition_name("order", month) == "order_y2025m03"
+    assert partitions.partition_name("order_item", month) == "order_item_y2025m03"
+    path = f"archive/{partitions.archive_name(month)}"
+    assert path == "archive/orders_2025_03.jsonl.gz"
+    assert partitions.archive_month(path) == month
+
+
+def test_archive_month_rejects_other_files():
+    with pytest.raises(ValueError):
+        partitions.archive_month("archive/items.csv")
+
+
+def test_parse_row_takes_created_at_from_order():
+    row = {"id": 7, "order_id": 3, "item_id": 1, "quantity": 2}
+    values = partitions._parse_row(
+        row, partitions.OrderItemModel.__table__.c, "2025-03-17T10:00:00"
+    )
+    assert values["order_id"] == 3
+    assert values["created_at"].month == 3
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import time
+
+from web.core.profiler import LoopLagMonitor, RequestCounter, SamplingProfiler
+
+
+def test_request_counter_stops_profile():
+    profiler = SamplingProfiler(interval=0.001, max_seconds=10)
+
+    async def app(scope, receive, send):
+        pass
+
+    counter = RequestCounter(app, profiler)
+
+    async def run():
+        task = asyncio.create_task(profiler.profile(requests=2))
+        await asyncio.sleep(0.05)
+        await counter({"type": "lifespan"}, None, None)
+        for _ in range(2):
+            await counter({"type": "http"}, None, None)
+        return await asyncio.wait_for(task, 1)
+
+    profile = asyncio.run(run())
+    assert profile.requests == 2
+    assert profile.duration < 1
+
+
+def test_loop_lag_monitor_logs_to_backend_log(caplog):
+    monitor = LoopLagMonitor(threshold=0.05)
+
+    async def run():
+        monitor.start()
+        await asyncio.sleep(0.05)
+        time.sleep(0.2)
+        await asyncio.sleep(0.05)
+        monitor.stop()
+
+    with caplog.at_level(logging.WARNING, logger="reseller"):
+        asyncio.run(run())
+    assert monitor.stalls == 1
+    assert "Event loop blocked" in caplog.text
@@ -0,0 +1,59 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+pytest.importorskip("scipy")
+
+from web.core.recommendations import CoOccurrence  # noqa: E402
+
+
+def lines(*orders):
+    """Order lines of baskets, order ids numbered from 1."""
+    order_ids = [order_id for order_id, basket in enumerate(orders, 1) for _ in basket]
+    item_ids = [item_id for basket in orders for item_id in basket]
+    return np.array(order_ids), np.array(item_ids)
+
+
+def test_top_neighbours_by_count_then_id():
+    co_occurrence = CoOccurrence(top_k=2)
+    co_occurrence.update(*lines([1, 2, 3], [1, 3], [1, 4, 4], [5]))
+    assert co_occurrence.top == {1: [3, 2], 2: [1, 3], 3: [1, 2], 4: [1]}
+
+
+def test_incremental_update_matches_full_build():
+    orders = [[1, 2], [2, 3, 4], [1, 4], [3, 4], [1, 2, 4]]
+    full = CoOccurrence(top_k=2)
+    full.update(*lines(*orders))
+    incremental = CoOccurrence(top_k=2)
+    incremental.update(*lines(*orders[:3]))
+    order_ids, item_ids = lines(*orders)
+    new = order_ids > 3
+    assert incremental.update(order_ids[new], item_ids[new]) > 0
+    assert (incremental.matrix != full.matrix).nnz == 0
+    assert incremental.top == full.top
+
+
+def test_changes_since_version():
+    co_occurrence = CoOccurrence(top_k=2)
+    co_occurrence.update(*lines([1, 2]))
+    generation = co_occurrence.generation
+    co_occurrence.update(np.array([9, 9]), np.array([3, 4]))
+    changes = co_occurrence.changes(generation, since=1)
+    assert changes["version"] == 9
+    assert not changes["full"]
+    assert changes["items"] == {3: [4], 4: [3]}
+    assert co_occurrence.changes("old", since=9)["items"].keys() == {1, 2, 3, 4}
+
+
+def test_versions_do_not_depend_on_the_process():
+    order_ids, item_ids = lines([1, 2], [2, 3], [1, 3], [3, 4])
+    batched = CoOccurrence(top_k=2)
+    batched.update(order_ids[:4], item_ids[:4])
+    batched.update(order_ids[4:], item_ids[4:])
+    single = CoOccurrence(top_k=2)
+    single.update(order_ids, item_ids)
+    assert (single.generation, single.version) == (batched.generation, 4)
+    assert single.top == batched.top
+    # Another process resends more lists, never fewer
+    generation = batched.generation
+    resent = single.changes(generation, since=2)["items"]
+    assert resent.keys() >= batched.changes(generation, since=2)["items"].keys()
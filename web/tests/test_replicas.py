@@ -0,0 +1,54 @@
+import math
+
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.responses import PlainTextResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from web.db import replicas
+
+PRIMARY, REPLICA_A, REPLICA_B = "primary", "replica_a", "replica_b"
+
+
+def make_pool(lag_a=0.0, lag_b=0.0) -> replicas.ReplicaPool:
+    pool = replicas.ReplicaPool(PRIMARY, [REPLICA_A, REPLICA_B], max_lag=5)
+    pool.lag.update({REPLICA_A: lag_a, REPLICA_B: lag_b})
+    return pool
+
+
+def test_reads_rotate_over_replicas_in_sync():
+    pool = make_pool()
+    assert [pool.read_engine() for _ in range(4)] == [REPLICA_A, REPLICA_B] * 2
+
+
+def test_lagging_replicas_fall_back_to_primary():
+    pool = make_pool(lag_a=30)
+    assert {pool.read_engine() for _ in range(4)} == {REPLICA_B}
+    pool.lag[REPLICA_B] = math.inf
+    assert pool.read_engine() == PRIMARY
+
+
+def test_pinned_client_reads_from_primary():
+    assert make_pool().read_engine(pinned=True) == PRIMARY
+
+
+def test_admin_writes_pin_later_reads_to_primary():
+    async def page(request):
+        return PlainTextResponse(str(replicas._read_engine.get()))
+
+    app = Starlette(
+        routes=[
+            Route("/item-model/list", page),
+            Route("/item-model/edit/1", page, methods=["GET", "POST"]),
+        ],
+        middleware=[
+            Middleware(replicas.AdminReadRouting, pool=make_pool(), pin_seconds=10)
+        ],
+    )
+    client = TestClient(app)
+    assert client.get("/item-model/list").text == REPLICA_A
+    assert client.get("/item-model/edit/1").text == "None"
+    client.post("/item-model/edit/1")
+    assert replicas.PIN_COOKIE in client.cookies
+    assert client.get("/item-model/list").text == PRIMARY
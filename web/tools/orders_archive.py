@@ -0,0 +1,52 @@
+"""
+Order partition maintenance from the command line.
+
+    python -m web.tools.orders_archive ensure          # create upcoming partitions
+    python -m web.tools.orders_archive archive         # archive and drop old months
+    python -m web.tools.orders_archive restore FILE... # load archived months back
+    python -m web.tools.orders_archive migrate         # partition existing tables
+
+The web app runs `ensure` and `archive` itself once a day. Stop the backend
+before `migrate`: the order tables are locked until it is done.
+"""
+
+import argparse
+import asyncio
+
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from web.core import config
+from web.db import partitions
+
+
+async def main(args: argparse.Namespace):
+    engine = create_async_engine(config.get_db_url())
+    try:
+        if args.command == "ensure":
+            async with engine.begin() as conn:
+                await partitions.ensure_partitions(conn, config.ORDER_PARTITIONS_AHEAD)
+        elif args.command == "archive":
+            paths = await partitions.archive_partitions(
+                engine, args.keep_months, args.archive_dir
+            )
+            print("\n".join(paths) or "Nothing to archive")
+        elif args.command == "restore":
+            for path in args.files:
+                count = await partitions.restore_archive(engine, path)
+                print(f"{path}: {count} orders restored")
+        elif args.command == "migrate":
+            paths = await partitions.migrate_to_partitions(engine, args.archive_dir)
+            print(f"Migrated {len(paths)} months" if paths else "Already partitioned")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("command", choices=["ensure", "archive", "restore", "migrate"])
+    parser.add_argument("files", nargs="*", help="archives to restore")
+    parser.add_argument(
+        "--keep-months", type=int, default=config.ORDER_RETENTION_MONTHS
+    )
+    parser.add_argument("--archive-dir", default=config.ORDER_ARCHIVE_DIR)
+    asyncio.run(main(parser.parse_args()))
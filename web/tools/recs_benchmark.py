@@ -0,0 +1,70 @@
+"""
+Benchmarks the co-occurrence recommendations on synthetic orders, without
+a database.
+
+Orders have 1 to --max-basket items, drawn with Zipf-like popularity so a
+few items are in many orders, as in a real catalog. Reports the time of
+the full build (matrix and top-K of every item) and of incremental updates.
+
+Usage:
+    python -m web.tools.recs_benchmark --orders 100000 --items 10000
+"""
+
+import argparse
+import time
+
+from web.core import recommendations
+from web.core.recommendations import CoOccurrence
+
+np = recommendations.np
+
+
+def synthetic_orders(rng, orders: int, items: int, max_basket: int, first: int = 0):
+    """(order ids, item ids) of order lines."""
+    sizes = rng.integers(1, max_basket + 1, orders)
+    order_ids = np.repeat(np.arange(first, first + orders), sizes)
+    popularity = 1 / np.arange(1, items + 1)
+    item_ids = rng.choice(items, len(order_ids), p=popularity / popularity.sum())
+    return order_ids, item_ids
+
+
+def main(args: argparse.Namespace):
+    rng = np.random.default_rng(args.seed)
+    order_ids, item_ids = synthetic_orders(
+        rng, args.orders, args.items, args.max_basket
+    )
+    co_occurrence = CoOccurrence(args.top_k)
+    started = time.perf_counter()
+    changed = co_occurrence.update(order_ids, item_ids)
+    print(
+        f"full build: {args.orders} orders, {len(order_ids)} lines, "
+        f"{args.items} items -> {co_occurrence.matrix.nnz} pairs, "
+        f"{changed} lists in {time.perf_counter() - started:.3f}s"
+    )
+    first = args.orders
+    for _ in range(args.rounds):
+        order_ids, item_ids = synthetic_orders(
+            rng, args.batch, args.items, args.max_basket, first
+        )
+        first += args.batch
+        started = time.perf_counter()
+        changed = co_occurrence.update(order_ids, item_ids)
+        print(
+            f"update: {args.batch} orders -> {changed} lists "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--orders", type=int, default=100_000)
+    parser.add_argument("--items", type=int, default=10_000)
+    parser.add_argument("--max-basket", type=int, default=5)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--batch", type=int, default=1000, help="orders per update")
+    parser.add_argument("--rounds", type=int, default=3, help="incremental updates")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if not recommendations.available():
+        parser.error("numpy and scipy are required")
+    main(args)